@@ -0,0 +1,39 @@
+"""中国象棋AI（不依赖Qt）"""
+from chess_rules import move_to_coords
+from chess_search import Searcher
+
+# 难度等级对应的搜索参数：最大深度、时间预算（秒）、根节点随机分，以及开局库是否按权重随机选择
+DIFFICULTY_PRESETS = {
+    "simple": {"max_depth": 1, "time_limit": 0.5, "randomness": 200, "book_random": True},
+    "normal": {"max_depth": 2, "time_limit": 1.0, "randomness": 30, "book_random": True},
+    "hard": {"max_depth": 4, "time_limit": 2.0, "randomness": 0, "book_random": False},
+    "expert": {"max_depth": 32, "time_limit": 3.0, "randomness": 0, "book_random": False},
+}
+
+
+def choose_move(position, difficulty="normal", max_depth=None, time_limit=None, searcher=None, book=None):
+    """根据难度为当前出棋方选择一步棋，返回(from_row, from_col, to_row, to_col)，无合法走法时返回None
+
+    max_depth/time_limit不为None时覆盖难度预设；searcher可传入外部的Searcher以便中途停止；
+    book为OpeningBook时先查开局库，命中则不再搜索。
+    """
+    preset = DIFFICULTY_PRESETS.get(difficulty, DIFFICULTY_PRESETS["normal"])
+    if book is not None:
+        move = book.choose(position, preset["book_random"])
+        if move is not None:
+            return move_to_coords(move)
+
+    if max_depth is None:
+        max_depth = preset["max_depth"]
+    if time_limit is None:
+        time_limit = preset["time_limit"]
+    if searcher is None:
+        searcher = Searcher()
+
+    move, _, _ = searcher.search(position, max_depth, time_limit, preset["randomness"])
+
+    # 没有合法走法（被将死或困毙）
+    if move is None:
+        return None
+
+    return move_to_coords(move)
@@ -1,17 +1,71 @@
 from PyQt5.QtWidgets import QWidget, QMessageBox
-from PyQt5.QtGui import QPainter, QColor, QPen, QBrush, QFont, QRadialGradient, QPolygonF
-from PyQt5.QtCore import Qt, QPoint, QRect, QPropertyAnimation, QEasingCurve, QObject, pyqtProperty, QTimer
+from PyQt5.QtGui import QPainter, QColor, QPen, QBrush, QFont, QFontMetrics, QRadialGradient, QPolygonF, QPixmap
+from PyQt5.QtCore import Qt, QPoint, QRect, QPropertyAnimation, QEasingCurve, QObject, pyqtProperty, QTimer, QThread, pyqtSignal, QElapsedTimer
 import random
 import math
+import secrets
+import traceback
+
+from chess_rules import Position, Rules, PIECE_NAMES, piece_color, coords_to_move, move_to_coords
+from chess_ai import choose_move, DIFFICULTY_PRESETS
+from chess_search import Searcher, ParallelSearcher
+from opening_book import OpeningBook
+from tablebase import Tablebases
+from network import NetworkTransport, catch_up_messages, RECONNECT_ATTEMPTS, RECONNECT_DELAY
+import protocol
+
+class AIThinkingThread(QThread):
+    """在后台线程中运行AI搜索，搜索结束后通过信号把走法送回界面线程"""
+    move_ready = pyqtSignal(object, int)  # (from_row, from_col, to_row, to_col)或None, 搜索编号
+    
+    def __init__(self, position, difficulty, searcher, generation, book=None, parent=None):
+        super().__init__(parent)
+        self.position = position  # 棋局副本，界面线程不会再修改它
+        self.difficulty = difficulty
+        self.searcher = searcher
+        self.generation = generation
+        self.book = book
+    
+    def run(self):
+        try:
+            move = choose_move(self.position, self.difficulty, searcher=self.searcher, book=self.book)
+        except Exception:
+            # 搜索出错时也要通知界面线程，按"没有走法"处理，界面不会一直等待
+            traceback.print_exc()
+            move = None
+        self.move_ready.emit(move, self.generation)
+
+class NetworkSignals(QObject):
+    """把网络线程中的事件转成Qt信号，槽函数在界面线程中执行"""
+    connected = pyqtSignal(str)  # 对方地址
+    message_received = pyqtSignal(int, int, object)  # (消息类型, 序号, 负载)
+    disconnected = pyqtSignal(str)  # 断开原因
+    error = pyqtSignal(str)
 
 class ChessBoard(QWidget):
+    # 棋子精灵四周留出的边距（选中时的发光边框画在棋子外面）
+    SPRITE_MARGIN = 10
+    
     def __init__(self, parent=None):
         super().__init__(parent)
+        # 残局库（默认目录下没有残局库文件时为None）
+        self.tablebases = Tablebases.load_default()
+        # AI搜索器（置换表在同一局的多次AI走棋之间共用）
+        self.searcher = Searcher(tt_size_mb=16, tablebases=self.tablebases)
+        # 开局库（默认开局库文件不存在时为None，只靠搜索）
+        self.opening_book = OpeningBook.load_default()
+        
+        # 后台AI思考相关
+        self.ai_thread = None  # 当前的AI搜索线程
+        self.ai_generation = 0  # 每次开始或取消搜索时加1，用于丢弃过期的结果
+        self.ai_elapsed = QElapsedTimer()
+        self.ai_progress_timer = QTimer(self)
+        self.ai_progress_timer.timeout.connect(self.update_ai_progress)
+        
         self.init_board()
         self.game_mode = "player"  # player, ai, network
         self.selected_piece = None
         self.selected_pos = None
-        self.move_history = []
         
         # 爆炸特效相关属性
         self.explosions = []  # 存储当前所有爆炸效果
@@ -43,60 +97,85 @@ class ChessBoard(QWidget):
         # 游戏结束回调函数
         self.game_over_callback = None
         
+        # 静态棋盘（背景、河界、线条、九宫、文字）的缓存，窗口大小变化时重新生成
+        self.board_cache = None
+        # 棋子精灵图集，行间距变化时重新生成
+        self.sprite_atlas = None
+        self.sprite_atlas_size = 0
+        self.sprite_rects = {}
+        
         # AI难度等级
         self.ai_difficulty = "normal"  # simple, normal, hard, expert
         
     def init_board(self):
         """初始化棋盘和棋子"""
+        # 取消还在进行的AI思考
+        self.cancel_ai()
+        
         # 棋盘尺寸设置
         self.board_size = 9  # 9列
         self.row_count = 10  # 中国象棋标准棋盘有10行
         self.margin = 30
         
-        # 初始化棋盘状态
-        self.board = [[None for _ in range(self.board_size)] for _ in range(self.row_count)]
-        
-        # 初始化棋子
-        self.init_pieces()
+        # 初始化棋局状态（规则核心不依赖Qt）
+        self.position = Position()
+        self.rules = Rules(self.position)
         
-        # 当前玩家
-        self.current_player = "red"
+        # 新的一局不再使用上一局的搜索结果
+        self.searcher.tt.clear()
         
         # 初始计算行间距
         self.resizeEvent(None)
-        
-    def init_pieces(self):
-        """初始化棋子位置"""
-        # 红方棋子（现在放在棋盘下方）
-        red_pieces = [
-            ("車", 9, 0), ("馬", 9, 1), ("象", 9, 2), ("士", 9, 3), ("将", 9, 4), ("士", 9, 5), ("象", 9, 6), ("馬", 9, 7), ("車", 9, 8),
-            ("炮", 7, 1), ("炮", 7, 7),
-            ("兵", 6, 0), ("兵", 6, 2), ("兵", 6, 4), ("兵", 6, 6), ("兵", 6, 8)
-        ]
-        
-        # 黑方棋子（现在放在棋盘上方，与红方对称）
-        black_pieces = [
-            ("車", 0, 0), ("馬", 0, 1), ("象", 0, 2), ("士", 0, 3), ("将", 0, 4), ("士", 0, 5), ("象", 0, 6), ("馬", 0, 7), ("車", 0, 8),
-            ("炮", 2, 1), ("炮", 2, 7),
-            ("兵", 3, 0), ("兵", 3, 2), ("兵", 3, 4), ("兵", 3, 6), ("兵", 3, 8)
-        ]
-        
-        # 放置红方棋子
-        for name, row, col in red_pieces:
-            self.board[row][col] = {"name": name, "color": "red", "row": row, "col": col}
-        
-        # 放置黑方棋子
-        for name, row, col in black_pieces:
-            self.board[row][col] = {"name": name, "color": "black", "row": row, "col": col}
+    
+    @property
+    def board(self):
+        """字典形式的棋盘状态，供绘制和点击使用（由规则核心的紧凑棋盘转换而来）"""
+        return self.position.to_dict_board()
+    
+    @property
+    def current_player(self):
+        """当前玩家"""
+        return self.position.current_player
+    
+    @current_player.setter
+    def current_player(self, color):
+        self.position.current_player = color
+    
+    @property
+    def move_history(self):
+        """走棋历史"""
+        return self.position.move_history
     
     def set_game_mode(self, mode):
-        """设置游戏模式"""
+        """设置游戏模式（离开联机对战时断开网络）"""
+        if mode != "network":
+            self.close_network()
         self.game_mode = mode
     
     def set_ai_difficulty(self, difficulty):
         """设置AI难度等级"""
         self.ai_difficulty = difficulty
     
+    def set_ai_hash_size(self, size_mb):
+        """设置AI置换表大小（MB）"""
+        self.cancel_ai()
+        self.searcher.resize_tt(size_mb)
+    
+    @property
+    def ai_workers(self):
+        """AI搜索使用的进程数"""
+        return self.searcher.workers if isinstance(self.searcher, ParallelSearcher) else 1
+    
+    def set_ai_workers(self, workers):
+        """设置AI搜索使用的进程数，大于1时使用多进程并行搜索"""
+        self.cancel_ai()
+        size_mb = self.searcher.tt.size_mb
+        self.searcher.close()
+        if workers > 1:
+            self.searcher = ParallelSearcher(workers, tt_size_mb=size_mb, tablebases=self.tablebases)
+        else:
+            self.searcher = Searcher(tt_size_mb=size_mb, tablebases=self.tablebases)
+    
     def resizeEvent(self, event):
         """重写调整大小事件，根据窗口大小动态计算行间距并保持正确比例"""
         # 中国象棋棋盘标准比例：9列10行，宽度略小于高度
@@ -123,6 +202,10 @@ class ChessBoard(QWidget):
         # 确保行间距至少为30，避免棋子太小
         self.line_spacing = max(self.line_spacing, 30)
         
+        # 棋盘大小变了，静态棋盘缓存和棋子图集作废
+        self.board_cache = None
+        self.sprite_atlas = None
+        
         # 调用父类的resizeEvent
         super().resizeEvent(event)
         
@@ -144,6 +227,34 @@ class ChessBoard(QWidget):
         board_x = (self.width() - board_width) // 2
         board_y = (self.height() - board_height) // 2
         
+        # 静态棋盘直接贴缓存，每帧只重画棋子和特效（绘制被裁剪到需要更新的区域）
+        painter.drawPixmap(0, 0, self.board_pixmap())
+        
+        # 绘制棋子（只画与需要更新的区域相交的棋子）
+        self.draw_pieces(painter, board_x, board_y, event.rect())
+        
+        # 绘制AI移动高亮效果
+        self.draw_ai_move_highlight(painter, board_x, board_y)
+        
+        # 绘制将军特效
+        self.draw_check_effects(painter)
+        
+    def board_pixmap(self):
+        """静态棋盘的缓存图，没有缓存或窗口大小不符时重新绘制"""
+        ratio = self.devicePixelRatioF()
+        if self.board_cache is not None and self.board_cache.size() == self.size() * ratio:
+            return self.board_cache
+        
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        
+        board_width = (self.board_size - 1) * self.line_spacing
+        board_height = (self.row_count - 1) * self.line_spacing
+        board_x = (self.width() - board_width) // 2
+        board_y = (self.height() - board_height) // 2
+        
         # 绘制棋盘背景
         original_color = QColor(222, 184, 135)  # 原始棋盘颜色
         painter.fillRect(self.rect(), original_color)
@@ -156,24 +267,45 @@ class ChessBoard(QWidget):
             river_color
         )
         
-        # 移除棋子位置的原始颜色圆形，因为现在只改变楚河汉界区域的背景
-        
         # 绘制棋盘线条
         self.draw_board_lines(painter, board_x, board_y)
+        painter.end()
         
-        # 绘制棋子
-        self.draw_pieces(painter, board_x, board_y)
-        
-        # 绘制AI移动高亮效果
-        self.draw_ai_move_highlight(painter, board_x, board_y)
-        
-        # 绘制将军特效
-        self.draw_check_effects(painter)
-        
+        self.board_cache = pixmap
+        return pixmap
+    
+    def board_origin(self):
+        """棋盘左上角坐标（与paintEvent一致，棋盘居中）"""
+        board_width = (self.board_size - 1) * self.line_spacing
+        board_height = (self.row_count - 1) * self.line_spacing
+        return (self.width() - board_width) // 2, (self.height() - board_height) // 2
+    
+    def piece_rect(self, x, y):
+        """以(x, y)为中心的棋子（含选中时的发光边框）所占的矩形"""
+        cell = int(self.line_spacing * 0.85) + self.SPRITE_MARGIN * 2
+        return QRect(x - cell // 2, y - cell // 2, cell, cell)
+    
+    def cell_rect(self, row, col):
+        """棋盘上一个交叉点的棋子所占的矩形"""
+        board_x, board_y = self.board_origin()
+        return self.piece_rect(board_x + col * self.line_spacing, board_y + row * self.line_spacing)
+    
+    def update_cells(self, *cells):
+        """只重绘给定交叉点(row, col)处的棋子，None跳过"""
+        for cell in cells:
+            if cell is not None:
+                self.update(self.cell_rect(*cell))
+    
+    def ai_path_rect(self):
+        """AI走法高亮（起点、终点的圆圈和之间的箭头）所占的矩形"""
+        from_row, from_col, to_row, to_col = self.ai_move_path
+        return self.cell_rect(from_row, from_col).united(self.cell_rect(to_row, to_col))
+    
     def clear_ai_highlight(self):
         """清除AI移动高亮效果"""
+        if self.ai_move_path:
+            self.update(self.ai_path_rect())
         self.ai_move_path = None
-        self.update()
         
     def draw_ai_move_highlight(self, painter, board_x, board_y):
         """绘制AI移动路径高亮效果"""
@@ -340,9 +472,22 @@ class ChessBoard(QWidget):
         
         self.explosions.append(explosion)
     
+    def explosion_rect(self, explosion):
+        """爆炸圆圈和全部粒子所占的矩形"""
+        radius = int(explosion["radius"]) + 2
+        rect = QRect(int(explosion["x"]) - radius, int(explosion["y"]) - radius, radius * 2, radius * 2)
+        for particle in explosion["particles"]:
+            size = int(particle["size"]) + 2
+            rect = rect.united(QRect(int(particle["x"]) - size, int(particle["y"]) - size, size * 2, size * 2))
+        return rect
+    
     def update_explosions(self):
-        """更新爆炸特效"""
+        """更新爆炸特效，只重绘爆炸前后两帧覆盖的区域"""
+        dirty = QRect()
         for explosion in self.explosions[:]:
+            # 上一帧画过的区域需要擦掉
+            dirty = dirty.united(self.explosion_rect(explosion))
+            
             # 更新爆炸半径
             explosion["radius"] += self.line_spacing / 20
             
@@ -359,10 +504,12 @@ class ChessBoard(QWidget):
             # 移除结束的爆炸
             if explosion["alpha"] <= 0:
                 self.explosions.remove(explosion)
+            else:
+                dirty = dirty.united(self.explosion_rect(explosion))
         
-        # 如果有爆炸效果，重绘棋盘
-        if self.explosions:
-            self.update()
+        # 如果有爆炸效果，重绘爆炸所在的区域
+        if not dirty.isEmpty():
+            self.update(dirty)
             
     def start_celebration(self):
         """开始庆祝特效"""
@@ -404,6 +551,9 @@ class ChessBoard(QWidget):
             return
             
         for confetti in self.confetti[:]:
+            # 上一帧画过的位置需要擦掉
+            previous = self.confetti_rect(confetti)
+            
             # 更新位置
             from math import radians, cos, sin
             confetti["x"] += cos(radians(confetti["angle"])) * confetti["speed"]
@@ -420,12 +570,19 @@ class ChessBoard(QWidget):
                 confetti["y"] < -50 or confetti["y"] > self.height() + 50 or 
                 confetti["alpha"] <= 0):
                 self.confetti.remove(confetti)
+                self.update(previous)
+            else:
+                # 只重绘这片彩花前后两帧覆盖的区域
+                self.update(previous.united(self.confetti_rect(confetti)))
         
         # 如果所有彩花消失，结束庆祝
         if not self.confetti:
             self.celebration_effects = False
-        else:
-            self.update()
+    
+    def confetti_rect(self, confetti):
+        """一片彩花（旋转的正方形）所占的矩形"""
+        half = int(confetti["size"]) + 2  # 旋转后不超过边长的√2/2，再留出画笔宽度
+        return QRect(int(confetti["x"]) - half, int(confetti["y"]) - half, half * 2, half * 2)
     
     def draw_explosions(self, painter):
         """绘制爆炸特效"""
@@ -458,12 +615,14 @@ class ChessBoard(QWidget):
                                            int(particle["size"] * 2),
                                            int(particle["size"] * 2))
     
-    def draw_pieces(self, painter, board_x, board_y):
-        """绘制棋子"""
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece:
+    def draw_pieces(self, painter, board_x, board_y, dirty=None):
+        """绘制棋子，给出dirty时跳过不与该矩形相交的棋子"""
+        board = self.board
+        for row in range(len(board)):
+            for col in range(len(board[row])):
+                piece = board[row][col]
+                if piece and (dirty is None or dirty.intersects(
+                        self.piece_rect(board_x + col * self.line_spacing, board_y + row * self.line_spacing))):
                     self.draw_piece(painter, piece, row, col, board_x, board_y)
         
         # 绘制爆炸特效
@@ -501,15 +660,53 @@ class ChessBoard(QWidget):
             painter.restore()
     
     def draw_piece(self, painter, piece, row, col, board_x, board_y):
-        """绘制单个棋子"""
+        """绘制单个棋子（从精灵图集中贴图）"""
         x = board_x + col * self.line_spacing
         y = board_y + row * self.line_spacing
         
         # 棋子大小随棋盘大小变化，设置为行间距的85%，使棋子之间有适当间距
         piece_size = int(self.line_spacing * 0.85)
+        selected = (row, col) == self.selected_pos
         
+        # 图集按需生成，棋盘上的棋子名称都来自PIECE_NAMES，一定在图集中
+        source = self.piece_atlas(piece_size)[(piece["name"], piece["color"], piece_size, selected)]
+        painter.drawPixmap(self.piece_rect(x, y), self.sprite_atlas, source)
+    
+    def piece_atlas(self, piece_size):
+        """棋子精灵图集：每种棋子（名称×颜色×是否选中）预先画一次，返回{(名称, 颜色, 大小, 是否选中): 图集中的区域}
+        
+        行间距变化（resizeEvent）后重新生成，重绘时只需贴图，不再每帧创建渐变、字体和排版文字。
+        """
+        if self.sprite_atlas is not None and self.sprite_atlas_size == piece_size:
+            return self.sprite_rects
+        
+        ratio = self.devicePixelRatioF()
+        cell = piece_size + self.SPRITE_MARGIN * 2
+        sprites = [(name, color) for name in PIECE_NAMES.values() for color in ("red", "black")]
+        # 每行一种棋子，左列未选中，右列选中
+        atlas = QPixmap(int(cell * 2 * ratio), int(cell * len(sprites) * ratio))
+        atlas.setDevicePixelRatio(ratio)
+        atlas.fill(Qt.transparent)
+        painter = QPainter(atlas)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self.sprite_rects = {}
+        for index, (name, color) in enumerate(sprites):
+            for selected in (False, True):
+                left = cell if selected else 0
+                top = index * cell
+                self.render_piece(painter, name, color, left + cell // 2, top + cell // 2, piece_size, selected)
+                self.sprite_rects[(name, color, piece_size, selected)] = QRect(
+                    int(left * ratio), int(top * ratio), int(cell * ratio), int(cell * ratio))
+        painter.end()
+        
+        self.sprite_atlas = atlas
+        self.sprite_atlas_size = piece_size
+        return self.sprite_rects
+    
+    def render_piece(self, painter, name, color, x, y, piece_size, selected):
+        """以(x, y)为中心画一个棋子"""
         # 绘制选中效果
-        if (row, col) == self.selected_pos:
+        if selected:
             # 增强选中特效：多层发光边框 + 强内部高亮
             
             # 1. 最外层大发光边框（亮黄色）
@@ -533,7 +730,7 @@ class ChessBoard(QWidget):
                                piece_size, piece_size)
         
         # 绘制棋子圆圈
-        if piece["color"] == "red":
+        if color == "red":
             # 红方棋子使用红色渐变
             gradient = QRadialGradient(x, y, piece_size // 2, x - piece_size // 5, y - piece_size // 5)
             gradient.setColorAt(0, QColor(255, 140, 120))
@@ -560,12 +757,20 @@ class ChessBoard(QWidget):
         # 创建一个与棋子大小相同的矩形区域
         text_rect = QRect(x - piece_size // 2, y - piece_size // 2, piece_size, piece_size)
         # 使用Qt的对齐功能让文字在矩形内居中显示
-        painter.drawText(text_rect, Qt.AlignCenter, piece["name"])
+        painter.drawText(text_rect, Qt.AlignCenter, name)
     
     def mousePressEvent(self, event):
         """处理鼠标点击事件"""
         if self.game_mode == "ai" and self.current_player == "black":
             return  # 人机对战时黑方由AI控制
+        if self.game_mode == "network" and self.current_player != self.network_color:
+            return  # 局域网对战时只能走本方的棋
+        if self.game_mode == "network" and not self.is_connected:
+            # 断线期间走的棋发不出去，等重新连上（补齐对方的走法）后再走
+            main_window = self.parent().parent() if self.parent() else None
+            if main_window:
+                main_window.statusBar().showMessage("网络已断开，重新连接后才能走棋", 3000)
+            return
         
         # 计算棋盘实际绘制区域
         board_width = (self.board_size - 1) * self.line_spacing
@@ -582,17 +787,26 @@ class ChessBoard(QWidget):
         # 检查坐标是否在棋盘范围内
         if 0 <= col < self.board_size and 0 <= row < self.row_count:
             piece = self.board[row][col]
+            previous_pos = self.selected_pos
             
             if self.selected_piece:
                 # 如果已经选中了棋子，尝试移动
                 if self.can_move(self.selected_pos[0], self.selected_pos[1], row, col):
                     # 执行移动
-                    self.move_piece(self.selected_pos[0], self.selected_pos[1], row, col)
+                    from_row, from_col = self.selected_pos
+                    self.move_piece(from_row, from_col, row, col)
+                    # 如果是局域网对战，把本方走法发给对方（对方的走法不再回传）
+                    if self.game_mode == "network" and self.is_connected:
+                        self.send_move(from_row, from_col, row, col)
                     self.selected_piece = None
                     self.selected_pos = None
                     
-                    # 检查游戏是否结束
+                    # 切换玩家
+                    self.switch_player()
+                    
+                    # 检查游戏是否结束（对方被将死或困毙）
                     if self.is_game_over():
+                        self.end_network_session()
                         # 开始庆祝特效
                         self.start_celebration()
                         winner = self.get_winner()
@@ -603,12 +817,14 @@ class ChessBoard(QWidget):
                             QMessageBox.information(self, "游戏结束", f"{winner}获胜！")
                         return
                     
-                    # 切换玩家
-                    self.switch_player()
+                    # 循环走子时按规则裁决
+                    if self.check_repetition():
+                        return
                     
                     # 如果是人机对战且轮到黑方
                     if self.game_mode == "ai" and self.current_player == "black":
                         self.ai_move()
+                    return
                 else:
                     # 如果点击的是自己的棋子，重新选择
                     if piece and piece["color"] == self.current_player:
@@ -624,250 +840,46 @@ class ChessBoard(QWidget):
                     self.selected_piece = piece
                     self.selected_pos = (row, col)
             
-            # 重绘棋盘
-            self.update()
+            # 只重绘选中状态变化的两个棋子
+            if self.selected_pos != previous_pos:
+                self.update_cells(previous_pos, self.selected_pos)
     
     def can_move(self, from_row, from_col, to_row, to_col):
         """检查棋子是否可以移动到目标位置"""
-        # 检查目标位置是否有己方棋子
-        if self.board[to_row][to_col] and self.board[to_row][to_col]["color"] == self.current_player:
-            return False
-        
-        piece = self.board[from_row][from_col]
-        
-        # 根据棋子类型检查移动规则
-        if piece["name"] == "将" or piece["name"] == "帅":
-            return self.can_move_jiang(from_row, from_col, to_row, to_col)
-        elif piece["name"] == "士":
-            return self.can_move_shi(from_row, from_col, to_row, to_col)
-        elif piece["name"] == "象" or piece["name"] == "相":
-            return self.can_move_xiang(from_row, from_col, to_row, to_col)
-        elif piece["name"] == "馬":
-            return self.can_move_ma(from_row, from_col, to_row, to_col)
-        elif piece["name"] == "車":
-            return self.can_move_ju(from_row, from_col, to_row, to_col)
-        elif piece["name"] == "炮":
-            return self.can_move_pao(from_row, from_col, to_row, to_col)
-        elif piece["name"] == "兵" or piece["name"] == "卒":
-            return self.can_move_bing(from_row, from_col, to_row, to_col)
-        
-        return False
-    
-    def can_move_jiang(self, from_row, from_col, to_row, to_col):
-        """检查将/帅的移动规则"""
-        piece = self.board[from_row][from_col]
-        # 检查是否在九宫内（红方现在在下方）
-        if piece["color"] == "red":
-            # 红方九宫在下方（第7-9行）
-            if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
-                return False
-        else:
-            # 黑方九宫在上方（第0-2行）
-            if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
-                return False
-        
-        # 只能走一步
-        if abs(to_row - from_row) + abs(to_col - from_col) != 1:
-            return False
-        
-        return True
-    
-    def can_move_shi(self, from_row, from_col, to_row, to_col):
-        """检查士的移动规则"""
-        piece = self.board[from_row][from_col]
-        # 检查是否在九宫内（红方现在在下方）
-        if piece["color"] == "red":
-            # 红方九宫在下方（第7-9行）
-            if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
-                return False
-        else:
-            # 黑方九宫在上方（第0-2行）
-            if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
-                return False
-        
-        # 只能走斜线一步
-        if abs(to_row - from_row) != 1 or abs(to_col - from_col) != 1:
-            return False
-        
-        return True
-    
-    def can_move_xiang(self, from_row, from_col, to_row, to_col):
-        """检查象/相的移动规则"""
-        piece = self.board[from_row][from_col]
-        # 检查是否过河（红方现在在下方）
-        if piece["color"] == "red":
-            # 红方不能过河到上方
-            if to_row < 5:
-                return False
-        else:
-            # 黑方不能过河到下方
-            if to_row > 4:
-                return False
-        
-        # 只能走田字
-        if abs(to_row - from_row) != 2 or abs(to_col - from_col) != 2:
-            return False
-        
-        # 检查田字中心是否有棋子
-        center_row = (from_row + to_row) // 2
-        center_col = (from_col + to_col) // 2
-        if self.board[center_row][center_col]:
-            return False
-        
-        return True
-    
-    def can_move_ma(self, from_row, from_col, to_row, to_col):
-        """检查马的移动规则"""
-        # 检查是否走日字
-        dx = abs(to_col - from_col)
-        dy = abs(to_row - from_row)
-        if not ((dx == 1 and dy == 2) or (dx == 2 and dy == 1)):
-            return False
-        
-        # 检查马脚是否被绊
-        if dx == 1 and dy == 2:
-            # 横向移动1，纵向移动2
-            if to_row > from_row:
-                # 向下移动
-                if self.board[from_row + 1][from_col]:
-                    return False
-            else:
-                # 向上移动
-                if self.board[from_row - 1][from_col]:
-                    return False
-        else:
-            # 横向移动2，纵向移动1
-            if to_col > from_col:
-                # 向右移动
-                if self.board[from_row][from_col + 1]:
-                    return False
-            else:
-                # 向左移动
-                if self.board[from_row][from_col - 1]:
-                    return False
-        
-        return True
-    
-    def can_move_ju(self, from_row, from_col, to_row, to_col):
-        """检查车的移动规则"""
-        # 必须是直线移动
-        if from_row != to_row and from_col != to_col:
-            return False
-        
-        # 检查路径是否有棋子阻挡
-        if from_row == to_row:
-            # 横向移动
-            start_col = min(from_col, to_col) + 1
-            end_col = max(from_col, to_col)
-            for col in range(start_col, end_col):
-                if self.board[from_row][col]:
-                    return False
-        else:
-            # 纵向移动
-            start_row = min(from_row, to_row) + 1
-            end_row = max(from_row, to_row)
-            for row in range(start_row, end_row):
-                if self.board[row][from_col]:
-                    return False
-        
-        return True
-    
-    def can_move_pao(self, from_row, from_col, to_row, to_col):
-        """检查炮的移动规则"""
-        # 必须是直线移动
-        if from_row != to_row and from_col != to_col:
-            return False
-        
-        # 计算中间的棋子数量
-        piece_count = 0
-        if from_row == to_row:
-            # 横向移动
-            start_col = min(from_col, to_col) + 1
-            end_col = max(from_col, to_col)
-            for col in range(start_col, end_col):
-                if self.board[from_row][col]:
-                    piece_count += 1
-        else:
-            # 纵向移动
-            start_row = min(from_row, to_row) + 1
-            end_row = max(from_row, to_row)
-            for row in range(start_row, end_row):
-                if self.board[row][from_col]:
-                    piece_count += 1
-        
-        # 炮吃子时需要中间有一个棋子，移动时中间不能有棋子
-        if self.board[to_row][to_col]:
-            # 吃子
-            return piece_count == 1
-        else:
-            # 移动
-            return piece_count == 0
-    
-    def can_move_bing(self, from_row, from_col, to_row, to_col):
-        """检查兵/卒的移动规则"""
-        piece = self.board[from_row][from_col]
-        # 确定移动方向（红方现在在下方，应该向上移动）
-        direction = -1 if piece["color"] == "red" else 1
-        
-        # 检查是否过河
-        crossed_river = False
-        if piece["color"] == "red" and from_row <= 4:
-            crossed_river = True
-        if piece["color"] == "black" and from_row >= 5:
-            crossed_river = True
-        
-        # 未过河只能向前
-        if not crossed_river:
-            if to_col != from_col or (to_row - from_row) != direction:
-                return False
-        else:
-            # 过河后可以向前或左右
-            if (to_row - from_row) == direction and to_col == from_col:
-                return True
-            elif to_row == from_row and abs(to_col - from_col) == 1:
-                return True
-            else:
-                return False
-        
-        return True
+        return self.rules.can_move(from_row, from_col, to_row, to_col)
     
     def move_piece(self, from_row, from_col, to_row, to_col):
         """移动棋子"""
-        # 记录移动历史
-        captured_piece = self.board[to_row][to_col]
-        self.move_history.append((from_row, from_col, to_row, to_col, captured_piece))
+        # 执行移动并记录移动历史
+        captured_piece = self.position.move_piece(from_row, from_col, to_row, to_col)
+        
+        # 只重绘起点和终点的棋子
+        self.update_cells((from_row, from_col), (to_row, to_col))
         
         # 如果有吃棋，添加爆炸特效
         if captured_piece:
             # 计算爆炸中心位置
-            board_width = (self.board_size - 1) * self.line_spacing
-            board_height = (self.row_count - 1) * self.line_spacing
-            board_x = (self.width() - board_width) // 2
-            board_y = (self.height() - board_height) // 2
+            board_x, board_y = self.board_origin()
             
             explosion_x = board_x + to_col * self.line_spacing
             explosion_y = board_y + to_row * self.line_spacing
             
             # 添加爆炸效果
-            self.add_explosion(explosion_x, explosion_y, captured_piece["color"])
-        
-        # 执行移动
-        self.board[to_row][to_col] = self.board[from_row][from_col]
-        self.board[from_row][from_col] = None
+            self.add_explosion(explosion_x, explosion_y, piece_color(captured_piece))
         
         # 检查对方是否被将军
         enemy_color = "black" if self.current_player == "red" else "red"
         if self.is_checked(enemy_color):
             self.show_check_effect(enemy_color)
-        
-        # 如果是局域网对战，发送移动数据
-        if self.game_mode == "network" and self.is_connected:
-            self.send_move(from_row, from_col, to_row, to_col)
     
     def switch_player(self):
         """切换玩家"""
         # 切换玩家
-        self.current_player = "black" if self.current_player == "red" else "red"
+        self.position.switch_player()
+        self.update_turn_label()
+    
+    def update_turn_label(self):
+        """更新当前出棋方提示"""
         player_name = self.get_player_name()
         
         # 获取真正的主窗口实例（通过父窗口的父窗口）
@@ -888,51 +900,18 @@ class ChessBoard(QWidget):
         return "红方" if self.current_player == "red" else "黑方"
     
     def is_game_over(self):
-        """检查游戏是否结束"""
-        # 检查是否有一方的将/帅被吃掉
-        red_jiang = False
-        black_jiang = False
-        
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece:
-                    if (piece["name"] == "将" or piece["name"] == "帅") and piece["color"] == "red":
-                        red_jiang = True
-                    elif (piece["name"] == "将" or piece["name"] == "帅") and piece["color"] == "black":
-                        black_jiang = True
-        
-        return not red_jiang or not black_jiang
+        """检查游戏是否结束（当前出棋方被将死或困毙）"""
+        return self.rules.is_game_over()
     
     def is_checked(self, color):
         """检查指定颜色的玩家是否被将军"""
-        # 找到当前颜色的将/帅
-        jiang_pos = None
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece and (piece["name"] == "将" or piece["name"] == "帅") and piece["color"] == color:
-                    jiang_pos = (row, col)
-                    break
-            if jiang_pos:
-                break
-        
-        if not jiang_pos:
-            return False
-        
-        # 检查对方是否有棋子可以攻击到将/帅
-        enemy_color = "black" if color == "red" else "red"
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece and piece["color"] == enemy_color:
-                    if self.can_move(row, col, jiang_pos[0], jiang_pos[1]):
-                        return True
-        
-        return False
+        return self.rules.is_checked(color)
     
     def show_check_effect(self, color):
         """显示将军特效"""
+        if self.check_effects:
+            # 擦掉还没消失的上一次将军提示
+            self.update(self.check_effect_rect())
         self.check_effects = True
         self.check_text = "红方被将军！" if color == "red" else "黑方被将军！"
         self.check_alpha = 255
@@ -941,7 +920,9 @@ class ChessBoard(QWidget):
             self.check_timer.start(50)  # 每50毫秒更新一次
     
     def update_check_effects(self):
-        """更新将军特效"""
+        """更新将军特效，只重绘特效前后两帧覆盖的区域"""
+        previous = self.check_effect_rect()
+        
         # 更新脉冲动画（加快爆炸速度）
         self.check_pulse += 0.2
         if self.check_pulse > 1:
@@ -956,7 +937,23 @@ class ChessBoard(QWidget):
             self.check_effects = False
             self.check_timer.stop()
         
-        self.update()
+        self.update(previous.united(self.check_effect_rect()))
+    
+    def check_effect_rect(self):
+        """将军特效（扩散的圆圈和文字及阴影）所占的矩形，与draw_check_effects的计算一致"""
+        board_x, board_y = self.board_origin()
+        center_x = board_x + (self.board_size - 1) * self.line_spacing // 2
+        center_y = board_y + (self.row_count - 1) * self.line_spacing // 2
+        
+        radius = int(self.line_spacing * 2 * (0.5 + self.check_pulse * 0.5)) + 2
+        rect = QRect(center_x - radius, center_y - radius, radius * 2, radius * 2)
+        
+        font = QFont("SimHei", 36 + int(12 * self.check_pulse), QFont.Bold)
+        text_rect = QFontMetrics(font).boundingRect(self.check_text)
+        x = center_x - text_rect.width() // 2
+        y = center_y + text_rect.height() // 2
+        # 文字从基线(x, y)画起，阴影再向右下偏移2像素
+        return rect.united(text_rect.translated(x, y).adjusted(-4, -4, 6, 6))
     
     def draw_check_effects(self, painter):
         """绘制将军特效（爆炸弹出效果）"""
@@ -1011,27 +1008,38 @@ class ChessBoard(QWidget):
     
     def get_winner(self):
         """获取获胜者"""
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece and (piece["name"] == "将" or piece["name"] == "帅"):
-                    return "红方" if piece["color"] == "red" else "黑方"
-        return ""
+        return self.rules.get_winner()
     
-    def undo_move(self):
-        """悔棋"""
-        if not self.move_history:
+    def check_repetition(self):
+        """同一局面反复出现时按长将、长捉规则裁决，对局因此结束时返回True"""
+        result = self.rules.adjudicate_repetition()
+        if result is None:
             return False
         
-        # 取出最后一步
-        from_row, from_col, to_row, to_col, captured_piece = self.move_history.pop()
+        self.end_network_session()
+        if result == "draw":
+            QMessageBox.information(self, "游戏结束", "双方循环走子，判为和棋")
+            return True
+        
+        # 开始庆祝特效
+        self.start_celebration()
+        winner = "红方" if result == "red" else "黑方"
+        if self.game_over_callback:
+            self.game_over_callback(winner)
+        else:
+            QMessageBox.information(self, "游戏结束", f"对方长将或长捉，{winner}获胜！")
+        return True
+    
+    def undo_move(self):
+        """悔棋"""
+        # 悔棋时AI正在思考的局面已经作废
+        self.cancel_ai()
         
-        # 恢复棋子
-        self.board[from_row][from_col] = self.board[to_row][to_col]
-        self.board[to_row][to_col] = captured_piece
+        # 恢复棋子并切换回上一步的玩家
+        if not self.position.undo_move():
+            return False
         
-        # 切换玩家
-        self.switch_player()
+        self.update_turn_label()
         
         # 重绘棋盘
         self.update()
@@ -1040,119 +1048,71 @@ class ChessBoard(QWidget):
     
     def evaluate_move_value(self, from_row, from_col, to_row, to_col):
         """评估移动的价值"""
-        # 棋子价值表
-        piece_values = {
-            "将": 1000, "帥": 1000,
-            "車": 100, "馬": 50, "象": 20, "士": 20, "炮": 50, "兵": 10
-        }
-        
-        value = 0
-        
-        # 检查是否能吃子
-        target_piece = self.board[to_row][to_col]
-        if target_piece:
-            # 吃子加分
-            value += piece_values.get(target_piece["name"], 10)
-        
-        # 检查是否将军
-        # 模拟移动
-        temp_piece = self.board[to_row][to_col]
-        self.board[to_row][to_col] = self.board[from_row][from_col]
-        self.board[from_row][from_col] = None
-        
-        # 检查是否将军
-        if self.is_checked("red"):
-            value += 50
-        
-        # 恢复棋盘
-        self.board[from_row][from_col] = self.board[to_row][to_col]
-        self.board[to_row][to_col] = temp_piece
-        
-        return value
+        return self.rules.evaluate_move_value(from_row, from_col, to_row, to_col)
     
     def ai_move(self):
-        """AI移动（支持不同难度等级）"""
-        import random
-        
-        # 收集所有可移动的棋子
-        movable_pieces = []
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece and piece["color"] == "black":
-                    # 收集所有可能的移动
-                    for to_row in range(len(self.board)):
-                        for to_col in range(len(self.board[to_row])):
-                            if self.can_move(row, col, to_row, to_col):
-                                value = self.evaluate_move_value(row, col, to_row, to_col)
-                                movable_pieces.append((row, col, to_row, to_col, value))
-        
-        if movable_pieces:
-            chosen_move = None
-            
-            if self.ai_difficulty == "simple":
-                # 简单：完全随机移动
-                chosen_move = random.choice(movable_pieces)
-            
-            elif self.ai_difficulty == "normal":
-                # 正常：优先选择吃子或将军的移动
-                good_moves = [move for move in movable_pieces if move[4] > 10]
-                if good_moves:
-                    chosen_move = random.choice(good_moves)
-                else:
-                    chosen_move = random.choice(movable_pieces)
-            
-            elif self.ai_difficulty == "hard":
-                # 困难：选择价值最高的移动
-                chosen_move = max(movable_pieces, key=lambda x: x[4])
-            
-            elif self.ai_difficulty == "expert":
-                # 极难：考虑多步走法
-                # 这里我们用简单的两步预测实现
-                best_value = -1000000
-                best_move = None
-                
-                for move1 in movable_pieces:
-                    # 模拟第一步移动
-                    from_row1, from_col1, to_row1, to_col1, value1 = move1
-                    temp_piece1 = self.board[to_row1][to_col1]
-                    self.board[to_row1][to_col1] = self.board[from_row1][from_col1]
-                    self.board[from_row1][from_col1] = None
-                    
-                    # 模拟玩家可能的反击
-                    player_moves = []
-                    for row in range(len(self.board)):
-                        for col in range(len(self.board[row])):
-                            piece = self.board[row][col]
-                            if piece and piece["color"] == "red":
-                                for to_row in range(len(self.board)):
-                                    for to_col in range(len(self.board[to_row])):
-                                        if self.can_move(row, col, to_row, to_col):
-                                            value = self.evaluate_move_value(row, col, to_row, to_col)
-                                            player_moves.append((row, col, to_row, to_col, value))
-                    
-                    # 计算对手的最佳反击
-                    if player_moves:
-                        opponent_best = max(player_moves, key=lambda x: x[4])
-                        total_value = value1 - opponent_best[4]
-                    else:
-                        total_value = value1
-                    
-                    # 恢复棋盘
-                    self.board[from_row1][from_col1] = self.board[to_row1][to_col1]
-                    self.board[to_row1][to_col1] = temp_piece1
-                    
-                    # 更新最佳移动
-                    if total_value > best_value:
-                        best_value = total_value
-                        best_move = move1
-                
-                chosen_move = best_move if best_move else max(movable_pieces, key=lambda x: x[4])
-            
-            # 执行选择的移动
-            from_row, from_col, to_row, to_col, _ = chosen_move
+        """AI移动（支持不同难度等级），在后台线程中搜索，界面不会卡住"""
+        self.cancel_ai()
+        
+        self.ai_generation += 1
+        self.ai_thread = AIThinkingThread(self.position.copy(), self.ai_difficulty, self.searcher, self.ai_generation,
+                                          self.opening_book, self)
+        self.ai_thread.move_ready.connect(self.apply_ai_move)
+        # 线程结束后释放，不在棋盘下面越积越多
+        self.ai_thread.finished.connect(self.ai_thread.deleteLater)
+        self.ai_thread.start()
+        
+        # 显示思考进度
+        self.ai_elapsed.start()
+        self.ai_progress_timer.start(100)
+        self.update_ai_progress()
+    
+    def is_ai_thinking(self):
+        """AI是否正在思考"""
+        return self.ai_thread is not None and self.ai_thread.isRunning()
+    
+    def cancel_ai(self):
+        """取消正在进行的AI思考（悔棋、新游戏、认输时调用）"""
+        self.ai_generation += 1
+        if self.ai_thread is not None:
+            # 搜索每隔一段节点检查停止标志，很快就会返回；
+            # 线程可能还没开始搜索，所以重复发出停止请求直到线程结束
+            while self.ai_thread.isRunning():
+                self.searcher.stop()
+                self.ai_thread.wait(10)
+            self.ai_thread = None
+        self.stop_ai_progress()
+    
+    def update_ai_progress(self):
+        """在状态栏显示AI思考进度"""
+        main_window = self.parent().parent() if self.parent() else None
+        if not main_window:
+            return
+        elapsed = self.ai_elapsed.elapsed() / 1000
+        time_limit = DIFFICULTY_PRESETS.get(self.ai_difficulty, DIFFICULTY_PRESETS["normal"])["time_limit"]
+        dots = "." * (int(elapsed * 4) % 3 + 1)
+        main_window.statusBar().showMessage(f"AI思考中{dots}  {elapsed:.1f}s / {time_limit:.1f}s")
+    
+    def stop_ai_progress(self):
+        """隐藏AI思考进度"""
+        self.ai_progress_timer.stop()
+        main_window = self.parent().parent() if self.parent() else None
+        if main_window:
+            main_window.statusBar().clearMessage()
+    
+    def apply_ai_move(self, chosen_move, generation):
+        """后台搜索结束后在界面线程中执行AI的走法"""
+        if generation != self.ai_generation:
+            return  # 搜索已被取消或局面已改变
+        
+        self.ai_thread = None
+        self.stop_ai_progress()
+        
+        if chosen_move:
+            from_row, from_col, to_row, to_col = chosen_move
             
-            # 记录AI移动路径用于高亮显示
+            # 记录AI移动路径用于高亮显示，先重绘上一步的高亮区域，避免残留
+            self.clear_ai_highlight()
             self.ai_move_path = (from_row, from_col, to_row, to_col)
             
             # 执行移动
@@ -1160,9 +1120,14 @@ class ChessBoard(QWidget):
             
             # 开始高亮显示AI移动路径
             self.ai_highlight_timer.start(1000)  # 高亮显示1秒
+            self.update(self.ai_path_rect())
+            
+            # 切换玩家
+            self.switch_player()
             
-            # 检查游戏是否结束
+            # 检查游戏是否结束（对方被将死或困毙）
             if self.is_game_over():
+                self.end_network_session()
                 # 开始庆祝特效
                 self.start_celebration()
                 winner = self.get_winner()
@@ -1173,91 +1138,227 @@ class ChessBoard(QWidget):
                     QMessageBox.information(self, "游戏结束", f"{winner}获胜！")
                 return
             
-            # 切换玩家
-            self.switch_player()
-            
-            # 重绘棋盘
-            self.update()
+            # 循环走子时按规则裁决
+            self.check_repetition()
     
     def init_network(self):
-        """初始化网络连接"""
-        import socket
-        import threading
-        
-        self.socket = None
+        """初始化网络连接（关闭之前的连接）"""
+        self.close_network()
         self.is_server = False
         self.is_connected = False
+        self.network_color = None  # 本方执子颜色：做主机时执红，客户端收到START后才确定
+        self.watch_room = None  # 观战时请求的房间号，不观战时为None
+        self.session_token = None  # 对局的会话令牌，掉线重连时用
+        self.network_address = None  # 客户端连接的(host, port)
+        self.reconnect_attempts = 0
+        self.network_signals = NetworkSignals(self)
+        self.network_signals.connected.connect(self.on_network_connected)
+        self.network_signals.message_received.connect(self.process_network_data)
+        self.network_signals.disconnected.connect(self.on_network_disconnected)
+        self.network_signals.error.connect(self.on_network_error)
+        # 回调在网络线程中调用，只发出信号，由Qt排队送到界面线程处理
+        self.network = NetworkTransport(
+            on_connected=self.network_signals.connected.emit,
+            on_message=self.network_signals.message_received.emit,
+            on_disconnected=self.network_signals.disconnected.emit,
+            on_error=self.network_signals.error.emit)
+    
+    def close_network(self):
+        """断开网络连接并停止网络线程"""
+        network = getattr(self, "network", None)
+        if network is not None:
+            self.network = None
+            self.is_connected = False
+            network.close()
     
     def start_server(self, port=5555):
-        """启动服务器"""
-        import socket
-        import threading
-        
-        def server_thread():
-            try:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.bind(('0.0.0.0', port))
-                self.socket.listen(1)
-                
-                # 等待连接
-                self.client_socket, self.client_address = self.socket.accept()
-                self.is_connected = True
-                self.is_server = True
-                
-                # 开始接收数据
-                self.receive_thread = threading.Thread(target=self.receive_data)
-                self.receive_thread.daemon = True
-                self.receive_thread.start()
-                
-                QMessageBox.information(self, "提示", f"已连接到客户端: {self.client_address}")
-            except Exception as e:
-                QMessageBox.warning(self, "错误", f"启动服务器失败: {str(e)}")
-        
-        self.server_thread = threading.Thread(target=server_thread)
-        self.server_thread.daemon = True
-        self.server_thread.start()
+        """启动服务器（不阻塞，对手连上后收到connected信号）"""
+        self.is_server = True
+        self.network_color = "red"
+        self.network.start_server(port)
     
     def connect_to_server(self, host, port=5555):
-        """连接到服务器"""
-        import socket
-        import threading
-        
+        """连接到对方主机或对战服务器（game_server.py）（不阻塞，连接结果通过信号通知）"""
+        self.is_server = False
+        self.network_color = None
+        self.network_address = (host, port)
+        self.network.connect(host, port)
+    
+    def watch_game(self, host, port, room_id=0):
+        """连接对战服务器观看room_id房间的对局（0表示观众最多的对局）"""
+        self.is_server = False
+        self.network_color = None
+        self.watch_room = room_id
+        self.network_address = (host, port)
+        self.network.connect(host, port)
+    
+    def on_network_connected(self, peer):
+        """网络连接建立（界面线程）"""
+        self.is_connected = True
+        self.reconnect_attempts = 0
+        if self.is_server:
+            QMessageBox.information(self, "提示", f"已连接到客户端: {peer}")
+        elif self.session_token is not None:
+            # 掉线重连：只请求缺少的走法
+            self.network.send(protocol.MSG_RESUME,
+                              protocol.encode_resume(self.session_token, len(self.move_history), self.position.key))
+        elif self.watch_room is not None:
+            self.network.send(protocol.MSG_WATCH, protocol.encode_watch(self.watch_room))
+        else:
+            # 请求对方（主机或对战服务器）分配执子颜色
+            self.network.send(protocol.MSG_JOIN)
+            QMessageBox.information(self, "提示", f"已连接到服务器: {peer}，等待对手")
+    
+    def on_network_disconnected(self, reason):
+        """网络连接断开（界面线程）：对局或观战中的客户端自动重连"""
+        was_connected, self.is_connected = self.is_connected, False
+        if self.network is None:
+            return
+        if not self.is_server and self.network_address and (self.session_token or self.watch_room is not None):
+            self.schedule_reconnect()
+        elif was_connected:
+            if self.is_server and self.session_token:
+                reason += "，等待对方重连"
+            QMessageBox.information(self, "提示", reason)
+    
+    def on_network_error(self, message):
+        """网络错误（界面线程）"""
+        if self.reconnect_attempts:
+            self.schedule_reconnect()
+            return
+        QMessageBox.warning(self, "错误", message)
+    
+    def schedule_reconnect(self):
+        """稍后重新连接，多次失败后放弃"""
+        if self.reconnect_attempts >= RECONNECT_ATTEMPTS:
+            self.reconnect_attempts = 0
+            self.session_token = None
+            QMessageBox.information(self, "提示", "无法重新连接，对局已中断")
+            return
+        self.reconnect_attempts += 1
+        QTimer.singleShot(int(RECONNECT_DELAY * 1000), self.reconnect)
+    
+    def reconnect(self):
+        if self.network is not None and not self.is_connected:
+            self.network.connect(*self.network_address)
+    
+    def process_network_data(self, msg_type, seq, payload):
+        """处理对方发来的消息（界面线程）"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((host, port))
-            self.is_connected = True
-            self.is_server = False
-            
-            # 开始接收数据
-            self.receive_thread = threading.Thread(target=self.receive_data)
-            self.receive_thread.daemon = True
-            self.receive_thread.start()
-            
-            QMessageBox.information(self, "提示", f"已连接到服务器: {host}:{port}")
-        except Exception as e:
-            QMessageBox.warning(self, "错误", f"连接服务器失败: {str(e)}")
-    
-    def receive_data(self):
-        """接收数据"""
-        while self.is_connected:
-            try:
-                data = self.socket.recv(1024).decode('utf-8')
-                if data:
-                    self.process_network_data(data)
-            except Exception:
-                self.is_connected = False
-                break
+            if msg_type == protocol.MSG_MOVE:
+                self.apply_network_move(seq, protocol.decode_move(payload))
+            elif msg_type == protocol.MSG_JOIN:
+                self.answer_join()
+            elif msg_type == protocol.MSG_RESUME:
+                self.answer_resume(*protocol.decode_resume(payload))
+            elif msg_type == protocol.MSG_REJECT:
+                self.apply_network_reject(seq)
+            elif msg_type == protocol.MSG_START:
+                self.apply_network_start(*protocol.decode_start(payload))
+            elif msg_type == protocol.MSG_GAME_OVER:
+                self.apply_network_game_over(*protocol.decode_game_over(payload))
+            elif msg_type == protocol.MSG_SNAPSHOT:
+                self.apply_network_snapshot(*protocol.decode_snapshot(payload))
+            elif msg_type == protocol.MSG_ROOM_LIST:
+                self.show_room_list(protocol.decode_room_list(payload))
+            elif msg_type == protocol.MSG_SYNC:
+                self.apply_network_sync(protocol.decode_moves(payload))
+            elif msg_type == protocol.MSG_UNDO_REQUEST:
+                self.answer_undo_request()
+            elif msg_type == protocol.MSG_UNDO_REPLY:
+                self.apply_undo_reply(protocol.decode_flag(payload))
+            elif msg_type == protocol.MSG_RESIGN:
+                self.apply_network_resign()
+        except protocol.ProtocolError as e:
+            QMessageBox.warning(self, "错误", f"无法识别对方的消息: {e}")
+    
+    def answer_join(self):
+        """做主机时客户端请求开局：客户端执黑，并把当前棋局同步给它"""
+        if not self.is_server:
+            return
+        if self.session_token is not None:
+            # 对局还在进行，对手只能凭令牌RESUME，不能重新开局
+            return
+        self.session_token = secrets.token_bytes(protocol.TOKEN_SIZE)
+        self.network.set_session_token(self.session_token)
+        self.network.send(protocol.MSG_START, protocol.encode_start(0, "black", self.session_token))
+        self.network.send(protocol.MSG_SYNC, protocol.encode_moves(self.network_move_log()))
+    
+    def answer_resume(self, token, plies, key):
+        """做主机时客户端掉线重连：令牌正确时只补发它缺少的走法"""
+        if not self.is_server:
+            return
+        if self.session_token is None or token != self.session_token:
+            self.network.send(protocol.MSG_REJECT)
+            return
+        self.network.send(protocol.MSG_START, protocol.encode_start(0, "black", token))
+        for msg_type, payload, seq in catch_up_messages(self.position, 0, plies, key):
+            self.network.send(msg_type, payload, seq)
+    
+    def end_network_session(self):
+        """对局结束：作废会话令牌，之后不再恢复这一局，做主机时重新接受新的对手"""
+        if getattr(self, "network", None) is None:
+            return
+        self.session_token = None
+        if self.is_server:
+            self.network.set_session_token(None)
+    
+    def apply_network_reject(self, seq):
+        """走法被拒绝时随后会收到SYNC；序号为0表示重连的会话已失效"""
+        if seq == 0:
+            self.session_token = None
+            QMessageBox.information(self, "提示", "对局已结束，无法恢复")
+    
+    def apply_network_start(self, room_id, color, token):
+        """对方分配了执子颜色，开始新的一局；令牌与当前会话相同时是重连成功，继续原来的对局"""
+        self.network_color = color
+        if token == self.session_token:
+            return
+        self.session_token = token
+        self.init_board()
+        self.update_turn_label()
+        self.update()
+        QMessageBox.information(self, "提示", f"对局开始，本方执{'红' if color == 'red' else '黑'}")
+    
+    def apply_network_game_over(self, result, reason):
+        """对战服务器宣布对局结束
+
+        将死和循环裁决本方走棋时已经判定过；认输对局者会收到RESIGN，观战时才需要在这里处理；
+        掉线只能由服务器通知。
+        """
+        if reason != protocol.REASON_ABANDON and (reason != protocol.REASON_RESIGN or self.watch_room is None):
+            return
+        self.end_network_session()
+        winner = "红方" if result == protocol.RESULT_RED else "黑方" if result == protocol.RESULT_BLACK else ""
+        self.start_celebration()
+        if self.game_over_callback and winner:
+            self.game_over_callback(winner)
+        elif reason == protocol.REASON_RESIGN:
+            QMessageBox.information(self, "游戏结束", f"一方认输，{winner}获胜！")
+        else:
+            QMessageBox.information(self, "游戏结束", "对方已断开连接")
+        self.update()
     
-    def process_network_data(self, data):
-        """处理网络数据"""
-        # 数据格式：from_row,from_col,to_row,to_col
-        from_row, from_col, to_row, to_col = map(int, data.split(','))
+    def apply_network_move(self, seq, move):
+        """执行对方的走法"""
+        from_row, from_col, to_row, to_col = move_to_coords(move)
+        # 只接受轮到对方时、与本方棋局步数一致的合法走法
+        if self.current_player == self.network_color or seq != len(self.move_history) + 1 \
+                or not self.can_move(from_row, from_col, to_row, to_col):
+            if self.watch_room is not None:
+                # 观战时漏了走法，重新订阅以取得最新快照
+                self.network.send(protocol.MSG_WATCH, protocol.encode_watch(self.watch_room))
+            return
         
         # 执行移动
         self.move_piece(from_row, from_col, to_row, to_col)
         
-        # 检查游戏是否结束
+        # 切换玩家
+        self.switch_player()
+        
+        # 检查游戏是否结束（对方被将死或困毙）
         if self.is_game_over():
+            self.end_network_session()
             # 开始庆祝特效
             self.start_celebration()
             winner = self.get_winner()
@@ -1268,40 +1369,80 @@ class ChessBoard(QWidget):
                 QMessageBox.information(self, "游戏结束", f"{winner}获胜！")
             return
         
-        # 切换玩家
-        self.switch_player()
-        
-        # 重绘棋盘
+        # 循环走子时按规则裁决（走棋的重绘在move_piece中完成）
+        self.check_repetition()
+    
+    def network_move_log(self):
+        """从开局起的全部走法（整数走法列表）"""
+        return [coords_to_move(*entry[:4]) for entry in self.move_history]
+    
+    def apply_network_snapshot(self, room_id, fen, moves):
+        """收到房间快照（观战或重连时差得太多）：按走法记录重建棋局（保留走棋历史）"""
+        if self.network_color is None:
+            self.watch_room = room_id
+        self.apply_network_sync(moves)
+    
+    def show_room_list(self, rooms):
+        """观战的房间不存在时，服务器回复进行中的对局列表"""
+        if not rooms:
+            QMessageBox.information(self, "提示", "服务器上暂时没有进行中的对局")
+            return
+        lines = [f"房间{room_id}：已走{plies}步，{spectators}人观战" for room_id, plies, spectators in rooms[:20]]
+        QMessageBox.information(self, "提示", "找不到该房间，进行中的对局：\n" + "\n".join(lines))
+    
+    def apply_network_sync(self, moves):
+        """按对方发来的走法记录重建棋局"""
+        self.init_board()
+        for move in moves:
+            if not self.can_move(*move_to_coords(move)):
+                break
+            self.position.move_piece(*move_to_coords(move))
+            self.position.switch_player()
+        self.update_turn_label()
         self.update()
     
     def send_move(self, from_row, from_col, to_row, to_col):
-        """发送移动数据"""
+        """发送移动数据（在网络线程中异步写出，不阻塞界面）"""
         if self.is_connected:
-            data = f"{from_row},{from_col},{to_row},{to_col}"
-            self.socket.sendall(data.encode('utf-8'))
+            # 序号是这步棋的步数（走法已经记入历史）
+            self.network.send(protocol.MSG_MOVE, protocol.encode_move(coords_to_move(from_row, from_col, to_row, to_col)),
+                              len(self.move_history))
     
-    def is_game_over(self):
-        """检查游戏是否结束"""
-        # 检查是否有一方的将/帅被吃掉
-        red_jiang = False
-        black_jiang = False
-        
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece:
-                    if (piece["name"] == "将" or piece["name"] == "帅") and piece["color"] == "red":
-                        red_jiang = True
-                    elif (piece["name"] == "将" or piece["name"] == "帅") and piece["color"] == "black":
-                        black_jiang = True
-        
-        return not red_jiang or not black_jiang
+    def request_undo(self):
+        """请求对方同意悔棋，只能在本方刚走完、轮到对方时请求"""
+        if not self.is_connected or self.current_player == self.network_color or not self.move_history:
+            return False
+        self.network.send(protocol.MSG_UNDO_REQUEST)
+        return True
     
-    def get_winner(self):
-        """获取获胜者"""
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                piece = self.board[row][col]
-                if piece and (piece["name"] == "将" or piece["name"] == "帅"):
-                    return "红方" if piece["color"] == "red" else "黑方"
-        return ""
+    def answer_undo_request(self):
+        """询问是否同意对方悔棋，并把结果告诉对方"""
+        accept = bool(self.move_history) and self.current_player == self.network_color and QMessageBox.question(
+            self, "悔棋请求", "对方请求悔棋，是否同意？", QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes
+        if accept:
+            self.undo_move()
+        self.network.send(protocol.MSG_UNDO_REPLY, protocol.encode_flag(accept))
+    
+    def apply_undo_reply(self, accept):
+        """对方回复悔棋请求"""
+        if accept and self.current_player != self.network_color:
+            self.undo_move()
+        else:
+            QMessageBox.information(self, "提示", "对方不同意悔棋")
+    
+    def send_resign(self):
+        """告诉对方本方认输"""
+        if self.is_connected:
+            self.network.send(protocol.MSG_RESIGN)
+        self.end_network_session()
+    
+    def apply_network_resign(self):
+        """对方认输，本方获胜"""
+        self.end_network_session()
+        winner = "红方" if self.network_color == "red" else "黑方"
+        self.start_celebration()
+        if self.game_over_callback:
+            self.game_over_callback(winner)
+        else:
+            QMessageBox.information(self, "游戏结束", f"对方认输，{winner}获胜！")
+        self.update()
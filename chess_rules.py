@@ -0,0 +1,1028 @@
+"""中国象棋规则核心（不依赖Qt，可在无界面的进程中使用）
+
+棋盘用90格的bytearray表示，格子编号 sq = row * 9 + col，每格存一个小整数棋子编码：
+低3位是棋子类型，第4位表示黑方，0表示空格。另外为红黑双方各维护一个占位位棋盘
+（Python整数，第sq位为1表示该格有该方棋子），用于快速遍历己方棋子。
+界面仍使用字典棋盘，通过to_dict_board/from_dict_board互相转换。
+"""
+import random
+
+# 双方
+RED, BLACK = 0, 1
+COLOR_NAMES = ("red", "black")
+SIDE_OF = {"red": RED, "black": BLACK}
+
+# 棋子类型
+KING, ADVISOR, ELEPHANT, HORSE, ROOK, CANNON, PAWN = range(1, 8)
+BLACK_FLAG = 8
+
+# 棋子类型与界面显示名称的对应关系（双方使用相同的字）
+PIECE_NAMES = {
+    KING: "将", ADVISOR: "士", ELEPHANT: "象", HORSE: "馬",
+    ROOK: "車", CANNON: "炮", PAWN: "兵",
+}
+NAME_TO_TYPE = {
+    "将": KING, "帅": KING, "帥": KING, "將": KING,
+    "士": ADVISOR, "仕": ADVISOR,
+    "象": ELEPHANT, "相": ELEPHANT,
+    "馬": HORSE, "马": HORSE,
+    "車": ROOK, "车": ROOK,
+    "炮": CANNON, "砲": CANNON,
+    "兵": PAWN, "卒": PAWN,
+}
+
+
+# 棋子价值表（按棋子类型）
+PIECE_VALUES = {
+    KING: 1000, ROOK: 100, HORSE: 50, ELEPHANT: 20, ADVISOR: 20, CANNON: 50, PAWN: 10
+}
+
+# 没有将/帅时的格子编号
+NO_SQUARE = -1
+
+# 同一局面第几次出现时按循环规则裁决
+REPETITION_LIMIT = 3
+
+# FEN中的棋子字母（红方大写、黑方小写），读入时也接受E/H表示象和马
+FEN_LETTERS = {
+    KING: "k", ADVISOR: "a", ELEPHANT: "b", HORSE: "n", ROOK: "r", CANNON: "c", PAWN: "p",
+}
+FEN_TO_TYPE = dict((letter, piece_type) for piece_type, letter in FEN_LETTERS.items())
+FEN_TO_TYPE.update({"e": ELEPHANT, "h": HORSE})
+
+# 开局局面的FEN
+START_FEN = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w"
+
+
+def make_piece(piece_type, side):
+    """由棋子类型和所属方得到棋子编码"""
+    return piece_type | (BLACK_FLAG if side == BLACK else 0)
+
+
+def piece_type(code):
+    """棋子编码对应的类型"""
+    return code & 7
+
+
+def piece_side(code):
+    """棋子编码对应的所属方"""
+    return code >> 3
+
+
+def piece_color(code):
+    """棋子编码对应的颜色名称（"red"/"black"）"""
+    return COLOR_NAMES[code >> 3]
+
+
+def square(row, col):
+    """行列坐标转换为格子编号"""
+    return row * 9 + col
+
+
+def encode_move(from_sq, to_sq):
+    """把一步棋编码为整数"""
+    return (from_sq << 8) | to_sq
+
+
+def move_to_coords(move):
+    """整数走法转换为(from_row, from_col, to_row, to_col)"""
+    from_row, from_col = divmod(move >> 8, 9)
+    to_row, to_col = divmod(move & 0xFF, 9)
+    return from_row, from_col, to_row, to_col
+
+
+def coords_to_move(from_row, from_col, to_row, to_col):
+    """(from_row, from_col, to_row, to_col)转换为整数走法"""
+    return encode_move(from_row * 9 + from_col, to_row * 9 + to_col)
+
+
+# ---------------------------------------------------------------------------
+# 预计算的走法表：只包含各棋子在每个格子上真正可能到达的点
+# ---------------------------------------------------------------------------
+
+def _on_board(row, col):
+    return 0 <= row < 10 and 0 <= col < 9
+
+
+def _in_palace(side, row, col):
+    if not 3 <= col <= 5:
+        return False
+    return 7 <= row <= 9 if side == RED else 0 <= row <= 2
+
+
+def _own_half(side, row):
+    return row >= 5 if side == RED else row <= 4
+
+
+def _build_tables():
+    king_moves = ([], [])
+    advisor_moves = ([], [])
+    elephant_moves = ([], [])
+    pawn_moves = ([], [])
+    horse_moves = []
+    rays = []
+    for sq in range(90):
+        row, col = divmod(sq, 9)
+
+        for side in (RED, BLACK):
+            king_moves[side].append([
+                square(row + d_row, col + d_col)
+                for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                if _in_palace(side, row + d_row, col + d_col)
+            ])
+            advisor_moves[side].append([
+                square(row + d_row, col + d_col)
+                for d_row, d_col in ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                if _in_palace(side, row + d_row, col + d_col)
+            ])
+            # 象：(象眼, 目标)
+            elephant_moves[side].append([
+                (square(row + d_row // 2, col + d_col // 2), square(row + d_row, col + d_col))
+                for d_row, d_col in ((-2, -2), (-2, 2), (2, -2), (2, 2))
+                if _on_board(row + d_row, col + d_col) and _own_half(side, row + d_row)
+            ])
+            # 兵：向前一步，过河后可左右一步
+            direction = -1 if side == RED else 1
+            targets = [(row + direction, col)]
+            if not _own_half(side, row):
+                targets += [(row, col - 1), (row, col + 1)]
+            pawn_moves[side].append([square(r, c) for r, c in targets if _on_board(r, c)])
+
+        # 马：(马腿, 目标)
+        horse = []
+        for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            leg_row, leg_col = row + d_row, col + d_col
+            if not _on_board(leg_row, leg_col):
+                continue
+            if d_row:
+                targets = ((leg_row + d_row, col - 1), (leg_row + d_row, col + 1))
+            else:
+                targets = ((row - 1, leg_col + d_col), (row + 1, leg_col + d_col))
+            for to_row, to_col in targets:
+                if _on_board(to_row, to_col):
+                    horse.append((square(leg_row, leg_col), square(to_row, to_col)))
+        horse_moves.append(horse)
+
+        # 车/炮：四条射线，由近到远
+        sq_rays = []
+        for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            ray = []
+            r, c = row + d_row, col + d_col
+            while _on_board(r, c):
+                ray.append(square(r, c))
+                r += d_row
+                c += d_col
+            if ray:
+                sq_rays.append(ray)
+        rays.append(sq_rays)
+
+    return king_moves, advisor_moves, elephant_moves, pawn_moves, horse_moves, rays
+
+
+KING_MOVES, ADVISOR_MOVES, ELEPHANT_MOVES, PAWN_MOVES, HORSE_MOVES, RAYS = _build_tables()
+
+
+def _build_attack_tables():
+    """把走法表反过来：对每个目标格，列出能走到它的马/兵/士/象所在格"""
+    horse_attackers = [[] for _ in range(90)]
+    pawn_attackers = ([[] for _ in range(90)], [[] for _ in range(90)])
+    advisor_attackers = ([[] for _ in range(90)], [[] for _ in range(90)])
+    elephant_attackers = ([[] for _ in range(90)], [[] for _ in range(90)])
+    for sq in range(90):
+        for leg, to_sq in HORSE_MOVES[sq]:
+            horse_attackers[to_sq].append((leg, sq))
+        for side in (RED, BLACK):
+            for to_sq in PAWN_MOVES[side][sq]:
+                pawn_attackers[side][to_sq].append(sq)
+            for to_sq in ADVISOR_MOVES[side][sq]:
+                advisor_attackers[side][to_sq].append(sq)
+            for eye, to_sq in ELEPHANT_MOVES[side][sq]:
+                elephant_attackers[side][to_sq].append((eye, sq))
+    return horse_attackers, pawn_attackers, advisor_attackers, elephant_attackers
+
+
+HORSE_ATTACKERS, PAWN_ATTACKERS, ADVISOR_ATTACKERS, ELEPHANT_ATTACKERS = _build_attack_tables()
+
+
+def _build_zobrist_keys():
+    """生成Zobrist随机数（固定种子，保证不同进程、开局库文件中的局面键一致）"""
+    rng = random.Random(0x5A0B157)
+    piece_keys = [[rng.getrandbits(64) for _ in range(90)] for _ in range(16)]
+    return piece_keys, rng.getrandbits(64)
+
+
+# ZOBRIST_PIECES[棋子编码][格子]，黑方走棋时再异或ZOBRIST_SIDE
+ZOBRIST_PIECES, ZOBRIST_SIDE = _build_zobrist_keys()
+
+
+# ---------------------------------------------------------------------------
+# 评估表：子力加位置分（红方视角，第0行是对方底线），分中局/残局两套，按局面阶段插值
+# ---------------------------------------------------------------------------
+
+# 中局/残局的子力价值（兵的价值主要体现在位置分里）
+MATERIAL_MG = {KING: 0, ADVISOR: 20, ELEPHANT: 20, HORSE: 48, ROOK: 100, CANNON: 52, PAWN: 10}
+MATERIAL_EG = {KING: 0, ADVISOR: 16, ELEPHANT: 16, HORSE: 54, ROOK: 100, CANNON: 46, PAWN: 14}
+
+# 局面阶段：车马炮越多越接近中局，全部在场时为PHASE_MAX
+PHASE_WEIGHTS = {KING: 0, ADVISOR: 0, ELEPHANT: 0, HORSE: 2, ROOK: 4, CANNON: 2, PAWN: 0}
+PHASE_MAX = 32
+
+# 兵：过河后越接近九宫越好，底线的兵作用很小
+_PAWN_MG = (
+    0, 0, 0, 1, 2, 1, 0, 0, 0,
+    9, 12, 14, 17, 18, 17, 14, 12, 9,
+    8, 11, 13, 15, 16, 15, 13, 11, 8,
+    7, 9, 11, 13, 14, 13, 11, 9, 7,
+    4, 6, 8, 10, 11, 10, 8, 6, 4,
+    0, 0, 1, 0, 3, 0, 1, 0, 0,
+    0, 0, -1, 0, 2, 0, -1, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+)
+_PAWN_EG = (
+    2, 3, 4, 5, 6, 5, 4, 3, 2,
+    12, 15, 17, 20, 21, 20, 17, 15, 12,
+    11, 14, 16, 18, 19, 18, 16, 14, 11,
+    10, 12, 14, 16, 17, 16, 14, 12, 10,
+    7, 9, 11, 13, 14, 13, 11, 9, 7,
+    0, 0, 1, 0, 3, 0, 1, 0, 0,
+    0, 0, 0, 0, 2, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+)
+# 马：居中、靠近对方九宫好，边线和窝心马差
+_HORSE = (
+    0, -2, 2, 0, -2, 0, 2, -2, 0,
+    0, 2, 4, 6, 2, 6, 4, 2, 0,
+    2, 4, 6, 8, 6, 8, 6, 4, 2,
+    2, 6, 8, 9, 9, 9, 8, 6, 2,
+    2, 5, 7, 8, 8, 8, 7, 5, 2,
+    1, 4, 6, 7, 7, 7, 6, 4, 1,
+    0, 2, 4, 5, 6, 5, 4, 2, 0,
+    0, 1, 3, 3, 2, 3, 3, 1, 0,
+    -2, 0, 1, 2, -4, 2, 1, 0, -2,
+    -3, -2, 0, -1, -2, -1, 0, -2, -3,
+)
+# 车：出动、占肋道和对方卒林线好
+_ROOK = (
+    6, 8, 7, 13, 14, 13, 7, 8, 6,
+    6, 10, 8, 12, 12, 12, 8, 10, 6,
+    6, 8, 7, 10, 12, 10, 7, 8, 6,
+    6, 9, 9, 11, 12, 11, 9, 9, 6,
+    7, 10, 10, 11, 12, 11, 10, 10, 7,
+    6, 8, 8, 9, 10, 9, 8, 8, 6,
+    4, 6, 4, 8, 8, 8, 4, 6, 4,
+    2, 4, 3, 6, 4, 6, 3, 4, 2,
+    3, 6, 4, 6, 0, 6, 4, 6, 3,
+    -3, 4, 2, 6, 0, 6, 2, 4, -3,
+)
+# 炮：中炮和沉底炮好，贴着对方九宫正面反而容易被捉
+_CANNON = (
+    3, 3, 0, -3, -4, -3, 0, 3, 3,
+    2, 2, 0, -2, -6, -2, 0, 2, 2,
+    1, 1, 0, -3, -4, -3, 0, 1, 1,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    -1, 0, 2, 0, 3, 0, 2, 0, -1,
+    0, 0, 0, 0, 3, 0, 0, 0, 0,
+    -1, 0, 2, 0, 3, 0, 2, 0, -1,
+    0, 1, 2, 2, 4, 2, 2, 1, 0,
+    0, 0, 1, 2, 3, 2, 1, 0, 0,
+    0, 0, 1, 3, 3, 3, 1, 0, 0,
+)
+
+
+def _palace_table(values):
+    """由{(行, 列): 分}生成只在己方一侧有值的位置表"""
+    table = [0] * 90
+    for (row, col), value in values.items():
+        table[square(row, col)] = value
+    return tuple(table)
+
+
+# 九宫安全：中局将/帅留在底线、士象守在中路；残局将/帅可以离开底线参与进攻
+_KING_MG = _palace_table({(7, 3): -8, (7, 4): -8, (7, 5): -8, (8, 3): -4, (8, 4): -3, (8, 5): -4,
+                          (9, 3): 1, (9, 4): 2, (9, 5): 1})
+_KING_EG = _palace_table({(7, 3): -1, (7, 4): 0, (7, 5): -1, (8, 3): 0, (8, 4): 2, (8, 5): 0,
+                          (9, 3): 0, (9, 4): 1, (9, 5): 0})
+_ADVISOR = _palace_table({(7, 3): -1, (7, 5): -1, (8, 4): 3, (9, 3): 0, (9, 5): 0})
+_ELEPHANT = _palace_table({(5, 2): -1, (5, 6): -1, (7, 0): -2, (7, 4): 3, (7, 8): -2, (9, 2): 0, (9, 6): 0})
+
+_PIECE_SQUARE_TABLES = {
+    KING: (_KING_MG, _KING_EG),
+    ADVISOR: (_ADVISOR, _ADVISOR),
+    ELEPHANT: (_ELEPHANT, _ELEPHANT),
+    HORSE: (_HORSE, _HORSE),
+    ROOK: (_ROOK, _ROOK),
+    CANNON: (_CANNON, _CANNON),
+    PAWN: (_PAWN_MG, _PAWN_EG),
+}
+
+
+def _build_eval_tables():
+    """按棋子编码展开评估表（已含子力价值），黑方使用上下翻转后的表"""
+    mg_tables = [None] * 16
+    eg_tables = [None] * 16
+    for piece_type, (mg, eg) in _PIECE_SQUARE_TABLES.items():
+        for side in (RED, BLACK):
+            code = make_piece(piece_type, side)
+            mg_row = []
+            eg_row = []
+            for sq in range(90):
+                row, col = divmod(sq, 9)
+                table_sq = sq if side == RED else square(9 - row, col)
+                mg_row.append(MATERIAL_MG[piece_type] + mg[table_sq])
+                eg_row.append(MATERIAL_EG[piece_type] + eg[table_sq])
+            mg_tables[code] = mg_row
+            eg_tables[code] = eg_row
+    return mg_tables, eg_tables
+
+
+# EVAL_MG/EVAL_EG[棋子编码][格子]
+EVAL_MG, EVAL_EG = _build_eval_tables()
+PHASE_BY_CODE = [PHASE_WEIGHTS.get(code & 7, 0) for code in range(16)]
+
+
+def iter_squares(bitboard):
+    """遍历位棋盘中所有为1的格子编号"""
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+class Position:
+    """棋局状态：紧凑棋盘、占位位棋盘、当前出棋方和走棋历史
+
+    除棋盘外还增量维护双方将/帅的位置、每种棋子的位棋盘（棋子列表）、双方子力总值、
+    中局/残局评估分、局面阶段和64位Zobrist局面键（key），make_move/unmake_move只更新
+    变化的部分，不需要扫描整个棋盘。
+    """
+
+    def __init__(self):
+        self.board_size = 9  # 9列
+        self.row_count = 10  # 10行
+        self._clear()
+        self.move_history = []  # (from_row, from_col, to_row, to_col, captured_piece)
+        self.init_pieces()
+
+    def _clear(self):
+        """清空棋盘和增量维护的状态"""
+        self.squares = bytearray(90)
+        self.occupancy = [0, 0]  # 红、黑双方的占位位棋盘
+        self.piece_bitboards = [0] * 16  # 按棋子编码的位棋盘
+        self.king_sq = [NO_SQUARE, NO_SQUARE]  # 双方将/帅所在格
+        self.material = [0, 0]  # 双方子力总值
+        self.eval_mg = [0, 0]  # 双方中局评估分（子力加位置分）
+        self.eval_eg = [0, 0]  # 双方残局评估分
+        self.phase = 0  # 局面阶段，PHASE_MAX为中局，0为残局
+        self.key = 0  # Zobrist局面键
+        self.side = RED
+        self.key_history = []  # 每步棋走之前的局面键，与move_history一一对应
+        self.key_counts = {}  # 局面键在key_history中出现的次数
+
+    def init_pieces(self):
+        """初始化棋子位置"""
+        # 红方棋子（放在棋盘下方）
+        red_pieces = [
+            ("車", 9, 0), ("馬", 9, 1), ("象", 9, 2), ("士", 9, 3), ("将", 9, 4), ("士", 9, 5), ("象", 9, 6), ("馬", 9, 7), ("車", 9, 8),
+            ("炮", 7, 1), ("炮", 7, 7),
+            ("兵", 6, 0), ("兵", 6, 2), ("兵", 6, 4), ("兵", 6, 6), ("兵", 6, 8)
+        ]
+
+        # 黑方棋子（放在棋盘上方，与红方对称）
+        black_pieces = [
+            ("車", 0, 0), ("馬", 0, 1), ("象", 0, 2), ("士", 0, 3), ("将", 0, 4), ("士", 0, 5), ("象", 0, 6), ("馬", 0, 7), ("車", 0, 8),
+            ("炮", 2, 1), ("炮", 2, 7),
+            ("兵", 3, 0), ("兵", 3, 2), ("兵", 3, 4), ("兵", 3, 6), ("兵", 3, 8)
+        ]
+
+        for name, row, col in red_pieces:
+            self.put_piece(square(row, col), make_piece(NAME_TO_TYPE[name], RED))
+
+        for name, row, col in black_pieces:
+            self.put_piece(square(row, col), make_piece(NAME_TO_TYPE[name], BLACK))
+
+    @property
+    def current_player(self):
+        """当前出棋方（"red"/"black"）"""
+        return COLOR_NAMES[self.side]
+
+    @current_player.setter
+    def current_player(self, color):
+        if SIDE_OF[color] != self.side:
+            self.switch_player()
+
+    def copy(self):
+        """复制棋局"""
+        position = Position.__new__(Position)
+        position.board_size = self.board_size
+        position.row_count = self.row_count
+        position.squares = bytearray(self.squares)
+        position.occupancy = list(self.occupancy)
+        position.piece_bitboards = list(self.piece_bitboards)
+        position.king_sq = list(self.king_sq)
+        position.material = list(self.material)
+        position.eval_mg = list(self.eval_mg)
+        position.eval_eg = list(self.eval_eg)
+        position.phase = self.phase
+        position.key = self.key
+        position.side = self.side
+        position.move_history = list(self.move_history)
+        position.key_history = list(self.key_history)
+        position.key_counts = dict(self.key_counts)
+        return position
+
+    def put_piece(self, sq, code):
+        """在空格上放置棋子"""
+        side = code >> 3
+        self.squares[sq] = code
+        self.occupancy[side] |= 1 << sq
+        self.piece_bitboards[code] |= 1 << sq
+        self.material[side] += PIECE_VALUES[code & 7]
+        self.eval_mg[side] += EVAL_MG[code][sq]
+        self.eval_eg[side] += EVAL_EG[code][sq]
+        self.phase += PHASE_BY_CODE[code]
+        self.key ^= ZOBRIST_PIECES[code][sq]
+        if code & 7 == KING:
+            self.king_sq[side] = sq
+
+    def piece_at(self, row, col):
+        """指定位置的棋子编码，空格为0"""
+        return self.squares[row * 9 + col]
+
+    def _do_move(self, from_sq, to_sq):
+        """在棋盘上执行一步棋并增量更新状态，返回被吃掉的棋子编码（不切换出棋方）"""
+        squares = self.squares
+        piece = squares[from_sq]
+        captured = squares[to_sq]
+        side = piece >> 3
+        move_mask = (1 << from_sq) | (1 << to_sq)
+        self.occupancy[side] ^= move_mask
+        self.piece_bitboards[piece] ^= move_mask
+        piece_keys = ZOBRIST_PIECES[piece]
+        self.key ^= piece_keys[from_sq] ^ piece_keys[to_sq]
+        mg = EVAL_MG[piece]
+        eg = EVAL_EG[piece]
+        self.eval_mg[side] += mg[to_sq] - mg[from_sq]
+        self.eval_eg[side] += eg[to_sq] - eg[from_sq]
+        if captured:
+            capture_mask = 1 << to_sq
+            self.occupancy[side ^ 1] ^= capture_mask
+            self.piece_bitboards[captured] ^= capture_mask
+            self.material[side ^ 1] -= PIECE_VALUES[captured & 7]
+            self.eval_mg[side ^ 1] -= EVAL_MG[captured][to_sq]
+            self.eval_eg[side ^ 1] -= EVAL_EG[captured][to_sq]
+            self.phase -= PHASE_BY_CODE[captured]
+            self.key ^= ZOBRIST_PIECES[captured][to_sq]
+            if captured & 7 == KING:
+                self.king_sq[side ^ 1] = NO_SQUARE
+        if piece & 7 == KING:
+            self.king_sq[side] = to_sq
+        squares[to_sq] = piece
+        squares[from_sq] = 0
+        return captured
+
+    def _undo(self, from_sq, to_sq, captured):
+        """撤销_do_move"""
+        squares = self.squares
+        piece = squares[to_sq]
+        side = piece >> 3
+        move_mask = (1 << from_sq) | (1 << to_sq)
+        self.occupancy[side] ^= move_mask
+        self.piece_bitboards[piece] ^= move_mask
+        piece_keys = ZOBRIST_PIECES[piece]
+        self.key ^= piece_keys[from_sq] ^ piece_keys[to_sq]
+        mg = EVAL_MG[piece]
+        eg = EVAL_EG[piece]
+        self.eval_mg[side] -= mg[to_sq] - mg[from_sq]
+        self.eval_eg[side] -= eg[to_sq] - eg[from_sq]
+        if captured:
+            capture_mask = 1 << to_sq
+            self.occupancy[side ^ 1] |= capture_mask
+            self.piece_bitboards[captured] |= capture_mask
+            self.material[side ^ 1] += PIECE_VALUES[captured & 7]
+            self.eval_mg[side ^ 1] += EVAL_MG[captured][to_sq]
+            self.eval_eg[side ^ 1] += EVAL_EG[captured][to_sq]
+            self.phase += PHASE_BY_CODE[captured]
+            self.key ^= ZOBRIST_PIECES[captured][to_sq]
+            if captured & 7 == KING:
+                self.king_sq[side ^ 1] = to_sq
+        if piece & 7 == KING:
+            self.king_sq[side] = from_sq
+        squares[from_sq] = piece
+        squares[to_sq] = captured
+
+    def make_move(self, move):
+        """执行整数走法并切换出棋方，返回被吃掉的棋子编码，供unmake_move恢复"""
+        captured = self._do_move(move >> 8, move & 0xFF)
+        self.side ^= 1
+        self.key ^= ZOBRIST_SIDE
+        return captured
+
+    def unmake_move(self, move, captured):
+        """撤销make_move"""
+        self.side ^= 1
+        self.key ^= ZOBRIST_SIDE
+        self._undo(move >> 8, move & 0xFF, captured)
+
+    def move_piece(self, from_row, from_col, to_row, to_col):
+        """移动棋子并记录历史，返回被吃掉的棋子编码（不切换出棋方）"""
+        self.key_history.append(self.key)
+        self.key_counts[self.key] = self.key_counts.get(self.key, 0) + 1
+        captured_piece = self._do_move(square(from_row, from_col), square(to_row, to_col))
+        self.move_history.append((from_row, from_col, to_row, to_col, captured_piece))
+        return captured_piece
+
+    def undo_move(self):
+        """撤销上一步并切换回出棋方，没有历史时返回False"""
+        if not self.move_history:
+            return False
+
+        from_row, from_col, to_row, to_col, captured_piece = self.move_history.pop()
+        self._undo(square(from_row, from_col), square(to_row, to_col), captured_piece)
+        self.switch_player()
+        key = self.key_history.pop()
+        if self.key_counts[key] == 1:
+            del self.key_counts[key]
+        else:
+            self.key_counts[key] -= 1
+        return True
+
+    def repetition_count(self):
+        """当前局面在之前的对局中出现过的次数（O(1)）"""
+        return self.key_counts.get(self.key, 0)
+
+    def evaluate(self, side=None):
+        """静态评估：side一方（默认当前出棋方）与对方的分差，按局面阶段在中局/残局分之间插值"""
+        if side is None:
+            side = self.side
+        phase = min(self.phase, PHASE_MAX)
+        mg = self.eval_mg[side] - self.eval_mg[side ^ 1]
+        eg = self.eval_eg[side] - self.eval_eg[side ^ 1]
+        return (mg * phase + eg * (PHASE_MAX - phase)) // PHASE_MAX
+
+    def switch_player(self):
+        """切换出棋方"""
+        self.side ^= 1
+        self.key ^= ZOBRIST_SIDE
+
+    def to_dict_board(self):
+        """转换为界面使用的字典棋盘"""
+        board = [[None for _ in range(self.board_size)] for _ in range(self.row_count)]
+        for sq in iter_squares(self.occupancy[RED] | self.occupancy[BLACK]):
+            code = self.squares[sq]
+            row, col = divmod(sq, 9)
+            board[row][col] = {"name": PIECE_NAMES[code & 7], "color": COLOR_NAMES[code >> 3], "row": row, "col": col}
+        return board
+
+    @classmethod
+    def from_dict_board(cls, board, current_player="red"):
+        """由字典棋盘创建棋局"""
+        position = cls.__new__(cls)
+        position.board_size = 9
+        position.row_count = 10
+        position._clear()
+        position.current_player = current_player
+        position.move_history = []
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece:
+                    position.put_piece(square(row, col), make_piece(NAME_TO_TYPE[piece["name"]], SIDE_OF[piece["color"]]))
+        return position
+
+    def to_fen(self):
+        """转换为FEN字符串（第一段从黑方底线开始，w/b表示红/黑方走棋）"""
+        rows = []
+        for row in range(10):
+            text = ""
+            empty = 0
+            for col in range(9):
+                code = self.squares[row * 9 + col]
+                if not code:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[code & 7]
+                text += letter if code >> 3 == BLACK else letter.upper()
+            if empty:
+                text += str(empty)
+            rows.append(text)
+        return "/".join(rows) + (" w" if self.side == RED else " b")
+
+    @classmethod
+    def from_fen(cls, fen):
+        """由FEN字符串创建棋局，只使用棋盘和走棋方两段，格式错误时抛出ValueError"""
+        fields = fen.split()
+        if not fields:
+            raise ValueError(f"FEN为空: {fen!r}")
+        rows = fields[0].split("/")
+        if len(rows) != 10:
+            raise ValueError(f"FEN应有10行: {fen!r}")
+
+        position = cls.__new__(cls)
+        position.board_size = 9
+        position.row_count = 10
+        position._clear()
+        position.move_history = []
+        for row, text in enumerate(rows):
+            col = 0
+            for char in text:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                if char.lower() not in FEN_TO_TYPE or col >= 9:
+                    raise ValueError(f"FEN第{row + 1}行有误: {text!r}")
+                side = RED if char.isupper() else BLACK
+                position.put_piece(square(row, col), make_piece(FEN_TO_TYPE[char.lower()], side))
+                col += 1
+            if col != 9:
+                raise ValueError(f"FEN第{row + 1}行有误: {text!r}")
+
+        if len(fields) > 1 and fields[1] == "b":
+            position.switch_player()
+        return position
+
+
+class Rules:
+    """走法规则和局面判断，作用于一个Position"""
+
+    # 棋子价值表（按棋子类型）
+    piece_values = PIECE_VALUES
+
+    def __init__(self, position):
+        self.position = position
+
+    def can_move(self, from_row, from_col, to_row, to_col):
+        """检查棋子是否可以移动到目标位置（符合走法规则，且走后己方将/帅不被攻击、不与对方将帅对脸）"""
+        from_sq = square(from_row, from_col)
+        code = self.position.squares[from_sq]
+        if not code:
+            return False
+
+        moves = []
+        self.move_generators[code & 7](self, from_sq, code >> 3, moves)
+        move = encode_move(from_sq, square(to_row, to_col))
+        return move in moves and self.is_move_safe(move, code >> 3)
+
+    def is_move_safe(self, move, side):
+        """走完move后side一方的将/帅不被攻击（包括将帅对脸）"""
+        position = self.position
+        from_sq, to_sq = move >> 8, move & 0xFF
+        captured = position._do_move(from_sq, to_sq)
+        king_sq = position.king_sq[side]
+        safe = king_sq != NO_SQUARE and not self.is_square_attacked(king_sq, side ^ 1)
+        position._undo(from_sq, to_sq, captured)
+        return safe
+
+    def check_masks(self, side):
+        """找出side一方可能让自己被将军的走法，返回(起点位棋盘, 终点位棋盘)，被将军时返回None
+
+        不在被将军时，只有以下走法可能送将：将/帅自己走；离开车/将帅对脸的牵制线；
+        离开对方炮和将/帅之间的两个炮架之一；离开对方马的马腿；走进对方炮和将/帅之间
+        （成为炮架）。起点或终点落在返回的位棋盘里的走法需要走一步再检查，其余走法一定合法。
+        """
+        position = self.position
+        king_sq = position.king_sq[side]
+        if king_sq == NO_SQUARE or self.is_square_attacked(king_sq, side ^ 1):
+            return None
+
+        squares = position.squares
+        enemy = side ^ 1
+        rook = make_piece(ROOK, enemy)
+        cannon = make_piece(CANNON, enemy)
+        king = make_piece(KING, enemy)
+        from_mask = 1 << king_sq
+        to_mask = 0
+        for ray in RAYS[king_sq]:
+            blockers = []
+            empty_mask = 0
+            for ray_sq in ray:
+                piece = squares[ray_sq]
+                if not piece:
+                    if not blockers:
+                        empty_mask |= 1 << ray_sq
+                    continue
+                blockers.append(ray_sq)
+                count = len(blockers)
+                if count == 1 and piece == cannon:
+                    # 对方炮直接对着将/帅：走进中间就成了炮架
+                    to_mask |= empty_mask
+                elif count == 2 and (piece == rook or (piece == king and ray_sq % 9 == king_sq % 9)):
+                    from_mask |= 1 << blockers[0]
+                elif count == 3 and piece == cannon:
+                    from_mask |= (1 << blockers[0]) | (1 << blockers[1])
+                if count == 3:
+                    break
+
+        horse = make_piece(HORSE, enemy)
+        if position.piece_bitboards[horse]:
+            for leg, horse_sq in HORSE_ATTACKERS[king_sq]:
+                if squares[horse_sq] == horse and squares[leg]:
+                    from_mask |= 1 << leg
+
+        return from_mask, to_mask
+
+    def legal_moves(self, side):
+        """side一方的全部合法走法（整数走法列表）
+
+        先用check_masks找出可能送将的走法，只对这些走法走一步再检查，其余走法直接保留。
+        """
+        moves = self.generate_side_moves(side)
+        masks = self.check_masks(side)
+        if masks is None:
+            return [move for move in moves if self.is_move_safe(move, side)]
+        from_mask, to_mask = masks
+        return [
+            move for move in moves
+            if not ((from_mask >> (move >> 8)) & 1 or (to_mask >> (move & 0xFF)) & 1) or self.is_move_safe(move, side)
+        ]
+
+    def has_legal_move(self, side):
+        """side一方是否还有合法走法（找到一步就返回）"""
+        masks = self.check_masks(side)
+        from_mask, to_mask = masks if masks is not None else (-1, -1)
+        for move in self.generate_side_moves(side):
+            if not ((from_mask >> (move >> 8)) & 1 or (to_mask >> (move & 0xFF)) & 1) or self.is_move_safe(move, side):
+                return True
+        return False
+
+    def generate_moves(self, color):
+        """生成指定颜色的所有伪合法走法，返回整数走法列表
+
+        只遍历各棋子真正能到达的射线、马腿、象眼和九宫点，不再对90个格子逐一调用can_move。
+        """
+        return self.generate_side_moves(SIDE_OF[color])
+
+    def generate_side_moves(self, side):
+        """与generate_moves相同，但直接使用RED/BLACK表示所属方，供搜索使用"""
+        squares = self.position.squares
+        generators = self.move_generators
+        moves = []
+        for sq in iter_squares(self.position.occupancy[side]):
+            generators[squares[sq] & 7](self, sq, side, moves)
+        return moves
+
+    def _gen_steps(self, sq, side, targets, moves):
+        """走到目标格（空格或对方棋子）"""
+        squares = self.position.squares
+        for to_sq in targets:
+            target = squares[to_sq]
+            if not target or target >> 3 != side:
+                moves.append((sq << 8) | to_sq)
+
+    def _gen_jiang(self, sq, side, moves):
+        """将/帅：九宫内直走一步"""
+        self._gen_steps(sq, side, KING_MOVES[side][sq], moves)
+
+    def _gen_shi(self, sq, side, moves):
+        """士：九宫内斜走一步"""
+        self._gen_steps(sq, side, ADVISOR_MOVES[side][sq], moves)
+
+    def _gen_xiang(self, sq, side, moves):
+        """象/相：走田字，不能过河，象眼被塞不能走"""
+        squares = self.position.squares
+        for eye, to_sq in ELEPHANT_MOVES[side][sq]:
+            if not squares[eye]:
+                target = squares[to_sq]
+                if not target or target >> 3 != side:
+                    moves.append((sq << 8) | to_sq)
+
+    def _gen_ma(self, sq, side, moves):
+        """马：马腿被绊不能走"""
+        squares = self.position.squares
+        for leg, to_sq in HORSE_MOVES[sq]:
+            if not squares[leg]:
+                target = squares[to_sq]
+                if not target or target >> 3 != side:
+                    moves.append((sq << 8) | to_sq)
+
+    def _gen_ju(self, sq, side, moves):
+        """车：沿四条射线走到第一个棋子为止"""
+        squares = self.position.squares
+        for ray in RAYS[sq]:
+            for to_sq in ray:
+                target = squares[to_sq]
+                if target:
+                    if target >> 3 != side:
+                        moves.append((sq << 8) | to_sq)
+                    break
+                moves.append((sq << 8) | to_sq)
+
+    def _gen_pao(self, sq, side, moves):
+        """炮：空格直走，隔一个炮架吃子"""
+        squares = self.position.squares
+        for ray in RAYS[sq]:
+            screened = False
+            for to_sq in ray:
+                target = squares[to_sq]
+                if not screened:
+                    if target:
+                        screened = True
+                    else:
+                        moves.append((sq << 8) | to_sq)
+                elif target:
+                    if target >> 3 != side:
+                        moves.append((sq << 8) | to_sq)
+                    break
+
+    def _gen_bing(self, sq, side, moves):
+        """兵/卒：向前一步，过河后可左右一步"""
+        self._gen_steps(sq, side, PAWN_MOVES[side][sq], moves)
+
+    # 棋子类型到走法生成函数的映射
+    move_generators = {
+        KING: _gen_jiang,
+        ADVISOR: _gen_shi,
+        ELEPHANT: _gen_xiang,
+        HORSE: _gen_ma,
+        ROOK: _gen_ju,
+        CANNON: _gen_pao,
+        PAWN: _gen_bing,
+    }
+
+    def find_jiang(self, color):
+        """指定颜色将/帅的格子编号（增量维护），不存在时返回None"""
+        sq = self.position.king_sq[SIDE_OF[color]]
+        return None if sq == NO_SQUARE else sq
+
+    def is_square_attacked(self, sq, by_side):
+        """检查格子是否被by_side一方攻击
+
+        只沿车/炮射线查找第一、二个棋子，再查看马、兵、士、象能到达该格的几个点，
+        代价与射线长度相当，而不是遍历所有对方棋子的走法。
+        """
+        position = self.position
+        squares = position.squares
+        rook = make_piece(ROOK, by_side)
+        cannon = make_piece(CANNON, by_side)
+        king = make_piece(KING, by_side)
+        target_is_king = squares[sq] & 7 == KING
+
+        # 车、炮以及将帅对脸（沿射线）
+        for ray in RAYS[sq]:
+            screened = False
+            for ray_sq in ray:
+                piece = squares[ray_sq]
+                if not piece:
+                    continue
+                if not screened:
+                    if piece == rook:
+                        return True
+                    if piece == king and target_is_king and ray_sq % 9 == sq % 9:
+                        return True
+                    screened = True
+                else:
+                    if piece == cannon:
+                        return True
+                    break
+
+        # 马（马腿在目标格的斜角）
+        horse = make_piece(HORSE, by_side)
+        if position.piece_bitboards[horse]:
+            for leg, horse_sq in HORSE_ATTACKERS[sq]:
+                if squares[horse_sq] == horse and not squares[leg]:
+                    return True
+
+        # 兵
+        pawn = make_piece(PAWN, by_side)
+        if position.piece_bitboards[pawn]:
+            for pawn_sq in PAWN_ATTACKERS[by_side][sq]:
+                if squares[pawn_sq] == pawn:
+                    return True
+
+        # 将/帅、士、象只能攻击己方一侧的格子
+        king_sq = position.king_sq[by_side]
+        if king_sq != NO_SQUARE and sq in KING_MOVES[by_side][king_sq]:
+            return True
+        advisor = make_piece(ADVISOR, by_side)
+        for advisor_sq in ADVISOR_ATTACKERS[by_side][sq]:
+            if squares[advisor_sq] == advisor:
+                return True
+        elephant = make_piece(ELEPHANT, by_side)
+        for eye, elephant_sq in ELEPHANT_ATTACKERS[by_side][sq]:
+            if squares[elephant_sq] == elephant and not squares[eye]:
+                return True
+
+        return False
+
+    def is_checked(self, color):
+        """检查指定颜色的玩家是否被将军"""
+        side = SIDE_OF[color]
+        jiang_sq = self.position.king_sq[side]
+        if jiang_sq == NO_SQUARE:
+            return False
+        return self.is_square_attacked(jiang_sq, side ^ 1)
+
+    def chased_pieces(self, sq):
+        """sq上的棋子走后构成"捉"的对方棋子所在格
+
+        按亚洲规则简化：将/帅和兵卒可以随便捉；被捉的棋子不能是将/帅或未过河的兵卒；
+        吃掉它之后对方不能反吃（没有保护），或者是马/炮捉车。吃子后己方被将军的不算。
+        """
+        position = self.position
+        squares = position.squares
+        code = squares[sq]
+        piece_kind = code & 7
+        if piece_kind in (KING, PAWN):
+            return []
+        side = code >> 3
+        moves = []
+        self.move_generators[piece_kind](self, sq, side, moves)
+
+        chased = []
+        for move in moves:
+            target_sq = move & 0xFF
+            target = squares[target_sq]
+            if not target or target & 7 == KING:
+                continue
+            if target & 7 == PAWN and _own_half(side ^ 1, target_sq // 9):
+                continue
+            captured = position._do_move(sq, target_sq)
+            legal = not self.is_square_attacked(position.king_sq[side], side ^ 1)
+            protected = self.is_square_attacked(target_sq, side ^ 1)
+            position._undo(sq, target_sq, captured)
+            if legal and (not protected or (target & 7 == ROOK and piece_kind in (HORSE, CANNON))):
+                chased.append(target_sq)
+        return chased
+
+    def adjudicate_repetition(self):
+        """同一局面第REPETITION_LIMIT次出现时按循环规则裁决
+
+        返回None（还没有构成循环）、"draw"（和棋）或获胜方颜色（"red"/"black"）。
+        只看最近一个循环中双方的走法：一方步步将军（长将）而另一方不是时长将方判负；
+        双方都没有长将时，一方步步将军或捉子且至少捉了一次（长捉）而另一方不是时长捉方判负；
+        其余情况判和。
+        """
+        position = self.position
+        if position.repetition_count() < REPETITION_LIMIT - 1:
+            return None
+
+        # 回到最近一次出现当前局面的时候，再逐步重走这个循环
+        history = position.key_history
+        start = len(history) - 1 - history[::-1].index(position.key)
+        cycle = position.move_history[start:]
+        replay = position.copy()
+        for _ in cycle:
+            replay.undo_move()
+        replay_rules = Rules(replay)
+
+        checks = ([], [])
+        chases = ([], [])
+        for from_row, from_col, to_row, to_col, _ in cycle:
+            side = replay.side
+            replay.move_piece(from_row, from_col, to_row, to_col)
+            replay.switch_player()
+            checks[side].append(replay_rules.is_checked(COLOR_NAMES[side ^ 1]))
+            chases[side].append(bool(replay_rules.chased_pieces(square(to_row, to_col))))
+
+        perpetual_check = [bool(checks[side]) and all(checks[side]) for side in (RED, BLACK)]
+        if perpetual_check[RED] != perpetual_check[BLACK]:
+            return COLOR_NAMES[BLACK if perpetual_check[RED] else RED]
+        if not perpetual_check[RED]:
+            perpetual_chase = [
+                any(chases[side]) and all(check or chase for check, chase in zip(checks[side], chases[side]))
+                for side in (RED, BLACK)
+            ]
+            if perpetual_chase[RED] != perpetual_chase[BLACK]:
+                return COLOR_NAMES[BLACK if perpetual_chase[RED] else RED]
+        return "draw"
+
+    def is_game_over(self):
+        """检查游戏是否结束：当前出棋方被将死或困毙（无合法走法），或者一方的将/帅已被吃掉"""
+        position = self.position
+        return NO_SQUARE in position.king_sq or not self.has_legal_move(position.side)
+
+    def get_winner(self):
+        """获取获胜者（被将死或困毙的一方判负）"""
+        red_alive, black_alive = (sq != NO_SQUARE for sq in self.position.king_sq)
+        if red_alive and not black_alive:
+            return "红方"
+        if black_alive and not red_alive:
+            return "黑方"
+        if red_alive and not self.has_legal_move(self.position.side):
+            return "黑方" if self.position.side == RED else "红方"
+        return ""
+
+    def evaluate_move_value(self, from_row, from_col, to_row, to_col):
+        """评估移动的价值（静态评估的变化，包含吃子和位置分，再加将军奖励）"""
+        position = self.position
+        from_sq = square(from_row, from_col)
+        to_sq = square(to_row, to_col)
+        side = position.squares[from_sq] >> 3
+        enemy_side = side ^ 1
+        value = -position.evaluate(side)
+
+        # 模拟移动，用增量维护的评估分得到走后的局面分，并检查是否将军对方
+        captured = position._do_move(from_sq, to_sq)
+        value += position.evaluate(side)
+        enemy_king = position.king_sq[enemy_side]
+        if enemy_king != NO_SQUARE and self.is_square_attacked(enemy_king, side):
+            value += 50
+        position._undo(from_sq, to_sq, captured)
+
+        return value
@@ -0,0 +1,752 @@
+"""中国象棋搜索引擎：负极大值 + Alpha-Beta剪枝 + 迭代加深（不依赖Qt）"""
+import multiprocessing
+import os
+import random
+import time
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from chess_rules import COLOR_NAMES, PIECE_VALUES, Rules
+from tablebase import WIN, LOSS
+
+# 分数范围
+INFINITY = 100000
+MATE_SCORE = 30000
+
+# 每搜索多少个节点检查一次时间
+TIME_CHECK_INTERVAL = 1024
+
+# 置换表条目的边界类型
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+# 分数存入置换表时的偏移量（打包为无符号整数）
+SCORE_OFFSET = 1 << 17
+
+# 走法排序的优先级：置换表走法 > 吃子（MVV-LVA） > 杀手走法 > 历史表
+TT_MOVE_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 24
+KILLER_ORDER = (1 << 23, (1 << 23) - 1)
+
+# 杀手走法表支持的最大层数
+MAX_PLY = 128
+
+# 静态搜索的Delta剪枝余量：吃到的子加上余量（包括位置分的变化）仍不能超过alpha时不再搜索这步吃子
+DELTA_MARGIN = 30
+
+# 静态搜索中被将军时搜索全部应将走法的最大层数，超过后只看吃子
+QUIESCENCE_CHECK_PLIES = 2
+
+# MVV-LVA：被吃棋子价值高的优先，同样的被吃棋子用价值低的棋子去吃
+MVV_LVA = [[0] * 16 for _ in range(16)]
+for _victim in range(16):
+    for _attacker in range(16):
+        if _victim & 7 and _attacker & 7:
+            MVV_LVA[_victim][_attacker] = CAPTURE_ORDER + PIECE_VALUES[_victim & 7] * 1024 - PIECE_VALUES[_attacker & 7]
+
+
+def score_to_tt(score, ply):
+    """杀棋分数改为相对当前节点的距离后再存入置换表"""
+    if score >= MATE_SCORE - 1000:
+        return score + ply
+    if score <= -MATE_SCORE + 1000:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """score_to_tt的逆变换"""
+    if score >= MATE_SCORE - 1000:
+        return score - ply
+    if score <= -MATE_SCORE + 1000:
+        return score + ply
+    return score
+
+
+class TranspositionTable:
+    """固定大小的置换表
+
+    每个条目占两个64位整数：打包的数据（走法16位、分数18位、深度8位、边界类型2位、
+    搜索代数8位）和"Zobrist键 异或 数据"，按size_mb分配内存。读取时用异或校验，
+    多个进程无锁共用同一块共享内存时，写了一半的条目会被当作不存在。
+    替换策略：空位、同一局面、旧一代搜索留下的条目，或者新条目深度不小于旧条目时覆盖。
+    """
+
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb=16, shared=False):
+        self.shared = shared
+        self._shm = None
+        self.resize(size_mb)
+
+    @classmethod
+    def attach(cls, shm_name, size):
+        """在子进程中连接到已有的共享内存置换表"""
+        table = cls.__new__(cls)
+        table.shared = True
+        table.size = size
+        table.mask = size - 1
+        table.size_mb = size * cls.ENTRY_BYTES / (1024 * 1024)
+        table._shm = shared_memory.SharedMemory(name=shm_name)
+        table._map_shared()
+        table.age = 0
+        return table
+
+    def resize(self, size_mb):
+        """按MB重新分配置换表（内容清空）"""
+        entries = max(1, int(size_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        # 取不超过上限的2的幂，方便用掩码计算索引
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.size_mb = size_mb
+        if self.shared:
+            self.release()
+            self._shm = shared_memory.SharedMemory(create=True, size=self.size * self.ENTRY_BYTES)
+            self._map_shared()
+        self.clear()
+
+    def _map_shared(self):
+        buf = self._shm.buf
+        half = self.size * 8
+        self.keys = buf[:half].cast("Q")
+        self.data = buf[half:half * 2].cast("Q")
+
+    @property
+    def shm_name(self):
+        """共享内存名称，非共享置换表为None"""
+        return self._shm.name if self._shm else None
+
+    def clear(self):
+        """清空置换表"""
+        if self.shared:
+            self._shm.buf[:self.size * self.ENTRY_BYTES] = bytes(self.size * self.ENTRY_BYTES)
+        else:
+            self.keys = array("Q", bytes(8 * self.size))
+            self.data = array("Q", bytes(8 * self.size))
+        self.age = 0
+
+    def release(self):
+        """释放共享内存（创建它的进程负责删除）"""
+        if self._shm is None:
+            return
+        self.keys.release()
+        self.data.release()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def new_search(self):
+        """开始新一轮搜索，旧条目在替换时优先被覆盖"""
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        """查找局面，返回(move, score, depth, flag)，没有时返回None"""
+        index = key & self.mask
+        data = self.data[index]
+        if not data or self.keys[index] ^ data != key:
+            return None
+        return (data & 0xFFFF,
+                ((data >> 16) & 0x3FFFF) - SCORE_OFFSET,
+                (data >> 34) & 0xFF,
+                (data >> 42) & 0x3)
+
+    def store(self, key, move, score, depth, flag):
+        """保存搜索结果"""
+        index = key & self.mask
+        old = self.data[index]
+        if old and self.keys[index] ^ old != key:
+            old_depth = (old >> 34) & 0xFF
+            old_age = old >> 44
+            if old_age == self.age and depth < old_depth:
+                return
+        elif old and not move:
+            # 同一局面没有新走法时保留原来的最佳走法
+            move = old & 0xFFFF
+        data = (move
+                | (score + SCORE_OFFSET) << 16
+                | min(depth, 0xFF) << 34
+                | flag << 42
+                | self.age << 44)
+        self.data[index] = data
+        self.keys[index] = key ^ data
+
+
+class Searcher:
+    """在一个局面上做迭代加深的Alpha-Beta搜索
+
+    search()在副本上工作，不会修改传入的局面。可以在另一个线程中调用stop()提前结束搜索，
+    此时返回最后一次完成迭代的结果。
+    """
+
+    def __init__(self, tt_size_mb=16, quiescence_checks=True, tt=None, tablebases=None):
+        self.nodes = 0
+        # 静态搜索中被将军时是否搜索全部应将走法
+        self.quiescence_checks = quiescence_checks
+        # 残局库（tablebase.Tablebases），在根节点和搜索树中查询少子局面
+        self.tablebases = tablebases
+        # 对局历史和当前搜索路径上的局面键（出现次数），再次遇到时按循环规则给分
+        self.cycle_keys = {}
+        # 对局历史加搜索路径上依次出现的局面键，以及每个局面的出棋方是否被将军（用于判断长将）
+        self.path_keys = []
+        self.path_checks = []
+        self.stopped = False
+        self.deadline = None
+        # 置换表在迭代加深的各轮之间、同一局的多次AI走棋之间共用
+        self.tt = tt if tt is not None else TranspositionTable(tt_size_mb)
+        # 每轮迭代完成后的(最佳走法, 分数)
+        self.iterations = []
+        # 杀手走法（每层两个）和历史表（按棋子编码和目标格）
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 90 for _ in range(16)]
+
+    def stop(self):
+        """请求尽快结束当前搜索"""
+        self.stopped = True
+
+    def resize_tt(self, size_mb):
+        """调整置换表大小（MB），内容清空"""
+        self.tt.resize(size_mb)
+
+    def close(self):
+        """释放搜索器占用的资源"""
+
+    def search(self, position, max_depth=4, time_limit=None, randomness=0, root_moves=None):
+        """搜索当前出棋方的最佳走法
+
+        max_depth: 最大搜索深度（层）
+        time_limit: 时间预算（秒），None表示不限时
+        randomness: 根节点每步棋加上0~randomness的随机分，用于低难度增加变化
+        root_moves: 只在这些根节点走法中选择（并行搜索时分配给各进程）
+
+        返回(best_move, score, depth)，best_move为整数走法，无合法走法时为None；
+        depth为最后一次完成的迭代深度。
+        """
+        self.position = position.copy()
+        self.rules = Rules(self.position)
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        self._start_tt_generation()
+        self._reset_ordering()
+        self.iterations = []
+        self.cycle_keys = dict(self.position.key_counts)
+        self.cycle_keys[self.position.key] = self.cycle_keys.get(self.position.key, 0) + 1
+        self.path_keys = self.position.key_history + [self.position.key]
+        self.path_checks = self._history_checks()
+
+        best_move, best_score, completed_depth = None, -INFINITY, 0
+        legal_moves = self._legal_moves()
+        if root_moves is not None:
+            legal_moves = [move for move in legal_moves if move in root_moves]
+        root_moves = legal_moves
+        if not root_moves:
+            return None, -MATE_SCORE, 0
+
+        # 残局库中有的局面直接按杀棋步数选择走法，不必搜索
+        if self.tablebases is not None:
+            result = self._probe_root(root_moves)
+            if result is not None:
+                self.iterations = [result]
+                return result[0], result[1], max_depth
+
+        # 上一次走棋留下的置换表走法先搜索，其余按吃子价值排序
+        entry = self.tt.probe(self.position.key)
+        root_moves = self._order_moves(root_moves, entry[0] if entry else 0, 0)
+
+        for depth in range(1, max_depth + 1):
+            move, score = self._search_root(root_moves, depth, randomness)
+            if self.stopped:
+                # 未完成的迭代只在还没有任何结果时使用
+                if best_move is None:
+                    best_move, best_score = move, score
+                break
+
+            best_move, best_score, completed_depth = move, score, depth
+            self.iterations.append((move, score))
+            # 上一轮的最佳走法下一轮最先搜索
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+
+            # 已经找到杀棋，不必再加深
+            if abs(score) >= MATE_SCORE - max_depth:
+                break
+
+        if best_move is None:
+            best_move = root_moves[0]
+        return best_move, best_score, completed_depth
+
+    def _history_checks(self):
+        """对局历史中每个局面（最后是当前局面）的出棋方是否被将军，与path_keys一一对应"""
+        replay = self.position.copy()
+        rules = Rules(replay)
+        checks = [rules.is_checked(COLOR_NAMES[replay.side])]
+        while replay.undo_move():
+            checks.append(rules.is_checked(COLOR_NAMES[replay.side]))
+        checks.reverse()
+        return checks
+
+    def _cycle_score(self, key, ply):
+        """走回了出现过的局面时的分数（当前出棋方视角），与Rules.adjudicate_repetition的长将规则一致
+
+        只看最近一个循环：一方步步将军而另一方不是时长将方判负，其余循环按和棋处理。
+        """
+        keys = self.path_keys
+        start = len(keys) - 1 - keys[::-1].index(key)
+        checks = self.path_checks[start + 1:]
+        checks.append(self.rules.is_checked(COLOR_NAMES[self.position.side]))
+        # checks[-1]表示对方刚走的一步是否将军，往前依次是本方、对方……的走法
+        their_perpetual = all(checks[::-2])
+        our_checks = checks[-2::-2]
+        our_perpetual = bool(our_checks) and all(our_checks)
+        if their_perpetual and not our_perpetual:
+            return MATE_SCORE - ply
+        if our_perpetual and not their_perpetual:
+            return -MATE_SCORE + ply
+        return 0
+
+    def _tablebase_score(self, ply):
+        """查残局库得到当前局面的分数（杀棋分数按距根节点的步数计算），查不到时返回None"""
+        result = self.tablebases.probe(self.position)
+        if result is None:
+            return None
+        outcome, plies = result
+        if outcome == WIN:
+            return MATE_SCORE - ply - plies
+        if outcome == LOSS:
+            return -MATE_SCORE + ply + plies
+        return 0
+
+    def _probe_root(self, root_moves):
+        """根节点的所有走法都能在残局库中查到时，返回其中最好的(走法, 分数)，否则返回None"""
+        position = self.position
+        occupancy = position.occupancy
+        if bin(occupancy[0] | occupancy[1]).count("1") > self.tablebases.max_pieces:
+            return None
+        if self.tablebases.probe(position) is None:
+            return None
+        best = None
+        for move in root_moves:
+            captured = position.make_move(move)
+            score = self._tablebase_score(1)
+            position.unmake_move(move, captured)
+            if score is None:
+                return None
+            score = -score
+            if best is None or score > best[1]:
+                best = (move, score)
+        return best
+
+    def _start_tt_generation(self):
+        self.tt.new_search()
+
+    def _reset_ordering(self):
+        """新搜索开始时清空杀手走法，历史分减半保留"""
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        for row in self.history:
+            for to_sq in range(90):
+                row[to_sq] >>= 1
+
+    def _order_moves(self, moves, tt_move, ply):
+        """按置换表走法、MVV-LVA吃子、杀手走法、历史分的顺序排列走法"""
+        squares = self.position.squares
+        killer1, killer2 = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history
+        scored = []
+        for move in moves:
+            to_sq = move & 0xFF
+            piece = squares[move >> 8]
+            victim = squares[to_sq]
+            if move == tt_move:
+                order = TT_MOVE_ORDER
+            elif victim:
+                order = MVV_LVA[victim][piece]
+            elif move == killer1:
+                order = KILLER_ORDER[0]
+            elif move == killer2:
+                order = KILLER_ORDER[1]
+            else:
+                order = history[piece][to_sq]
+            scored.append((order, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def _record_cutoff(self, move, depth, ply):
+        """不吃子的走法产生剪枝时，记为杀手走法并增加历史分"""
+        if self.position.squares[move & 0xFF]:
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history[self.position.squares[move >> 8]][move & 0xFF] += depth * depth
+
+    def _time_up(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def _legal_moves(self):
+        """当前出棋方不会让己方将/帅被攻击的走法"""
+        return self.rules.legal_moves(self.position.side)
+
+    def _search_root(self, root_moves, depth, randomness):
+        """搜索根节点，返回(最佳走法, 分数)"""
+        position = self.position
+        alpha = -INFINITY
+        best_move, best_score = root_moves[0], -INFINITY
+        for move in root_moves:
+            captured = position.make_move(move)
+            if randomness:
+                # 需要每步棋的准确分数，不用当前alpha剪枝
+                score = -self._negamax(depth - 1, -INFINITY, INFINITY, 1)
+                score += random.randint(0, randomness)
+            else:
+                score = -self._negamax(depth - 1, -INFINITY, -alpha, 1)
+            position.unmake_move(move, captured)
+            if self.stopped:
+                break
+            if score > best_score:
+                best_move, best_score = move, score
+                alpha = max(alpha, score)
+        if not self.stopped and not randomness:
+            self.tt.store(position.key, best_move, score_to_tt(best_score, 0), depth, EXACT)
+        return best_move, best_score
+
+    def _negamax(self, depth, alpha, beta, ply):
+        """负极大值Alpha-Beta搜索，分数从当前出棋方的角度计算"""
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and self._time_up():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        # 走回了对局或搜索路径上出现过的局面：长将方判负，其余循环按和棋处理，不再往下搜索
+        cycle_keys = self.cycle_keys
+        key = self.position.key
+        if key in cycle_keys:
+            return self._cycle_score(key, ply)
+
+        # 残局库只收录少子局面：先用占位位棋盘数子，不超过最大残局库的子数时才查询
+        tablebases = self.tablebases
+        if tablebases is not None:
+            occupancy = self.position.occupancy
+            if bin(occupancy[0] | occupancy[1]).count("1") <= tablebases.max_pieces:
+                score = self._tablebase_score(ply)
+                if score is not None:
+                    return score
+
+        if depth <= 0:
+            return self._quiesce(alpha, beta, ply, 0)
+
+        position = self.position
+        rules = self.rules
+        side = position.side
+
+        # 查置换表：深度足够时直接使用分数或边界
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry:
+            tt_move, tt_score, tt_depth, tt_flag = entry
+            if tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if tt_flag == EXACT:
+                    return tt_score
+                if tt_flag == LOWER_BOUND and tt_score >= beta:
+                    return tt_score
+                if tt_flag == UPPER_BOUND and tt_score <= alpha:
+                    return tt_score
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        has_legal_move = False
+
+        moves = self._order_moves(rules.generate_side_moves(side), tt_move, ply)
+        # 只有可能送将的走法才需要走完后检查将/帅是否被攻击
+        masks = rules.check_masks(side)
+        from_mask, to_mask = masks if masks is not None else (-1, -1)
+
+        cycle_keys[key] = 1
+        path_keys = self.path_keys
+        path_checks = self.path_checks
+        path_keys.append(key)
+        path_checks.append(masks is None)
+        for move in moves:
+            captured = position.make_move(move)
+            if (((from_mask >> (move >> 8)) & 1 or (to_mask >> (move & 0xFF)) & 1)
+                    and rules.is_square_attacked(position.king_sq[side], side ^ 1)):
+                position.unmake_move(move, captured)
+                continue
+            has_legal_move = True
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move(move, captured)
+            if self.stopped:
+                break
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self._record_cutoff(move, depth, ply)
+                        break
+        del cycle_keys[key]
+        path_keys.pop()
+        path_checks.pop()
+        if self.stopped:
+            return 0
+
+        # 没有合法走法：被将死或困毙，中国象棋中都判负
+        if not has_legal_move:
+            return -MATE_SCORE + ply
+
+        if best_score >= beta:
+            flag = LOWER_BOUND
+        elif best_score > original_alpha:
+            flag = EXACT
+        else:
+            flag = UPPER_BOUND
+            best_move = 0
+        self.tt.store(key, best_move, score_to_tt(best_score, ply), depth, flag)
+        return best_score
+
+    def _quiesce(self, alpha, beta, ply, qply):
+        """静态搜索：只搜索吃子直到局面平稳，避免在吃子交换的中途评估（水平线效应）"""
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and self._time_up():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        position = self.position
+        rules = self.rules
+        squares = position.squares
+        side = position.side
+
+        # 被将军时不能"不走"，在前几层搜索全部应将走法
+        evasions = (self.quiescence_checks and qply < QUIESCENCE_CHECK_PLIES and ply < MAX_PLY
+                    and rules.is_square_attacked(position.king_sq[side], side ^ 1))
+
+        if evasions:
+            best_score = -INFINITY
+            moves = self._order_moves(rules.generate_side_moves(side), 0, ply)
+        else:
+            # 站桩分：不吃子时的静态评估
+            best_score = self.evaluate()
+            if best_score >= beta or ply >= MAX_PLY:
+                return best_score
+            if best_score > alpha:
+                alpha = best_score
+            stand_pat = best_score
+            captures = [move for move in rules.generate_side_moves(side) if squares[move & 0xFF]]
+            moves = self._order_moves(captures, 0, ply)
+
+        has_legal_move = False
+        for move in moves:
+            victim = squares[move & 0xFF]
+            # Delta剪枝：即使吃到这个子也追不上alpha
+            if not evasions and stand_pat + PIECE_VALUES[victim & 7] + DELTA_MARGIN <= alpha:
+                continue
+
+            captured = position.make_move(move)
+            if rules.is_square_attacked(position.king_sq[side], side ^ 1):
+                position.unmake_move(move, captured)
+                continue
+            has_legal_move = True
+            score = -self._quiesce(-beta, -alpha, ply + 1, qply + 1)
+            position.unmake_move(move, captured)
+            if self.stopped:
+                return 0
+
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if evasions and not has_legal_move:
+            return -MATE_SCORE + ply
+
+        return best_score
+
+    def evaluate(self):
+        """静态评估：当前出棋方视角的渐变评估分（子力加位置分，见Position.evaluate）"""
+        return self.position.evaluate()
+
+
+# ---------------------------------------------------------------------------
+# 多进程并行搜索：根节点走法分给多个进程，所有进程共用一块共享内存置换表
+# ---------------------------------------------------------------------------
+
+# 工作进程中的全局状态，由_init_worker设置
+_worker_tt = None
+_worker_stop_event = None
+
+
+def _init_worker(shm_name, tt_size, stop_event):
+    """工作进程初始化：连接共享置换表和停止信号"""
+    global _worker_tt, _worker_stop_event
+    _worker_tt = TranspositionTable.attach(shm_name, tt_size)
+    _worker_stop_event = stop_event
+
+
+class _WorkerSearcher(Searcher):
+    """工作进程中的搜索器：使用主进程给定的置换表代数，并响应停止信号"""
+
+    def __init__(self, tt_age, quiescence_checks, tablebases):
+        super().__init__(quiescence_checks=quiescence_checks, tt=_worker_tt, tablebases=tablebases)
+        self.tt_age = tt_age
+
+    def _start_tt_generation(self):
+        self.tt.age = self.tt_age
+
+    def _time_up(self):
+        return _worker_stop_event.is_set() or super()._time_up()
+
+
+def _worker_search(position, root_moves, max_depth, time_limit, randomness, tt_age, quiescence_checks,
+                   tablebases):
+    """在工作进程中搜索分配到的根节点走法"""
+    searcher = _WorkerSearcher(tt_age, quiescence_checks, tablebases)
+    result = searcher.search(position, max_depth, time_limit, randomness, root_moves)
+    return searcher.iterations, result, searcher.nodes
+
+
+def _shutdown_pool(executor, tt):
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    tt.release()
+
+
+class ParallelSearcher(Searcher):
+    """多进程并行搜索
+
+    根节点走法轮流分给workers个进程（ProcessPoolExecutor），每个进程独立做迭代加深，
+    置换表放在共享内存中由所有进程共用。结果取所有进程都完成的最深一轮中分数最高的走法。
+    workers为1时退化为普通的单进程搜索。
+
+    工作进程用spawn方式启动：界面程序是多线程的（搜索本身就在QThread中），fork出的子进程
+    可能继承被其他线程持有的锁而死锁。工作进程崩溃时本次改用单进程搜索，下次搜索重建进程池。
+    """
+
+    def __init__(self, workers=None, tt_size_mb=64, quiescence_checks=True, tablebases=None):
+        self.workers = workers or os.cpu_count() or 1
+        super().__init__(quiescence_checks=quiescence_checks,
+                         tt=TranspositionTable(tt_size_mb, shared=True), tablebases=tablebases)
+        self._executor = None
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._stop_event = self._mp_context.Event()
+        # 对象被回收或程序退出时关闭进程池并删除共享内存
+        self._finalizer = weakref.finalize(self, _shutdown_pool, None, self.tt)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._mp_context,
+                initializer=_init_worker,
+                initargs=(self.tt.shm_name, self.tt.size, self._stop_event),
+            )
+            self._finalizer.detach()
+            self._finalizer = weakref.finalize(self, _shutdown_pool, self._executor, self.tt)
+        return self._executor
+
+    def set_workers(self, workers):
+        """设置工作进程数（下次搜索时生效）"""
+        self.close_pool()
+        self.workers = max(1, workers)
+
+    def resize_tt(self, size_mb):
+        """调整共享置换表大小，需要重新启动工作进程"""
+        self.close_pool()
+        self.tt.resize(size_mb)
+
+    def close_pool(self):
+        """关闭工作进程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _discard_pool(self):
+        """丢弃出错的进程池（不等待），下次搜索时重新创建"""
+        executor, self._executor = self._executor, None
+        self._finalizer.detach()
+        self._finalizer = weakref.finalize(self, _shutdown_pool, None, self.tt)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        """关闭工作进程并释放共享内存"""
+        self.close_pool()
+        self._finalizer()
+
+    def stop(self):
+        self.stopped = True
+        self._stop_event.set()
+
+    def search(self, position, max_depth=4, time_limit=None, randomness=0, root_moves=None):
+        if self.workers <= 1:
+            return super().search(position, max_depth, time_limit, randomness, root_moves)
+
+        self.position = position.copy()
+        self.rules = Rules(self.position)
+        self.stopped = False
+        self._stop_event.clear()
+        self.tt.new_search()
+        self._reset_ordering()
+
+        legal_moves = self._legal_moves()
+        if root_moves is not None:
+            legal_moves = [move for move in legal_moves if move in root_moves]
+        if not legal_moves:
+            return None, -MATE_SCORE, 0
+        if self.tablebases is not None:
+            result = self._probe_root(legal_moves)
+            if result is not None:
+                self.iterations = [result]
+                return result[0], result[1], max_depth
+        entry = self.tt.probe(self.position.key)
+        legal_moves = self._order_moves(legal_moves, entry[0] if entry else 0, 0)
+
+        # 按排序后的顺序轮流分配，让每个进程都分到一些好的走法
+        worker_count = min(self.workers, len(legal_moves))
+        subsets = [legal_moves[i::worker_count] for i in range(worker_count)]
+        self.nodes = 0
+        all_iterations = []
+        partial_results = []
+        try:
+            executor = self._get_executor()
+            futures = [
+                executor.submit(_worker_search, position, subset, max_depth, time_limit,
+                                randomness, self.tt.age, self.quiescence_checks, self.tablebases)
+                for subset in subsets
+            ]
+            for future in futures:
+                iterations, result, nodes = future.result()
+                self.nodes += nodes
+                all_iterations.append(iterations)
+                partial_results.append(result)
+        except Exception:
+            # 工作进程崩溃（BrokenProcessPool）或搜索出错：只有部分根节点走法有结果，
+            # 本次改在当前进程中完整搜索一遍
+            self._discard_pool()
+            return super().search(position, max_depth, time_limit, randomness, root_moves)
+
+        # 取所有进程都完成的最深一轮，比较这一轮各进程的最佳走法
+        common_depth = min(len(iterations) for iterations in all_iterations)
+        if common_depth:
+            candidates = [iterations[common_depth - 1] for iterations in all_iterations]
+            best_move, best_score = max(candidates, key=lambda item: item[1])
+            self.iterations = [(best_move, best_score)]
+            return best_move, best_score, common_depth
+
+        # 有进程一轮都没完成：用各进程的部分结果
+        best_move, best_score, _ = max(
+            (result for result in partial_results if result[0] is not None),
+            key=lambda result: result[1],
+            default=(legal_moves[0], -INFINITY, 0),
+        )
+        return best_move, best_score, 0
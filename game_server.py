@@ -0,0 +1,348 @@
+"""多房间对战服务器（asyncio，不依赖Qt）
+
+一个进程同时承载大量对局：客户端连上后发送JOIN排队匹配，凑齐两人就开一个房间，
+先到的执红。所有走法都由服务器用规则核心校验后再转发给对手，不合法的走法回复REJECT
+并用SYNC把客户端的棋局纠正回来；将死、困毙、循环裁决、认输和掉线都由服务器判定结束，
+向双方发送GAME_OVER后关闭房间，玩家可以再次JOIN。
+
+任意数量的观众可以用WATCH订阅房间：先收到SNAPSHOT，之后每步棋只编码一帧MOVE，先发给
+对手再原样写给所有观众。观众的未写出数据超过SPECTATOR_BACKLOG_LIMIT时暂停给他发走法，
+等积压写完后用一个新的SNAPSHOT补齐，慢客户端不会让服务器内存无限增长，也不影响对局双方。
+
+对局者掉线后房间保留RESUME_TIMEOUT秒：客户端用START中的会话令牌发送RESUME即可回到原来的
+房间，服务器只补发缺少的走法（差得太多时发快照）；超时没有回来才判对手获胜。
+
+房间只保存两名玩家和一个Position（90字节棋盘加走法记录），用__slots__保持紧凑，
+单进程可以承载数千个房间。
+
+用法：
+    python game_server.py                  # 在0.0.0.0:5555监听
+    python game_server.py --port 6000
+"""
+import argparse
+import asyncio
+import collections
+import heapq
+import secrets
+import sys
+
+import protocol
+from chess_rules import Position, Rules, RED, coords_to_move, move_to_coords
+from network import Connection, catch_up_messages
+
+DEFAULT_PORT = 5555
+BOARD_SQUARES = 90
+
+# 观众连接最多积压多少字节未写出，超过后暂停推送走法，积压写完后改发快照
+SPECTATOR_BACKLOG_LIMIT = 64 * 1024
+
+# 对局者掉线后保留房间等待重连的秒数
+RESUME_TIMEOUT = 60.0
+
+
+class Player:
+    """一名已连接的玩家（对局者或观众）"""
+
+    __slots__ = ("connection", "room", "color", "token", "expire_handle", "watching", "lagging")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.room = None
+        self.color = None  # RED或BLACK
+        self.token = None  # 对局中的会话令牌
+        self.expire_handle = None  # 掉线后等待重连的定时器
+        self.watching = None  # 正在观看的房间
+        self.lagging = False  # 观众积压过多，暂停推送走法
+
+
+class Room:
+    """一局对战：两名玩家（按颜色排列）、观众和棋局"""
+
+    __slots__ = ("room_id", "players", "spectators", "position", "rules", "undo_requested_by")
+
+    def __init__(self, room_id, red_player, black_player):
+        self.room_id = room_id
+        self.players = (red_player, black_player)
+        self.spectators = set()
+        self.position = Position()
+        self.rules = Rules(self.position)
+        self.undo_requested_by = None
+
+    def move_log(self):
+        """从开局起的全部走法（整数走法列表）"""
+        return [coords_to_move(*entry[:4]) for entry in self.position.move_history]
+
+    def opponent(self, player):
+        return self.players[player.color ^ 1]
+
+    def snapshot(self):
+        """SNAPSHOT消息的负载：当前局面和从开局起的走法"""
+        return protocol.encode_snapshot(self.room_id, self.position.to_fen(), self.move_log())
+
+    def broadcast(self, frame):
+        """把一帧已编码的走法写给所有观众，积压过多的观众暂停推送，积压写完后补发快照"""
+        snapshot = None
+        for spectator in self.spectators:
+            connection = spectator.connection
+            if connection.backlog() > SPECTATOR_BACKLOG_LIMIT:
+                spectator.lagging = True
+            elif spectator.lagging:
+                if snapshot is None:
+                    snapshot = protocol.encode(protocol.MSG_SNAPSHOT, 0, self.snapshot())
+                connection.send_frame(snapshot)
+                spectator.lagging = False
+            else:
+                connection.send_frame(frame)
+
+
+class GameServer:
+    """管理等待匹配的玩家和进行中的房间，所有方法都在事件循环线程中调用"""
+
+    def __init__(self, resume_timeout=RESUME_TIMEOUT):
+        self.resume_timeout = resume_timeout
+        self.waiting = collections.deque()
+        self.rooms = {}
+        self.sessions = {}  # 会话令牌 -> 对局者
+        self.next_room_id = 1
+        self.games_finished = 0
+
+    async def start(self, host="0.0.0.0", port=DEFAULT_PORT):
+        """开始监听，返回asyncio的Server对象"""
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def handle_client(self, reader, writer):
+        """一名玩家从连上到断开的全过程"""
+        connection = Connection(reader, writer)
+        player = Player(connection)
+
+        def on_message(msg_type, seq, payload):
+            nonlocal player
+            if msg_type == protocol.MSG_RESUME:
+                # 重连成功后这条连接改为代表原来的对局者
+                player = self.resume(player, *protocol.decode_resume(payload))
+            else:
+                self.dispatch(player, msg_type, seq, payload)
+
+        try:
+            await connection.serve(lambda: None, on_message)
+        finally:
+            # 处理消息时出了任何异常也要让玩家离开房间，不留下断线的对局者
+            if player.connection is connection:
+                self.leave(player)
+
+    def dispatch(self, player, msg_type, seq, payload):
+        """处理玩家发来的一条消息"""
+        if msg_type == protocol.MSG_JOIN:
+            self.join(player)
+        elif msg_type == protocol.MSG_WATCH:
+            self.watch(player, protocol.decode_watch(payload))
+        elif msg_type == protocol.MSG_ROOM_LIST:
+            player.connection.send(protocol.MSG_ROOM_LIST, self.room_list())
+        elif player.room is None:
+            return  # 不在房间里时忽略对局消息
+        elif msg_type == protocol.MSG_MOVE:
+            self.play(player, seq, protocol.decode_move(payload))
+        elif msg_type == protocol.MSG_UNDO_REQUEST:
+            self.request_undo(player)
+        elif msg_type == protocol.MSG_UNDO_REPLY:
+            self.reply_undo(player, protocol.decode_flag(payload))
+        elif msg_type == protocol.MSG_RESIGN:
+            room = player.room
+            room.opponent(player).connection.send(protocol.MSG_RESIGN)
+            self.finish(room, protocol.RESULT_RED if player.color != RED else protocol.RESULT_BLACK,
+                        protocol.REASON_RESIGN)
+
+    def join(self, player):
+        """把玩家放进匹配队列，凑齐两人时开房间"""
+        if player.room is not None or player in self.waiting:
+            return
+        self.unwatch(player)
+        while self.waiting and not self.waiting[0].connection.is_open:
+            self.waiting.popleft()
+        if not self.waiting:
+            self.waiting.append(player)
+            return
+
+        red_player = self.waiting.popleft()
+        room = Room(self.next_room_id, red_player, player)
+        self.next_room_id += 1
+        self.rooms[room.room_id] = room
+        for color, member in enumerate(room.players):
+            member.room = room
+            member.color = color
+            member.token = secrets.token_bytes(protocol.TOKEN_SIZE)
+            self.sessions[member.token] = member
+            member.connection.send(protocol.MSG_START,
+                                   protocol.encode_start(room.room_id, protocol.COLORS[color], member.token))
+
+    def resume(self, player, token, plies, key):
+        """掉线的对局者用会话令牌重连，返回这条连接此后代表的对局者"""
+        member = self.sessions.get(token)
+        if member is None or member.room is None or player.room is not None:
+            player.connection.send(protocol.MSG_REJECT)
+            return player
+        if player in self.waiting:
+            self.waiting.remove(player)
+        self.unwatch(player)
+        if member.expire_handle is not None:
+            member.expire_handle.cancel()
+            member.expire_handle = None
+
+        # 旧连接可能还没发现断线，由新连接接替
+        old_connection, member.connection = member.connection, player.connection
+        old_connection.close()
+        room = member.room
+        member.connection.send(protocol.MSG_START,
+                               protocol.encode_start(room.room_id, protocol.COLORS[member.color], token))
+        for msg_type, payload, seq in catch_up_messages(room.position, room.room_id, plies, key):
+            member.connection.send(msg_type, payload, seq)
+        return member
+
+    def play(self, player, seq, move):
+        """校验并执行玩家的走法，合法时转发给对手并判断对局是否结束"""
+        room = player.room
+        position = room.position
+        from_sq, to_sq = move >> 8, move & 0xFF
+        if (position.side != player.color or seq != len(position.move_history) + 1
+                or from_sq >= BOARD_SQUARES or to_sq >= BOARD_SQUARES or not position.squares[from_sq]
+                or position.squares[from_sq] >> 3 != player.color or not room.rules.can_move(*move_to_coords(move))):
+            player.connection.send(protocol.MSG_REJECT, seq=seq)
+            player.connection.send(protocol.MSG_SYNC, protocol.encode_moves(room.move_log()))
+            return
+
+        position.move_piece(*move_to_coords(move))
+        position.switch_player()
+        room.undo_requested_by = None
+        # 同一帧先发给对手，再原样写给所有观众
+        frame = protocol.encode(protocol.MSG_MOVE, seq, protocol.encode_move(move))
+        room.opponent(player).connection.send_frame(frame)
+        room.broadcast(frame)
+
+        if room.rules.is_game_over():
+            winner = room.rules.get_winner()
+            result = protocol.RESULT_RED if winner == "红方" else protocol.RESULT_BLACK if winner == "黑方" \
+                else protocol.RESULT_DRAW
+            self.finish(room, result, protocol.REASON_MATE)
+            return
+        verdict = room.rules.adjudicate_repetition()
+        if verdict is not None:
+            result = {"draw": protocol.RESULT_DRAW, "red": protocol.RESULT_RED, "black": protocol.RESULT_BLACK}[verdict]
+            self.finish(room, result, protocol.REASON_REPETITION)
+
+    def request_undo(self, player):
+        """转发悔棋请求，只有刚走完棋的一方可以请求"""
+        room = player.room
+        if room.position.side == player.color or not room.position.move_history:
+            player.connection.send(protocol.MSG_UNDO_REPLY, protocol.encode_flag(False))
+            return
+        room.undo_requested_by = player
+        room.opponent(player).connection.send(protocol.MSG_UNDO_REQUEST)
+
+    def reply_undo(self, player, accept):
+        """对手答复悔棋请求，同意时服务器上的棋局也退一步"""
+        room = player.room
+        requester = room.undo_requested_by
+        if requester is None or requester is player:
+            return
+        room.undo_requested_by = None
+        if accept:
+            room.position.undo_move()
+            # 悔棋很少见，直接给观众发新的快照
+            room.broadcast(protocol.encode(protocol.MSG_SNAPSHOT, 0, room.snapshot()))
+        requester.connection.send(protocol.MSG_UNDO_REPLY, protocol.encode_flag(accept))
+
+    def watch(self, player, room_id):
+        """观众订阅房间并收到快照；房间不存在时回复房间列表"""
+        if player.room is not None:
+            return
+        if not room_id and self.rooms:
+            room = max(self.rooms.values(), key=lambda candidate: len(candidate.spectators))
+        else:
+            room = self.rooms.get(room_id)
+        if room is None:
+            player.connection.send(protocol.MSG_ROOM_LIST, self.room_list())
+            return
+        self.unwatch(player)
+        if player in self.waiting:
+            self.waiting.remove(player)
+        room.spectators.add(player)
+        player.watching = room
+        player.lagging = False
+        player.connection.send(protocol.MSG_SNAPSHOT, room.snapshot())
+
+    def unwatch(self, player):
+        if player.watching is not None:
+            player.watching.spectators.discard(player)
+            player.watching = None
+
+    def room_list(self):
+        """ROOM_LIST回复的负载：房间太多装不进一条消息时只列出观众最多的MAX_ROOM_ENTRIES个"""
+        rooms = self.rooms.values()
+        if len(rooms) > protocol.MAX_ROOM_ENTRIES:
+            rooms = heapq.nlargest(protocol.MAX_ROOM_ENTRIES, rooms, key=lambda room: len(room.spectators))
+        return protocol.encode_room_list((room.room_id, len(room.position.move_history), len(room.spectators))
+                                         for room in rooms)
+
+    def finish(self, room, result, reason):
+        """结束对局：通知双方和观众并关闭房间"""
+        frame = protocol.encode(protocol.MSG_GAME_OVER, 0, protocol.encode_game_over(result, reason))
+        for member in room.players:
+            member.connection.send_frame(frame)
+            member.room = None
+            member.color = None
+            self.sessions.pop(member.token, None)
+            member.token = None
+            if member.expire_handle is not None:
+                member.expire_handle.cancel()
+                member.expire_handle = None
+        for spectator in room.spectators:
+            spectator.connection.send_frame(frame)
+            spectator.watching = None
+        room.spectators.clear()
+        del self.rooms[room.room_id]
+        self.games_finished += 1
+
+    def leave(self, player):
+        """玩家断开连接：退出匹配队列；正在对局时保留房间等待重连，超时后判对手获胜"""
+        if player in self.waiting:
+            self.waiting.remove(player)
+        self.unwatch(player)
+        if player.room is not None:
+            player.expire_handle = asyncio.get_event_loop().call_later(self.resume_timeout, self.abandon, player)
+
+    def abandon(self, player):
+        """掉线的对局者没有及时重连，判对手获胜"""
+        player.expire_handle = None
+        if player.room is not None and not player.connection.is_open:
+            self.finish(player.room, protocol.RESULT_RED if player.color != RED else protocol.RESULT_BLACK,
+                        protocol.REASON_ABANDON)
+
+
+async def serve(host, port, resume_timeout=RESUME_TIMEOUT):
+    game_server = GameServer(resume_timeout)
+    server = await game_server.start(host, port)
+    print(f"对战服务器已在{host}:{port}启动")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="中国象棋多房间对战服务器")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址（默认0.0.0.0）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口（默认{DEFAULT_PORT}）")
+    parser.add_argument("--resume-timeout", type=float, default=RESUME_TIMEOUT,
+                        help=f"对局者掉线后等待重连的秒数（默认{RESUME_TIMEOUT:g}）")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.resume_timeout))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"启动服务器失败: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 import sys
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QMessageBox, QMenuBar, QMenu, QDialog, QComboBox, QDialogButtonBox
 from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve
@@ -108,6 +109,10 @@ class ChineseChessGame(QMainWindow):
         ai_game_action = menubar.addAction("人机对战")
         ai_game_action.triggered.connect(self.ai_game)
         
+        # AI设置菜单项（置换表大小、搜索进程数）
+        ai_settings_action = menubar.addAction("AI设置")
+        ai_settings_action.triggered.connect(self.ai_settings)
+        
         # 联机对战菜单项
         network_game_action = menubar.addAction("联机对战")
         network_game_action.triggered.connect(self.network_game)
@@ -370,13 +375,50 @@ class ChineseChessGame(QMainWindow):
             """)
             msg_box.exec_()
     
+    def ai_settings(self):
+        """设置AI置换表大小和搜索进程数"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("AI设置")
+        layout = QVBoxLayout(dialog)
+        
+        # 置换表大小
+        layout.addWidget(QLabel("置换表大小：", dialog))
+        hash_combo = QComboBox(dialog)
+        hash_sizes = [16, 32, 64, 128, 256]
+        for size_mb in hash_sizes:
+            hash_combo.addItem(f"{size_mb} MB", size_mb)
+        current_size = self.chess_board.searcher.tt.size_mb
+        hash_combo.setCurrentIndex(min(range(len(hash_sizes)), key=lambda i: abs(hash_sizes[i] - current_size)))
+        layout.addWidget(hash_combo)
+        
+        # 搜索进程数（大于1时使用多进程并行搜索）
+        layout.addWidget(QLabel("搜索进程数：", dialog))
+        workers_combo = QComboBox(dialog)
+        for workers in range(1, (os.cpu_count() or 1) + 1):
+            workers_combo.addItem("1（单进程）" if workers == 1 else str(workers), workers)
+        workers_combo.setCurrentIndex(self.chess_board.ai_workers - 1)
+        layout.addWidget(workers_combo)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        
+        if dialog.exec_() == QDialog.Accepted:
+            workers = workers_combo.currentData()
+            if workers != self.chess_board.ai_workers:
+                self.chess_board.set_ai_workers(workers)
+            size_mb = hash_combo.currentData()
+            if size_mb != self.chess_board.searcher.tt.size_mb:
+                self.chess_board.set_ai_hash_size(size_mb)
+    
     def update_difficulty_description(self, index):
         """更新难度等级描述"""
         descriptions = {
-            0: "简单难度：AI完全随机移动棋子，适合刚接触中国象棋的初学者熟悉规则。",
-            1: "正常难度：AI会优先选择吃子或将军的移动，平衡了挑战性和可玩性。",
-            2: "困难难度：AI会选择价值最高的移动，考虑吃子和将军策略，适合有一定基础的玩家。",
-            3: "极难难度：AI会考虑多步走法，预测对手的反击，是对高手的终极挑战。"
+            0: "简单难度：AI只看一步并带有很大的随机性，适合刚接触中国象棋的初学者熟悉规则。",
+            1: "正常难度：AI会计算两步并保留少量随机性，平衡了挑战性和可玩性。",
+            2: "困难难度：AI使用Alpha-Beta搜索计算四步，适合有一定基础的玩家。",
+            3: "极难难度：AI在3秒内迭代加深尽可能多地计算，是对高手的终极挑战。"
         }
         self.difficulty_desc_label.setText(descriptions.get(index, ""))
         
@@ -386,11 +428,15 @@ class ChineseChessGame(QMainWindow):
         dialog = NetworkDialog(self)
         if dialog.exec_() == dialog.Accepted:
             is_server, ip, port = dialog.get_settings()
+            watch_room = dialog.get_watch_room()
             
             # 初始化网络连接
             self.chess_board.init_network()
             
-            if is_server:
+            if watch_room is not None:
+                # 连接对战服务器观战
+                self.chess_board.watch_game(ip, port, watch_room)
+            elif is_server:
                 # 作为服务器启动
                 self.chess_board.start_server(port)
             else:
@@ -404,6 +450,13 @@ class ChineseChessGame(QMainWindow):
         
     def undo_move(self):
         """悔棋"""
+        if self.chess_board.game_mode == "network":
+            # 联机对战时要先征得对方同意，对方同意后双方一起悔棋
+            if self.chess_board.request_undo():
+                QMessageBox.information(self, "提示", "已向对方发送悔棋请求")
+            else:
+                QMessageBox.warning(self, "警告", "无法悔棋")
+            return
         if self.chess_board.undo_move():
             current_player = "红方" if self.chess_board.current_player == "red" else "黑方"
             color = "red" if self.chess_board.current_player == "red" else "black"
@@ -414,7 +467,13 @@ class ChineseChessGame(QMainWindow):
             
     def resign(self):
         """认输"""
+        # 停止AI思考，避免弹窗期间AI继续走棋
+        self.chess_board.cancel_ai()
         winner = "黑方" if self.chess_board.current_player == "red" else "红方"
+        if self.chess_board.game_mode == "network":
+            # 联机对战时是本方认输，并通知对方
+            winner = "黑方" if self.chess_board.network_color == "red" else "红方"
+            self.chess_board.send_resign()
         # 使用自定义获胜弹窗
         dialog = VictoryDialog(winner, self)
         dialog.exec_()
@@ -424,6 +483,14 @@ class ChineseChessGame(QMainWindow):
         """显示获胜弹窗"""
         dialog = VictoryDialog(winner, self)
         dialog.exec_()
+        
+    def closeEvent(self, event):
+        """关闭窗口时停止AI思考、断开网络连接，结束后台线程"""
+        self.chess_board.cancel_ai()
+        # 并行搜索时关闭工作进程并释放共享内存置换表
+        self.chess_board.searcher.close()
+        self.chess_board.close_network()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,285 @@
+"""联机对战的本机回环压测工具（不依赖Qt）
+
+在本机开N对模拟客户端，每对用规则核心随机走合法的棋，统计每秒走法数、走法往返时间的
+p50/p99和每个连接占用的内存，用来估算服务器容量、发现网络层的性能回退。
+
+往返时间是本方发出一步棋到收到对方应着的时间（对方收到后立即随机应着，包含对方生成走法的
+时间）。内存用tracemalloc统计建立全部连接并开局后Python对象的增量（进程内模式包含服务器端），
+按连接数平均，不含线程栈和内核缓冲区。
+
+用法：
+    python net_bench.py                        # 进程内启动对战服务器，50对客户端，10秒
+    python net_bench.py -n 500 -t 30           # 500对客户端，30秒
+    python net_bench.py --connect 127.0.0.1:5555   # 压测已经在运行的game_server.py
+    python net_bench.py --p2p -n 20            # 点对点模式：每对用NetworkTransport直连（每端一个线程）
+"""
+import argparse
+import asyncio
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import protocol
+from chess_rules import Position, Rules, RED, BLACK, move_to_coords
+from game_server import GameServer
+from network import Connection, NetworkTransport
+
+# 每局最多走多少步（超过后由出棋方认输，开始下一局）
+DEFAULT_MAX_PLIES = 200
+
+
+class BenchPlayer:
+    """一个模拟客户端：收到对方走法后立即随机应着，并记录往返时间"""
+
+    def __init__(self, send, rng, max_plies, stop_event):
+        self.send = send
+        self.rng = rng
+        self.max_plies = max_plies
+        self.stop_event = stop_event
+        self.hold = False  # 为True时执红也先不走第一步（等全部连接建立、统计完内存）
+        self.position = None
+        self.rules = None
+        self.color = None
+        self.sent_at = None
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+        self.latencies = []
+
+    def start(self, color):
+        """开始新的一局，执红时先走"""
+        self.position = Position()
+        self.rules = Rules(self.position)
+        self.color = color
+        self.sent_at = None
+        if color == RED and not self.hold:
+            self.play()
+
+    def play(self):
+        """随机走一步合法的棋并发给对方"""
+        if self.stop_event.is_set():
+            return
+        moves = self.rules.legal_moves(self.position.side)
+        move = self.rng.choice(moves)
+        self.apply(move)
+        self.sent_at = time.perf_counter()
+        self.moves += 1
+        self.send(protocol.MSG_MOVE, protocol.encode_move(move), len(self.position.move_history))
+        self.check_over()
+
+    def apply(self, move):
+        self.position.move_piece(*move_to_coords(move))
+        self.position.switch_player()
+
+    def receive_move(self, seq, move):
+        """收到对方的走法：记录往返时间，校验后走棋并应着"""
+        if self.sent_at is not None:
+            self.latencies.append(time.perf_counter() - self.sent_at)
+            self.sent_at = None
+        if self.position is None or seq != len(self.position.move_history) + 1 \
+                or not self.rules.can_move(*move_to_coords(move)):
+            self.errors += 1
+            return
+        self.apply(move)
+        if not self.check_over():
+            self.play()
+
+    def check_over(self):
+        """对局是否结束（将死、困毙、循环裁决或达到步数上限），结束时调用game_over()"""
+        position = self.position
+        if self.rules.has_legal_move(position.side) and self.rules.adjudicate_repetition() is None \
+                and len(position.move_history) < self.max_plies:
+            return False
+        self.game_over()
+        return True
+
+    def game_over(self):
+        """点对点模式：双方在同一步判定结束，直接开始下一局"""
+        if self.color == RED:
+            self.games += 1
+        self.start(self.color)
+
+    def dispatch(self, msg_type, seq, payload):
+        if msg_type == protocol.MSG_MOVE:
+            self.receive_move(seq, protocol.decode_move(payload))
+
+
+class ServerBenchPlayer(BenchPlayer):
+    """对战服务器模式的模拟客户端：对局结束由服务器宣布，之后重新JOIN匹配"""
+
+    def game_over(self):
+        if len(self.position.move_history) >= self.max_plies and self.position.side == self.color:
+            # 达到步数上限时由出棋方认输，让服务器关闭房间
+            self.send(protocol.MSG_RESIGN)
+        self.position = None
+
+    def dispatch(self, msg_type, seq, payload):
+        if msg_type == protocol.MSG_START:
+            self.start(BLACK if protocol.decode_start(payload)[1] == "black" else RED)
+        elif msg_type == protocol.MSG_MOVE:
+            self.receive_move(seq, protocol.decode_move(payload))
+        elif msg_type == protocol.MSG_GAME_OVER:
+            if self.color == RED:
+                self.games += 1
+            self.position = None
+            if not self.stop_event.is_set():
+                self.send(protocol.MSG_JOIN)
+        elif msg_type in (protocol.MSG_REJECT, protocol.MSG_SYNC):
+            self.errors += 1
+
+
+def percentile(values, fraction):
+    """已排序列表的分位数"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_server_bench(pairs, seconds, max_plies, address, rng):
+    """对战服务器模式，返回(模拟客户端列表, 用时秒数, 每连接内存字节数)"""
+    server = None
+    if address is None:
+        server = await GameServer().start("127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+    else:
+        host, port = address
+
+    stop_event = threading.Event()
+    started = asyncio.Event()
+    players = []
+    connections = []
+    tasks = []
+    start_count = 0
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(pairs * 2):
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = Connection(reader, writer)
+        player = ServerBenchPlayer(connection.send, random.Random(rng.random()), max_plies, stop_event)
+        player.hold = True
+        players.append(player)
+        connections.append(connection)
+
+        def dispatch(msg_type, seq, payload, player=player):
+            nonlocal start_count
+            if msg_type == protocol.MSG_START and not started.is_set():
+                start_count += 1
+                if start_count == pairs * 2:
+                    started.set()
+            player.dispatch(msg_type, seq, payload)
+
+        join = lambda connection=connection: connection.send(protocol.MSG_JOIN)
+        tasks.append(asyncio.ensure_future(connection.serve(join, dispatch)))
+    await started.wait()
+    memory = (tracemalloc.get_traced_memory()[0] - baseline) / (pairs * 2)
+    tracemalloc.stop()
+
+    begin = time.perf_counter()
+    for player in players:
+        player.hold = False
+        if player.color == RED:
+            player.play()
+    await asyncio.sleep(seconds)
+    stop_event.set()
+    elapsed = time.perf_counter() - begin
+
+    for connection in connections:
+        connection.close()
+    await asyncio.gather(*tasks)
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    return players, elapsed, memory
+
+
+def run_p2p_bench(pairs, seconds, max_plies, base_port, rng):
+    """点对点模式：每对用NetworkTransport一端监听一端连接，返回值同run_server_bench"""
+    stop_event = threading.Event()
+    connected = threading.Semaphore(0)
+    transports = []
+    pairs_players = []
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for index in range(pairs):
+        pair = []
+        for _ in range(2):
+            transport = NetworkTransport(on_connected=lambda peer: connected.release())
+            player = BenchPlayer(transport.send, random.Random(rng.random()), max_plies, stop_event)
+            transport.on_message = player.dispatch
+            transports.append(transport)
+            pair.append((transport, player))
+        (host_transport, _), (client_transport, _) = pair
+        host_transport.start_server(base_port + index, "127.0.0.1").result()
+        client_transport.connect("127.0.0.1", base_port + index).result()
+        pairs_players.append(pair)
+    for _ in range(pairs * 2):
+        connected.acquire()
+    memory = (tracemalloc.get_traced_memory()[0] - baseline) / (pairs * 2)
+    tracemalloc.stop()
+
+    # 在各自的网络线程里开局，先让黑方准备好再让红方走第一步
+    for _, (client_transport, black_player) in pairs_players:
+        client_transport.loop.call_soon_threadsafe(black_player.start, BLACK)
+    time.sleep(0.1)
+    begin = time.perf_counter()
+    for (host_transport, red_player), _ in pairs_players:
+        host_transport.loop.call_soon_threadsafe(red_player.start, RED)
+    time.sleep(seconds)
+    stop_event.set()
+    elapsed = time.perf_counter() - begin
+
+    for transport in transports:
+        transport.close()
+    return [player for pair in pairs_players for _, player in pair], elapsed, memory
+
+
+def report(mode, pairs, players, elapsed, memory):
+    moves = sum(player.moves for player in players)
+    games = sum(player.games for player in players)
+    errors = sum(player.errors for player in players)
+    latencies = sorted(latency for player in players for latency in player.latencies)
+    print(f"模式: {mode}，{pairs}对客户端，{elapsed:.1f}秒")
+    print(f"走法: {moves}步，{moves / max(elapsed, 1e-9):.0f}步/秒，完成{games}局，错误{errors}次")
+    print(f"往返时间: p50 {percentile(latencies, 0.5) * 1000:.2f}毫秒，p99 {percentile(latencies, 0.99) * 1000:.2f}毫秒"
+          f"（{len(latencies)}个样本）")
+    print(f"每连接内存: {memory / 1024:.1f}KB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="中国象棋联机对战本机回环压测")
+    parser.add_argument("-n", "--pairs", type=int, default=50, help="模拟的客户端对数（默认50）")
+    parser.add_argument("-t", "--seconds", type=float, default=10.0, help="压测时长（秒，默认10）")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="每局最多走多少步")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="压测已经在运行的对战服务器，不在进程内启动")
+    parser.add_argument("--p2p", action="store_true", help="点对点模式，每对用NetworkTransport直连")
+    parser.add_argument("--port", type=int, default=5700, help="点对点模式的起始端口（默认5700）")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    try:
+        if args.p2p:
+            mode = "点对点"
+            players, elapsed, memory = run_p2p_bench(args.pairs, args.seconds, args.max_plies, args.port, rng)
+        else:
+            address = None
+            mode = "对战服务器（进程内）"
+            if args.connect:
+                host, _, port = args.connect.rpartition(":")
+                address = (host, int(port))
+                mode = f"对战服务器（{args.connect}）"
+            players, elapsed, memory = asyncio.run(
+                run_server_bench(args.pairs, args.seconds, args.max_plies, address, rng))
+    except (OSError, ValueError) as e:
+        print(f"压测失败: {e}", file=sys.stderr)
+        return 1
+    report(mode, args.pairs, players, elapsed, memory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""联机对战的网络传输层（asyncio，不依赖Qt）
+
+所有连接都在一个后台线程的asyncio事件循环里用非阻塞套接字处理，不再为监听和接收各开一个
+阻塞线程。收到的消息、连接和断开事件通过回调送出，回调在事件循环线程中调用，界面层需要
+把它们转到界面线程（ChessBoard用Qt信号完成）。
+
+线路上使用protocol.py的分帧二进制协议：连接建立后先互发HELLO核对协议版本；同一轮事件循环
+中要发送的多条消息合并成一次写出。Connection负责单条连接的收发，点对点对战的
+NetworkTransport和对战服务器game_server.py都用它。
+
+掉线的客户端可以用START中的会话令牌重连（RESUME），catch_up_messages计算需要补发的消息。
+每条连接定期发送PING，长时间收不到对方任何数据时按断开处理，半开的连接（例如手机网络切换）
+也能触发重连。
+"""
+import asyncio
+import threading
+
+import protocol
+from chess_rules import coords_to_move
+
+# 等待事件循环完成关闭的最长时间（秒）
+SHUTDOWN_TIMEOUT = 2.0
+
+# 每次从套接字读取的最大字节数
+READ_SIZE = 65536
+
+# 重连时最多逐步补发多少步，差得更多时改发快照
+RESUME_MAX_GAP = 64
+
+# 客户端掉线后自动重连的间隔（秒）和次数
+RECONNECT_DELAY = 2.0
+RECONNECT_ATTEMPTS = 10
+
+# 心跳：每隔HEARTBEAT_INTERVAL秒发一次PING，连续HEARTBEAT_MISSES个间隔没有收到对方任何数据时断开
+HEARTBEAT_INTERVAL = 5.0
+HEARTBEAT_MISSES = 3
+
+
+def catch_up_messages(position, room_id, plies, key):
+    """断线重连时要补发给对方的消息[(消息类型, 负载, 序号)]
+
+    对方已有plies步、且局面键与本方走完这些步后的局面一致时只补发缺少的MOVE，否则发送完整的SNAPSHOT。
+    """
+    moves = [coords_to_move(*entry[:4]) for entry in position.move_history]
+    if plies <= len(moves) and len(moves) - plies <= RESUME_MAX_GAP:
+        # key_history[i]是第i+1步走之前（即走完i步后）的局面键
+        expected = position.key_history[plies] if plies < len(moves) else position.key
+        if key == expected:
+            return [(protocol.MSG_MOVE, protocol.encode_move(moves[ply]), ply + 1) for ply in range(plies, len(moves))]
+    return [(protocol.MSG_SNAPSHOT, protocol.encode_snapshot(room_id, position.to_fen(), moves), 0)]
+
+
+class Connection:
+    """一条已建立的连接：分帧收发、HELLO握手、心跳和自动回复PING，只能在事件循环线程中使用"""
+
+    __slots__ = ("reader", "writer", "peer", "handshaken", "missed_heartbeats", "timed_out", "_pending")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        peer = writer.get_extra_info("peername")
+        self.peer = f"{peer[0]}:{peer[1]}" if peer else ""
+        self.handshaken = False
+        self.missed_heartbeats = 0  # 上次收到数据后过了几个心跳间隔
+        self.timed_out = False
+        self._pending = []  # 本轮事件循环中等待写出的消息
+        self.send(protocol.MSG_HELLO, protocol.encode_hello())
+
+    @property
+    def is_open(self):
+        return self.writer is not None
+
+    def send(self, msg_type, payload=b"", seq=0):
+        """排队一条消息，本轮事件循环结束前和其他消息一起写出"""
+        self.send_frame(protocol.encode(msg_type, seq, payload))
+
+    def send_frame(self, frame):
+        """排队一帧已经编码好的消息（广播时同一帧发给多个连接，只编码一次）"""
+        if self.writer is None:
+            return
+        if not self._pending:
+            asyncio.get_event_loop().call_soon(self._flush)
+        self._pending.append(frame)
+
+    def backlog(self):
+        """还没有写进套接字的字节数，用来发现跟不上的慢客户端"""
+        if self.writer is None:
+            return 0
+        return sum(len(frame) for frame in self._pending) + self.writer.transport.get_write_buffer_size()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        if self.writer is not None and pending:
+            self.writer.write(b"".join(pending))
+
+    async def serve(self, on_ready, on_message):
+        """读取消息直到连接断开，返回断开原因
+
+        握手成功后调用on_ready()，之后每条HELLO、PING、PONG以外的消息调用on_message(消息类型, 序号, 负载)。
+        """
+        reason = "对方已断开连接"
+        decoder = protocol.Decoder()
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        try:
+            while True:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                # 收到任何数据都说明连接还活着
+                self.missed_heartbeats = 0
+                for msg_type, seq, payload in decoder.feed(data):
+                    if not self.handshaken:
+                        self._handshake(msg_type, payload)
+                        on_ready()
+                    elif msg_type == protocol.MSG_PING:
+                        self.send(protocol.MSG_PONG, payload)
+                    elif msg_type == protocol.MSG_PONG:
+                        continue
+                    elif msg_type == protocol.MSG_HELLO:
+                        raise protocol.ProtocolError("重复的HELLO")
+                    else:
+                        on_message(msg_type, seq, payload)
+        except asyncio.CancelledError:
+            reason = "连接已关闭"
+        except protocol.ProtocolError as e:
+            reason = f"协议错误: {e}"
+        except OSError as e:
+            reason = f"连接异常: {e}"
+        finally:
+            heartbeat.cancel()
+            self.close()
+        if self.timed_out:
+            reason = "连接超时，对方长时间没有响应"
+        return reason
+
+    async def _heartbeat(self):
+        """定期发送PING，连续HEARTBEAT_MISSES个间隔没有收到任何数据时断开连接"""
+        while self.writer is not None:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if self.writer is None:
+                return
+            if self.missed_heartbeats >= HEARTBEAT_MISSES:
+                # 直接丢弃连接，serve()中的read()随即返回
+                self.timed_out = True
+                self.writer.transport.abort()
+                return
+            self.missed_heartbeats += 1
+            self.send(protocol.MSG_PING)
+
+    def _handshake(self, msg_type, payload):
+        if msg_type != protocol.MSG_HELLO:
+            raise protocol.ProtocolError("对方没有先发送HELLO")
+        version = protocol.decode_hello(payload)
+        if version != protocol.PROTOCOL_VERSION:
+            raise protocol.ProtocolError(f"协议版本不一致: 本方{protocol.PROTOCOL_VERSION}，对方{version}")
+        self.handshaken = True
+
+    def close(self):
+        """写出已排队的消息后关闭连接"""
+        if self.writer is not None:
+            self._flush()
+            self.writer.close()
+            self.writer = None
+
+
+class NetworkTransport:
+    """点对点对战连接：作为服务器等待一个对手，或作为客户端连接服务器
+
+    作为服务器时一直监听：没有对局时接受新连上来的一方；对局进行中（设置了会话令牌
+    set_session_token）时，不管旧连接是否已经断开，都只接受第一条消息是带着本局会话令牌的
+    RESUME的连接，并用它取代旧连接——对手的旧连接可能已经半开，本方还没有发现断开；
+    陌生的连接不能顶替对手。
+
+    on_connected(peer)在双方协议版本核对一致后调用，on_message(消息类型, 序号, 负载)收到除
+    HELLO、PING、PONG之外的消息时调用（PING由传输层直接回复PONG），on_disconnected(reason)和
+    on_error(message)在连接断开和出错时调用，都在事件循环线程中。send()、set_session_token()
+    和close()可以在任意线程中调用。
+    """
+
+    def __init__(self, on_connected=None, on_message=None, on_disconnected=None, on_error=None):
+        self.on_connected = on_connected
+        self.on_message = on_message
+        self.on_disconnected = on_disconnected
+        self.on_error = on_error
+        self.loop = None
+        self._thread = None
+        self._server = None
+        self._connection = None
+        self._tasks = set()  # 各连接的读取任务
+        self._session_token = None  # 作为服务器时本局的会话令牌，对手凭它重连
+
+    @property
+    def is_connected(self):
+        return self._connection is not None and self._connection.handshaken
+
+    def _ensure_loop(self):
+        """第一次使用时启动事件循环线程"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name="network-loop", daemon=True)
+            self._thread.start()
+
+    def _submit(self, coro):
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _emit(self, callback, *args):
+        if callback is not None:
+            callback(*args)
+
+    def start_server(self, port=5555, host="0.0.0.0"):
+        """开始监听，接受第一个连上来的对手"""
+        return self._submit(self._start_server(host, port))
+
+    def connect(self, host, port=5555):
+        """连接到服务器"""
+        return self._submit(self._connect(host, port))
+
+    def send(self, msg_type, payload=b"", seq=0):
+        """发送一条消息（不等待发送完成）"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._send, msg_type, payload, seq)
+
+    def set_session_token(self, token):
+        """作为服务器时记录本局的会话令牌，之后只接受带着它发RESUME的新连接；对局结束时传None"""
+        self._session_token = token
+
+    def close(self):
+        """断开连接、停止监听并结束事件循环线程"""
+        if self.loop is None:
+            return
+        try:
+            self._submit(self._shutdown()).result(SHUTDOWN_TIMEOUT)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(SHUTDOWN_TIMEOUT)
+        self.loop.close()
+        self.loop = None
+        self._thread = None
+
+    async def _start_server(self, host, port):
+        try:
+            self._server = await asyncio.start_server(self._accept, host, port)
+        except OSError as e:
+            self._emit(self.on_error, f"启动服务器失败: {e}")
+
+    async def _accept(self, reader, writer):
+        connection = Connection(reader, writer)
+        if self._connection is None and self._session_token is None:
+            self._attach(connection)
+        else:
+            # 已经有对手或对局还在进行：只接受对手凭会话令牌重连
+            self._spawn(self._read_loop(connection, replacing=True))
+
+    async def _connect(self, host, port):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            self._emit(self.on_error, f"连接服务器失败: {e}")
+            return
+        self._attach(Connection(reader, writer))
+
+    def _attach(self, connection):
+        self._connection = connection
+        self._spawn(self._read_loop(connection))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read_loop(self, connection, replacing=False):
+        """读取一条连接的消息直到断开
+
+        replacing为True时是已经有对手或对局还在进行时连上来的连接：第一条消息必须是带着本局
+        会话令牌的RESUME，之后它取代旧连接（旧连接关闭，不再通知断开），否则直接关闭。
+        """
+        def on_ready():
+            if not replacing:
+                self._emit(self.on_connected, connection.peer)
+
+        def on_message(msg_type, seq, payload):
+            if self._connection is not connection:
+                if not replacing or not self._is_resume(msg_type, payload):
+                    connection.close()
+                    return
+                previous, self._connection = self._connection, connection
+                if previous is not None:
+                    previous.close()
+                self._emit(self.on_connected, connection.peer)
+            self._emit(self.on_message, msg_type, seq, payload)
+
+        reason = await connection.serve(on_ready, on_message)
+        if self._connection is connection:
+            self._connection = None
+            self._emit(self.on_disconnected, reason)
+
+    def _is_resume(self, msg_type, payload):
+        """是否是带着本局会话令牌的RESUME"""
+        return (msg_type == protocol.MSG_RESUME and self._session_token is not None
+                and protocol.decode_resume(payload)[0] == self._session_token)
+
+    def _send(self, msg_type, payload, seq):
+        if self._connection is not None:
+            self._connection.send(msg_type, payload, seq)
+
+    async def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
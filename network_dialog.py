@@ -1,5 +1,6 @@
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QRadioButton, QButtonGroup, QMessageBox
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QIntValidator
 
 class NetworkDialog(QDialog):
     def __init__(self, parent=None):
@@ -18,15 +19,18 @@ class NetworkDialog(QDialog):
         
         self.server_radio = QRadioButton("作为服务器")
         self.client_radio = QRadioButton("作为客户端")
+        self.watch_radio = QRadioButton("观战")
         
         self.mode_group = QButtonGroup()
         self.mode_group.addButton(self.server_radio)
         self.mode_group.addButton(self.client_radio)
+        self.mode_group.addButton(self.watch_radio)
         
         self.server_radio.setChecked(True)
         
         mode_layout.addWidget(self.server_radio)
         mode_layout.addWidget(self.client_radio)
+        mode_layout.addWidget(self.watch_radio)
         
         # 端口设置
         port_layout = QHBoxLayout()
@@ -48,6 +52,18 @@ class NetworkDialog(QDialog):
         ip_layout.addWidget(self.ip_label)
         ip_layout.addWidget(self.ip_edit)
         
+        # 房间号设置（观战模式，0表示观看人数最多的对局）
+        room_layout = QHBoxLayout()
+        layout.addLayout(room_layout)
+        
+        self.room_label = QLabel("房间号:")
+        self.room_edit = QLineEdit("0")
+        # 只能输入数字，避免确定时无法转换成房间号
+        self.room_edit.setValidator(QIntValidator(0, 2147483647, self))
+        
+        room_layout.addWidget(self.room_label)
+        room_layout.addWidget(self.room_edit)
+        
         # 按钮
         button_layout = QHBoxLayout()
         layout.addLayout(button_layout)
@@ -60,6 +76,9 @@ class NetworkDialog(QDialog):
         
         # 连接信号
         self.server_radio.toggled.connect(self.toggle_mode)
+        self.watch_radio.toggled.connect(self.toggle_watch)
+        self.toggle_mode(True)
+        self.toggle_watch(False)
         self.ok_button.clicked.connect(self.accept)
         self.cancel_button.clicked.connect(self.reject)
         
@@ -76,6 +95,11 @@ class NetworkDialog(QDialog):
             self.ip_label.setEnabled(True)
             self.ip_edit.setEnabled(True)
     
+    def toggle_watch(self, checked):
+        """观战模式才需要房间号"""
+        self.room_label.setEnabled(checked)
+        self.room_edit.setEnabled(checked)
+    
     def get_settings(self):
         """获取设置"""
         is_server = self.server_radio.isChecked()
@@ -83,3 +107,9 @@ class NetworkDialog(QDialog):
         ip = self.ip_edit.text()
         
         return is_server, ip, port
+    
+    def get_watch_room(self):
+        """观战的房间号（0表示观看人数最多的对局），不是观战模式时返回None"""
+        if not self.watch_radio.isChecked():
+            return None
+        return int(self.room_edit.text() or 0)
@@ -0,0 +1,210 @@
+"""开局库：按Zobrist局面键查找开局走法（不依赖Qt）
+
+开局库文件格式（小端）：
+    文件头  4字节魔数b"XQBK" + uint32版本号
+    记录    (uint64局面键, uint16走法, uint16权重)，按(局面键, 走法)排序
+
+查找时用mmap映射文件，在记录上二分查找局面键，不需要把整个文件读入内存。
+
+生成开局库：
+    python opening_book.py book opening_book.bin
+
+棋谱目录下的每个.txt文件中，每行一盘棋，走法用ICCS坐标并以空白分隔，例如
+"h2e2 h9g7 h0g2 i9h9"（列a~i从红方左侧数起，行0~9从红方底线数起，也可写成"h2-e2"）。
+"#"之后为注释。行末可以有对局结果（1-0、0-1、1/2-1/2、*），生成时忽略。
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from chess_rules import Position, Rules, encode_move, move_to_coords, square
+
+BOOK_MAGIC = b"XQBK"
+BOOK_VERSION = 1
+HEADER = struct.Struct("<4sI")
+RECORD = struct.Struct("<QHH")
+
+# 默认开局库文件（与本模块放在同一目录）
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# 生成开局库时默认只收录每盘棋的前多少步（半回合）
+DEFAULT_MAX_PLIES = 20
+
+RESULT_TOKENS = ("1-0", "0-1", "1/2-1/2", "*")
+
+
+def parse_iccs(text):
+    """ICCS坐标（如"h2e2"或"h2-e2"）转换为整数走法，格式错误时抛出ValueError"""
+    text = text.replace("-", "").lower()
+    if len(text) != 4 or text[0] not in "abcdefghi" or text[2] not in "abcdefghi" \
+            or not text[1].isdigit() or not text[3].isdigit():
+        raise ValueError(f"无法识别的ICCS走法: {text!r}")
+    from_sq = square(9 - int(text[1]), ord(text[0]) - ord("a"))
+    to_sq = square(9 - int(text[3]), ord(text[2]) - ord("a"))
+    return encode_move(from_sq, to_sq)
+
+
+def format_iccs(move):
+    """整数走法转换为ICCS坐标"""
+    from_row, from_col = divmod(move >> 8, 9)
+    to_row, to_col = divmod(move & 0xFF, 9)
+    return f"{chr(ord('a') + from_col)}{9 - from_row}{chr(ord('a') + to_col)}{9 - to_row}"
+
+
+def mirror_move(move):
+    """左右镜像的走法"""
+    from_row, from_col = divmod(move >> 8, 9)
+    to_row, to_col = divmod(move & 0xFF, 9)
+    return encode_move(square(from_row, 8 - from_col), square(to_row, 8 - to_col))
+
+
+def is_legal_move(position, move):
+    """move是否为当前出棋方的合法走法"""
+    code = position.squares[move >> 8]
+    if not code or code >> 3 != position.side:
+        return False
+    return Rules(position).can_move(*move_to_coords(move))
+
+
+class OpeningBook:
+    """只读开局库，按局面键查找候选走法及其权重"""
+
+    def __init__(self, path=DEFAULT_BOOK_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size or (size - HEADER.size) % RECORD.size:
+            self._file.close()
+            raise ValueError(f"开局库文件大小不正确: {path}")
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._map, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError(f"不是可识别的开局库文件: {path}")
+        self.count = (size - HEADER.size) // RECORD.size
+
+    @classmethod
+    def load_default(cls):
+        """打开默认开局库，文件不存在或无法识别时返回None"""
+        try:
+            return cls(DEFAULT_BOOK_PATH)
+        except (OSError, ValueError):
+            return None
+
+    def close(self):
+        """关闭文件映射"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _key_at(self, index):
+        return struct.unpack_from("<Q", self._map, HEADER.size + index * RECORD.size)[0]
+
+    def probe(self, key):
+        """局面键对应的[(走法, 权重)]，没有收录时返回空列表"""
+        # 二分查找第一条局面键不小于key的记录
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        for index in range(low, self.count):
+            record_key, move, weight = RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+            if record_key != key:
+                break
+            entries.append((move, weight))
+        return entries
+
+    def choose(self, position, randomize=True, rng=random):
+        """为position的当前出棋方选择一步开局库走法，没有收录时返回None
+
+        randomize为True时按权重随机选择，否则选择权重最高的走法；不合法的走法（哈希冲突）会被忽略。
+        """
+        entries = [(move, weight) for move, weight in self.probe(position.key)
+                   if weight > 0 and is_legal_move(position, move)]
+        if not entries:
+            return None
+        if not randomize:
+            return max(entries, key=lambda entry: entry[1])[0]
+
+        pick = rng.randrange(sum(weight for _, weight in entries))
+        for move, weight in entries:
+            pick -= weight
+            if pick < 0:
+                return move
+        return entries[-1][0]
+
+
+def read_games(record_dir):
+    """读取棋谱目录下所有.txt文件，返回[(文件名, 行号, [ICCS走法])]"""
+    games = []
+    for name in sorted(os.listdir(record_dir)):
+        if not name.endswith(".txt"):
+            continue
+        with open(os.path.join(record_dir, name), encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                tokens = [token for token in line.split("#", 1)[0].split() if token not in RESULT_TOKENS]
+                if tokens:
+                    games.append((name, line_number, tokens))
+    return games
+
+
+def build_book(record_dir, output_path, max_plies=DEFAULT_MAX_PLIES, mirror=True):
+    """从棋谱目录生成开局库文件，返回收录的(局面, 走法)条数
+
+    每盘棋只收录前max_plies步，权重为该走法在该局面下出现的次数；mirror为True时同时收录左右镜像的棋局。
+    棋谱中有不合法的走法时抛出ValueError并指出文件和行号。
+    """
+    counts = {}
+    for name, line_number, tokens in read_games(record_dir):
+        try:
+            moves = [parse_iccs(token) for token in tokens[:max_plies]]
+        except ValueError as e:
+            raise ValueError(f"{name}第{line_number}行: {e}")
+        variants = [moves, [mirror_move(move) for move in moves]] if mirror else [moves]
+        for variant_index, variant in enumerate(variants):
+            position = Position()
+            for ply, move in enumerate(variant):
+                if not is_legal_move(position, move):
+                    if variant_index:
+                        break  # 原棋局合法时镜像棋局也合法，这里只是防御
+                    raise ValueError(f"{name}第{line_number}行第{ply + 1}步不合法: {tokens[ply]}")
+                entry = (position.key, move)
+                counts[entry] = counts.get(entry, 0) + 1
+                position.make_move(move)
+
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION))
+        for (key, move), count in sorted(counts.items()):
+            f.write(RECORD.pack(key, move, min(count, 0xFFFF)))
+    return len(counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从棋谱目录生成中国象棋开局库")
+    parser.add_argument("record_dir", help="棋谱目录（.txt文件，每行一盘ICCS走法）")
+    parser.add_argument("output", nargs="?", default=DEFAULT_BOOK_PATH, help="输出的开局库文件")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="每盘棋收录的步数")
+    parser.add_argument("--no-mirror", action="store_true", help="不收录左右镜像的棋局")
+    args = parser.parse_args(argv)
+
+    try:
+        count = build_book(args.record_dir, args.output, args.max_plies, not args.no_mirror)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"已写入{args.output}，共{count}条")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""走法生成的perft基准和正确性检查（不依赖Qt）
+
+perft统计从某个局面出发走到指定深度的全部合法走法序列（叶子节点）数，
+用来衡量走法生成/棋盘表示的吞吐量，并和公认的节点数对照，发现生成器的错误。
+
+用法：
+    python perft.py                     # 开局局面，深度1~3，输出节点数和每秒节点数
+    python perft.py -d 4 --fen "..."    # 指定局面和深度
+    python perft.py --divide -d 2       # 按根节点走法分别统计
+    python perft.py --check             # 用内置局面的已知节点数做回归检查，失败时返回非0
+"""
+import argparse
+import sys
+import time
+
+from chess_rules import Position, Rules, START_FEN, move_to_coords
+
+# 检查用局面及其各深度的已知节点数（开局局面与其余公认的中国象棋perft结果）
+PERFT_SUITE = [
+    (START_FEN, [44, 1920, 79666, 3290240]),
+    ("r1ba1a3/4kn3/2n1b4/pNp1p1p1p/4c4/6P2/P1P2R2P/1CcC5/9/2BAKAB2 w", [38, 1128, 43929, 1339047]),
+    ("1cbak4/9/n2a5/2p1p3p/5cp2/2n2N3/6PCP/3AB4/2C6/3A1K1N1 w", [7, 281, 8620, 326201]),
+    ("5a3/3k5/3aR4/9/5r3/5n3/9/3A1A3/5K3/2BC2B2 w", [25, 424, 9850, 202884]),
+    ("CRN1k1b2/3ca4/4ba3/9/2nr5/9/9/4B4/4A4/4KA3 w", [28, 516, 14808, 395483]),
+    ("R1N1k1b2/9/3aba3/9/2nr5/2B6/9/4B4/4A4/4KA3 w", [21, 364, 7626, 162837]),
+    ("C1nNk4/9/9/9/9/9/n1pp5/B3C4/9/3A1K3 w", [28, 222, 6241, 64971]),
+    ("4ka3/4a4/9/9/4N4/p8/9/4C3c/7n1/2BK5 w", [23, 345, 8124, 149272]),
+    ("2b1ka3/9/b3N4/4n4/9/9/9/4C4/2p6/2BK5 w", [21, 195, 3883, 48060]),
+    ("1C2ka3/9/C1Nab1n2/p3p3p/6p2/9/P3P3P/3AB4/3p2c2/c1BAK4 w", [30, 830, 22787, 649866]),
+    ("CnN1k1b2/c3a4/4ba3/9/2nr5/9/9/4C4/4A4/4KA3 w", [19, 583, 11714, 376467]),
+]
+
+
+def legal_moves(rules):
+    """当前出棋方的合法走法（Rules.legal_moves，只对可能送将的走法走一步再检查）"""
+    return rules.legal_moves(rules.position.side)
+
+
+def perft(rules, depth):
+    """统计depth层的叶子节点数"""
+    moves = legal_moves(rules)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    position = rules.position
+    nodes = 0
+    for move in moves:
+        captured = position.make_move(move)
+        nodes += perft(rules, depth - 1)
+        position.unmake_move(move, captured)
+    return nodes
+
+
+def divide(rules, depth):
+    """按根节点走法分别统计叶子节点数，返回[(走法, 节点数)]，用于和其他程序逐步比对"""
+    position = rules.position
+    result = []
+    for move in legal_moves(rules):
+        captured = position.make_move(move)
+        result.append((move, perft(rules, depth - 1)))
+        position.unmake_move(move, captured)
+    return result
+
+
+def timed_perft(fen, depth):
+    """在fen局面上计算perft，返回(节点数, 用时秒数)"""
+    rules = Rules(Position.from_fen(fen))
+    start = time.perf_counter()
+    nodes = perft(rules, depth)
+    return nodes, time.perf_counter() - start
+
+
+def format_move(move):
+    """整数走法显示为(行,列)->(行,列)"""
+    from_row, from_col, to_row, to_col = move_to_coords(move)
+    return f"({from_row},{from_col})->({to_row},{to_col})"
+
+
+def run_check(max_depth):
+    """用PERFT_SUITE做回归检查，返回不一致的数量"""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for fen, expected_counts in PERFT_SUITE:
+        for depth, expected in enumerate(expected_counts[:max_depth], 1):
+            nodes, elapsed = timed_perft(fen, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "OK" if nodes == expected else f"错误（应为{expected}）"
+            print(f"{fen}  深度{depth}: {nodes} {status}")
+            if nodes != expected:
+                failures += 1
+    print(f"共{total_nodes}个节点，用时{total_time:.2f}秒，{total_nodes / max(total_time, 1e-9):.0f}节点/秒")
+    print("全部通过" if not failures else f"{failures}项不一致")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="中国象棋走法生成perft基准")
+    parser.add_argument("-d", "--depth", type=int, default=3, help="最大深度（默认3）")
+    parser.add_argument("--fen", default=START_FEN, help="起始局面的FEN（默认开局局面）")
+    parser.add_argument("--divide", action="store_true", help="按根节点走法分别输出节点数")
+    parser.add_argument("--check", action="store_true", help="用内置局面的已知节点数做回归检查")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        return 1 if run_check(args.depth) else 0
+
+    if args.divide:
+        rules = Rules(Position.from_fen(args.fen))
+        total = 0
+        for move, nodes in divide(rules, args.depth):
+            print(f"{format_move(move)}: {nodes}")
+            total += nodes
+        print(f"合计: {total}")
+        return 0
+
+    for depth in range(1, args.depth + 1):
+        nodes, elapsed = timed_perft(args.fen, depth)
+        print(f"深度{depth}: {nodes}个节点，{elapsed:.3f}秒，{nodes / max(elapsed, 1e-9):.0f}节点/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
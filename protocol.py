@@ -0,0 +1,253 @@
+"""联机对战的二进制消息协议（不依赖Qt）
+
+每条消息是一帧，小端：
+    帧头    uint16负载长度 + uint8消息类型 + uint32序号
+    负载    按消息类型解释，见下面的encode_*/decode_*
+
+一步棋只有7字节帧头加2字节走法（chess_rules的整数走法）。MOVE消息的序号是这步棋在本局中的
+步数（从1开始），接收方据此发现重复、丢失或与本方棋局不一致的走法；REJECT的序号是被拒绝的
+步数；其他消息的序号为0。连接建立后双方先互发HELLO交换协议版本，版本不一致时断开。
+
+对战服务器（game_server.py）和点对点对战使用同一套消息：客户端连上后发送JOIN，
+对方（服务器或做主机的一方）回复START告知房间号和执子颜色。观众发送WATCH订阅一个房间，
+先收到SNAPSHOT（当前局面的FEN和从开局起的走法），之后收到和对局双方相同的MOVE帧。
+
+START中带有16字节的会话令牌。掉线的客户端重新连上后发送RESUME（令牌、已有的步数和当前
+局面键）代替JOIN，对方回复START后只补发缺少的MOVE；差得太多或局面键对不上时改发SNAPSHOT。
+
+Decoder是增量解码器：把从套接字读到的任意分段数据喂进去，返回其中所有完整的帧，
+不完整的部分留到下次；encode_batch把多条消息一次编码成连续的字节串，一次写出。
+"""
+import struct
+
+PROTOCOL_VERSION = 2
+
+# 消息类型
+MSG_HELLO = 1         # 负载：uint16协议版本
+MSG_MOVE = 2          # 负载：uint16走法
+MSG_UNDO_REQUEST = 3  # 无负载
+MSG_UNDO_REPLY = 4    # 负载：uint8是否同意
+MSG_RESIGN = 5        # 无负载
+MSG_PING = 6          # 负载：任意字节，对方原样放进PONG返回
+MSG_PONG = 7
+MSG_SYNC = 8          # 负载：从开局起的全部走法（uint16数组）
+MSG_JOIN = 9          # 无负载：请求匹配对手
+MSG_START = 10        # 负载：uint32房间号 + uint8执子颜色（0红1黑）+ 16字节会话令牌
+MSG_REJECT = 11       # 无负载：序号对应的走法被服务器拒绝，随后会收到SYNC；序号为0表示RESUME的会话已失效
+MSG_GAME_OVER = 12    # 负载：uint8胜方（RESULT_*）+ uint8原因（REASON_*）
+MSG_WATCH = 13        # 负载：uint32房间号（0表示观众最多的对局）
+MSG_SNAPSHOT = 14     # 负载：uint32房间号 + uint8 FEN长度 + FEN + 走法（uint16数组）
+MSG_ROOM_LIST = 15    # 请求无负载；回复为(uint32房间号, uint16步数, uint16观众数)数组，最多MAX_ROOM_ENTRIES项
+MSG_RESUME = 16       # 负载：16字节会话令牌 + uint16已有的步数 + uint64当前局面键
+
+MESSAGE_NAMES = {
+    MSG_HELLO: "HELLO",
+    MSG_MOVE: "MOVE",
+    MSG_UNDO_REQUEST: "UNDO_REQUEST",
+    MSG_UNDO_REPLY: "UNDO_REPLY",
+    MSG_RESIGN: "RESIGN",
+    MSG_PING: "PING",
+    MSG_PONG: "PONG",
+    MSG_SYNC: "SYNC",
+    MSG_JOIN: "JOIN",
+    MSG_START: "START",
+    MSG_REJECT: "REJECT",
+    MSG_GAME_OVER: "GAME_OVER",
+    MSG_WATCH: "WATCH",
+    MSG_SNAPSHOT: "SNAPSHOT",
+    MSG_ROOM_LIST: "ROOM_LIST",
+    MSG_RESUME: "RESUME",
+}
+
+# START中的执子颜色
+COLORS = ("red", "black")
+
+TOKEN_SIZE = 16
+
+# GAME_OVER中的胜方和结束原因
+RESULT_DRAW = 0
+RESULT_RED = 1
+RESULT_BLACK = 2
+REASON_MATE = 0        # 将死或困毙
+REASON_REPETITION = 1  # 循环走子裁决
+REASON_RESIGN = 2      # 认输
+REASON_ABANDON = 3     # 对方断开连接
+
+HEADER = struct.Struct("<HBI")
+MOVE = struct.Struct("<H")
+VERSION = struct.Struct("<H")
+FLAG = struct.Struct("<B")
+START = struct.Struct(f"<IB{TOKEN_SIZE}s")
+RESUME = struct.Struct(f"<{TOKEN_SIZE}sHQ")
+GAME_OVER = struct.Struct("<BB")
+ROOM_ID = struct.Struct("<I")
+SNAPSHOT = struct.Struct("<IB")
+ROOM_ENTRY = struct.Struct("<IHH")
+
+MAX_PAYLOAD = 0xFFFF
+MAX_SEQUENCE = 0xFFFFFFFF
+# 一条ROOM_LIST回复最多容纳的房间数
+MAX_ROOM_ENTRIES = MAX_PAYLOAD // ROOM_ENTRY.size
+
+
+class ProtocolError(ValueError):
+    """收到无法识别或不符合协议的数据"""
+
+
+def encode(msg_type, seq, payload=b""):
+    """编码一帧"""
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"消息负载过长: {len(payload)}字节")
+    return HEADER.pack(len(payload), msg_type, seq) + payload
+
+
+def encode_batch(messages):
+    """把[(消息类型, 序号, 负载)]编码成一段连续的字节串"""
+    size = sum(HEADER.size + len(payload) for _, _, payload in messages)
+    buffer = bytearray(size)
+    offset = 0
+    for msg_type, seq, payload in messages:
+        if len(payload) > MAX_PAYLOAD:
+            raise ProtocolError(f"消息负载过长: {len(payload)}字节")
+        HEADER.pack_into(buffer, offset, len(payload), msg_type, seq)
+        offset += HEADER.size
+        buffer[offset:offset + len(payload)] = payload
+        offset += len(payload)
+    return bytes(buffer)
+
+
+def encode_hello(version=PROTOCOL_VERSION):
+    return VERSION.pack(version)
+
+
+def decode_hello(payload):
+    return _unpack(VERSION, payload, MSG_HELLO)[0]
+
+
+def encode_move(move):
+    return MOVE.pack(move)
+
+
+def decode_move(payload):
+    return _unpack(MOVE, payload, MSG_MOVE)[0]
+
+
+def encode_flag(value):
+    return FLAG.pack(1 if value else 0)
+
+
+def decode_flag(payload):
+    return bool(_unpack(FLAG, payload, MSG_UNDO_REPLY)[0])
+
+
+def encode_start(room_id, color, token):
+    return START.pack(room_id, COLORS.index(color), token)
+
+
+def decode_start(payload):
+    """返回(房间号, "red"或"black", 会话令牌)"""
+    room_id, color, token = _unpack(START, payload, MSG_START)
+    if color >= len(COLORS):
+        raise ProtocolError(f"未知的执子颜色: {color}")
+    return room_id, COLORS[color], token
+
+
+def encode_resume(token, plies, key):
+    return RESUME.pack(token, plies, key)
+
+
+def decode_resume(payload):
+    """返回(会话令牌, 已有的步数, 当前局面键)"""
+    return _unpack(RESUME, payload, MSG_RESUME)
+
+
+def encode_game_over(result, reason):
+    return GAME_OVER.pack(result, reason)
+
+
+def decode_game_over(payload):
+    """返回(胜方, 原因)"""
+    return _unpack(GAME_OVER, payload, MSG_GAME_OVER)
+
+
+def encode_watch(room_id):
+    return ROOM_ID.pack(room_id)
+
+
+def decode_watch(payload):
+    return _unpack(ROOM_ID, payload, MSG_WATCH)[0]
+
+
+def encode_snapshot(room_id, fen, moves):
+    fen = fen.encode("ascii")
+    return SNAPSHOT.pack(room_id, len(fen)) + fen + encode_moves(moves)
+
+
+def decode_snapshot(payload):
+    """返回(房间号, FEN, 走法列表)"""
+    if len(payload) < SNAPSHOT.size:
+        raise ProtocolError("SNAPSHOT消息长度不正确")
+    room_id, fen_length = SNAPSHOT.unpack_from(payload)
+    moves_start = SNAPSHOT.size + fen_length
+    if len(payload) < moves_start:
+        raise ProtocolError("SNAPSHOT消息长度不正确")
+    try:
+        fen = payload[SNAPSHOT.size:moves_start].decode("ascii")
+    except UnicodeDecodeError:
+        raise ProtocolError("SNAPSHOT中的FEN无法识别")
+    return room_id, fen, decode_moves(payload[moves_start:])
+
+
+def encode_room_list(rooms):
+    """[(房间号, 步数, 观众数)]编码为ROOM_LIST回复"""
+    return b"".join(ROOM_ENTRY.pack(room_id, min(plies, 0xFFFF), min(spectators, 0xFFFF))
+                    for room_id, plies, spectators in rooms)
+
+
+def decode_room_list(payload):
+    if len(payload) % ROOM_ENTRY.size:
+        raise ProtocolError("ROOM_LIST消息长度不正确")
+    return list(ROOM_ENTRY.iter_unpack(payload))
+
+
+def encode_moves(moves):
+    """走法列表编码为uint16数组"""
+    return struct.pack(f"<{len(moves)}H", *moves)
+
+
+def decode_moves(payload):
+    if len(payload) % 2:
+        raise ProtocolError("走法列表长度不正确")
+    return list(struct.unpack(f"<{len(payload) // 2}H", payload))
+
+
+def _unpack(layout, payload, msg_type):
+    if len(payload) != layout.size:
+        raise ProtocolError(f"{MESSAGE_NAMES[msg_type]}消息长度不正确: {len(payload)}字节")
+    return layout.unpack(payload)
+
+
+class Decoder:
+    """增量解码器：feed()返回新收到的完整帧[(消息类型, 序号, 负载)]，遇到未知的消息类型时抛出ProtocolError"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        offset = 0
+        end = len(buffer)
+        while end - offset >= HEADER.size:
+            length, msg_type, seq = HEADER.unpack_from(buffer, offset)
+            frame_end = offset + HEADER.size + length
+            if frame_end > end:
+                break
+            if msg_type not in MESSAGE_NAMES:
+                raise ProtocolError(f"未知的消息类型: {msg_type}")
+            messages.append((msg_type, seq, bytes(buffer[offset + HEADER.size:frame_end])))
+            offset = frame_end
+        if offset:
+            del buffer[:offset]
+        return messages
@@ -0,0 +1,463 @@
+"""残局库：少子残局的逆向分析生成器和查询（不依赖Qt）
+
+残局库按子力组合（如"KRvK"：红方帅车对黑方将）分别生成，每个组合一个文件：
+    文件头  4字节魔数b"XQTB" + uint32版本号 + 16字节子力组合名
+    数据    每个局面一个有符号字节，从出棋方的角度表示结果：
+            0 和棋（或不合法的局面）；n>0 出棋方n步（半回合）内杀棋；
+            n<0 出棋方-n-1步后被杀（-1表示已经被将死或困毙）
+
+局面编号：各棋子依次在其可能出现的格子列表中的序号组成混合进制数，再乘2加出棋方。
+同种棋子有两个时按格子编号从小到大对应。查询时用mmap映射文件，只读取需要的字节。
+
+生成方法是逐轮的逆向归纳：先找出无棋可走（判负）的局面，第d轮把"有一步走到对方d-1步后
+被杀的局面"标为d步胜、把"所有走法都走到对方d-1步内胜的局面"标为d步负，直到连续两轮没有
+新结果，剩下的局面为和棋。吃子后的局面查对应的子力更少的残局库（需要时先递归生成）。
+长将、长捉等循环判负规则不在残局库考虑范围内，循环一律按和棋处理。
+
+生成残局库：
+    python tablebase.py KRvK KNvK KPvK
+"""
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from chess_rules import (
+    Position, Rules, RED, BLACK, KING, ADVISOR, ELEPHANT, HORSE, ROOK, CANNON, PAWN, NO_SQUARE,
+    FEN_LETTERS, FEN_TO_TYPE, PIECE_VALUES, KING_MOVES, ADVISOR_MOVES, ELEPHANT_MOVES, PAWN_MOVES,
+    make_piece, square, iter_squares,
+)
+
+TABLE_MAGIC = b"XQTB"
+TABLE_VERSION = 1
+HEADER = struct.Struct("<4sI16s")
+
+# 默认残局库目录（与本模块放在同一目录）
+DEFAULT_TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+
+# 查询结果
+DRAW, WIN, LOSS = 0, 1, 2
+
+# 单字节能表示的最大步数
+MAX_PLIES = 126
+
+# 能过河攻击对方的棋子；双方都没有这些棋子时必然是和棋，不需要残局库
+ATTACKING_TYPES = (HORSE, ROOK, CANNON, PAWN)
+ATTACKING_CODES = tuple(make_piece(t, side) for t in ATTACKING_TYPES for side in (RED, BLACK))
+
+
+def parse_signature(name):
+    """子力组合名（如"KRvKAA"）转换为(红方棋子类型元组, 黑方棋子类型元组)，格式错误时抛出ValueError"""
+    parts = name.upper().split("V")
+    if len(parts) != 2:
+        raise ValueError(f"子力组合名应为\"红方v黑方\"，例如KRvK: {name!r}")
+    signature = []
+    for part in parts:
+        if part.count("K") != 1 or any(letter.lower() not in FEN_TO_TYPE for letter in part):
+            raise ValueError(f"无法识别的子力组合: {name!r}")
+        signature.append(tuple(sorted(FEN_TO_TYPE[letter.lower()] for letter in part)))
+    return tuple(signature)
+
+
+def signature_name(signature):
+    """parse_signature的逆变换"""
+    return "v".join("".join(FEN_LETTERS[t].upper() for t in types) for types in signature)
+
+
+def position_signature(position):
+    """局面的子力组合"""
+    bitboards = position.piece_bitboards
+    signature = []
+    for side in (RED, BLACK):
+        types = []
+        for piece_type in range(KING, PAWN + 1):
+            types += [piece_type] * bin(bitboards[make_piece(piece_type, side)]).count("1")
+        signature.append(tuple(types))
+    return tuple(signature)
+
+
+def _strength(types):
+    return sum(PIECE_VALUES[t] for t in types), types
+
+
+def canonical_signature(signature):
+    """残局库只按强方为红方的方向生成，返回(规范的子力组合, 是否需要翻转棋盘)"""
+    red, black = signature
+    if _strength(red) >= _strength(black):
+        return signature, False
+    return (black, red), True
+
+
+def is_dead_draw(signature):
+    """双方都只剩将、士、象时不可能杀棋"""
+    return not any(t in ATTACKING_TYPES for types in signature for t in types)
+
+
+def flipped_position(position):
+    """上下翻转并交换红黑双方后的局面（结果对出棋方不变）"""
+    flipped = Position.__new__(Position)
+    flipped.board_size = 9
+    flipped.row_count = 10
+    flipped._clear()
+    flipped.move_history = []
+    for sq in iter_squares(position.occupancy[RED] | position.occupancy[BLACK]):
+        row, col = divmod(sq, 9)
+        flipped.put_piece(square(9 - row, col), position.squares[sq] ^ 8)
+    if position.side == RED:
+        flipped.switch_player()
+    return flipped
+
+
+def _reachable_squares(start_squares, moves_of):
+    """从初始位置出发按走法表能到达的所有格子"""
+    seen = set(start_squares)
+    frontier = list(start_squares)
+    while frontier:
+        sq = frontier.pop()
+        for target in moves_of(sq):
+            if target not in seen:
+                seen.add(target)
+                frontier.append(target)
+    return sorted(seen)
+
+
+def _piece_squares(piece_type, side):
+    """棋子在对局中可能出现的格子"""
+    def home(row, col):
+        return square(row if side == RED else 9 - row, col)
+
+    if piece_type == KING:
+        return _reachable_squares([home(9, 4)], lambda sq: KING_MOVES[side][sq])
+    if piece_type == ADVISOR:
+        return _reachable_squares([home(9, 3)], lambda sq: ADVISOR_MOVES[side][sq])
+    if piece_type == ELEPHANT:
+        return _reachable_squares([home(9, 2)], lambda sq: [to_sq for _, to_sq in ELEPHANT_MOVES[side][sq]])
+    if piece_type == PAWN:
+        return _reachable_squares([home(6, col) for col in (0, 2, 4, 6, 8)], lambda sq: PAWN_MOVES[side][sq])
+    return list(range(90))
+
+
+class Table:
+    """一个子力组合的残局库（数据可以是mmap或生成时的bytearray）"""
+
+    def __init__(self, signature, data=None):
+        self.signature = signature
+        self.name = signature_name(signature)
+        # 每个棋子一个槽位：(棋子编码, 可能的格子列表, 格子到序号的映射)，同种棋子的槽位相邻
+        self.slots = []
+        for side, types in enumerate(signature):
+            for piece_type in types:
+                squares = _piece_squares(piece_type, side)
+                self.slots.append((make_piece(piece_type, side), squares, {sq: i for i, sq in enumerate(squares)}))
+        self.size = 2
+        for _, squares, _ in self.slots:
+            self.size *= len(squares)
+        self.piece_count = len(self.slots)
+        self.data = data
+        self._offset = 0
+
+    @classmethod
+    def open(cls, path):
+        """用mmap打开残局库文件，格式不对时抛出ValueError"""
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, name = HEADER.unpack_from(data, 0)
+        if magic != TABLE_MAGIC or version != TABLE_VERSION:
+            data.close()
+            raise ValueError(f"不是可识别的残局库文件: {path}")
+        table = cls(parse_signature(name.rstrip(b"\0").decode("ascii")))
+        if len(data) != HEADER.size + table.size:
+            data.close()
+            raise ValueError(f"残局库文件大小不正确: {path}")
+        table.data = data
+        table._offset = HEADER.size
+        return table
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+
+    def index(self, position):
+        """局面编号，局面的子力组合必须与残局库一致；有棋子在不可能出现的格子上时返回None"""
+        bitboards = position.piece_bitboards
+        index = 0
+        previous_code = None
+        squares = None
+        for code, slot_squares, lookup in self.slots:
+            if code != previous_code:
+                squares = iter_squares(bitboards[code])
+                previous_code = code
+            slot_index = lookup.get(next(squares))
+            if slot_index is None:
+                return None
+            index = index * len(slot_squares) + slot_index
+        return index * 2 + position.side
+
+    def value(self, index):
+        """局面编号对应的有符号结果字节"""
+        byte = self.data[self._offset + index]
+        return byte - 256 if byte > 127 else byte
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(TABLE_MAGIC, TABLE_VERSION, self.name.encode("ascii")))
+            f.write(self.data)
+
+
+def decode_value(value):
+    """结果字节转换为(DRAW/WIN/LOSS, 步数)"""
+    if value > 0:
+        return WIN, value
+    if value < 0:
+        return LOSS, -value - 1
+    return DRAW, 0
+
+
+class Tablebases:
+    """残局库目录：按局面的子力组合找到对应的残局库并查询（打开文件延迟到第一次用到时）"""
+
+    def __init__(self, directory=DEFAULT_TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+        self.available = {}
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".xtb"):
+                    try:
+                        signature = parse_signature(name[:-4])
+                    except ValueError:
+                        continue
+                    self.available[signature] = os.path.join(directory, name)
+        self.max_pieces = max((len(red) + len(black) for red, black in self.available), default=0)
+
+    @classmethod
+    def load_default(cls):
+        """打开默认残局库目录，没有任何残局库文件时返回None"""
+        tablebases = cls(DEFAULT_TABLEBASE_DIR)
+        return tablebases if tablebases.available else None
+
+    def __getstate__(self):
+        # 传给工作进程时只传目录，在子进程中重新打开文件
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables.clear()
+
+    def table(self, signature):
+        """规范子力组合对应的残局库，没有时返回None"""
+        table = self.tables.get(signature)
+        if table is None and signature in self.available:
+            table = self.tables[signature] = Table.open(self.available[signature])
+        return table
+
+    def probe(self, position):
+        """查询局面，返回(DRAW/WIN/LOSS, 步数)，没有对应的残局库时返回None"""
+        if NO_SQUARE in position.king_sq:
+            return None
+        bitboards = position.piece_bitboards
+        if not any(bitboards[code] for code in ATTACKING_CODES):
+            return DRAW, 0
+        if bin(position.occupancy[RED] | position.occupancy[BLACK]).count("1") > self.max_pieces:
+            return None
+        signature, flip = canonical_signature(position_signature(position))
+        table = self.table(signature)
+        if table is None:
+            return None
+        index = table.index(flipped_position(position) if flip else position)
+        if index is None:
+            return None
+        return decode_value(table.value(index))
+
+
+def _sub_signatures(signature):
+    """吃掉一个棋子（将/帅除外）后可能出现的子力组合"""
+    result = set()
+    for side in (RED, BLACK):
+        types = signature[side]
+        for i, piece_type in enumerate(types):
+            if piece_type == KING:
+                continue
+            remaining = list(signature)
+            remaining[side] = types[:i] + types[i + 1:]
+            result.add(tuple(remaining))
+    return result
+
+
+def generate(name, directory=DEFAULT_TABLEBASE_DIR, verbose=True):
+    """生成子力组合name的残局库（以及吃子后需要的更小的残局库），返回文件路径"""
+    signature, _ = canonical_signature(parse_signature(name))
+    if is_dead_draw(signature):
+        raise ValueError(f"{signature_name(signature)}必然是和棋，不需要残局库")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, signature_name(signature) + ".xtb")
+
+    for sub_signature in _sub_signatures(signature):
+        canonical, _ = canonical_signature(sub_signature)
+        sub_path = os.path.join(directory, signature_name(canonical) + ".xtb")
+        if not is_dead_draw(canonical) and not os.path.exists(sub_path):
+            generate(signature_name(canonical), directory, verbose)
+
+    start = time.perf_counter()
+    table = Table(signature)
+    table.data = _solve(table, Tablebases(directory))
+    table.save(path)
+    if verbose:
+        print(f"{table.name}: {table.size}个局面，用时{time.perf_counter() - start:.1f}秒 -> {path}")
+    return path
+
+
+def _solve(table, tablebases):
+    """逆向归纳求出table中所有局面的结果，返回结果字节的bytearray"""
+    size = table.size
+    result = bytearray(size)  # DRAW/WIN/LOSS
+    distance = array("H", bytes(2 * size))
+
+    # 未解决局面的信息：编号、不吃子走法到达的局面编号区间、吃子走法的结果汇总
+    pending = array("I")
+    child_start = array("I")
+    children = array("I")
+    capture_win = array("H")  # 吃子后对方被杀的最短步数+1，0表示没有
+    capture_loss = array("H")  # 吃子后对方胜的最长步数+1
+    capture_open = bytearray()  # 是否有吃子走法走到和棋
+
+    position = Position.__new__(Position)
+    position.board_size = 9
+    position.row_count = 10
+    position.move_history = []
+    rules = Rules(position)
+    slots = table.slots
+    slot_ranges = [range(len(squares)) for _, squares, _ in slots]
+    duplicate_pairs = [i for i in range(1, len(slots)) if slots[i][0] == slots[i - 1][0]]
+
+    for combo_index, combo in enumerate(itertools.product(*slot_ranges)):
+        # 同种棋子只生成按格子编号升序的排列，其余排列不会被查询
+        if any(combo[i - 1] >= combo[i] for i in duplicate_pairs):
+            continue
+        squares = [slots[i][1][c] for i, c in enumerate(combo)]
+        if len(set(squares)) != len(squares):
+            continue
+
+        position._clear()
+        for (code, _, _), sq in zip(slots, squares):
+            position.put_piece(sq, code)
+
+        for side in (RED, BLACK):
+            index = combo_index * 2 + side
+            position.side = side
+            # 不走棋的一方被将军：不合法的局面
+            if rules.is_square_attacked(position.king_sq[side ^ 1], side):
+                continue
+
+            win, loss, open_capture = 0, 0, False
+            moves = []
+            for move in rules.generate_side_moves(side):
+                captured = position.make_move(move)
+                if not rules.is_square_attacked(position.king_sq[side], side ^ 1):
+                    if captured:
+                        outcome, plies = tablebases.probe(position)
+                        if outcome == LOSS:
+                            win = plies + 1 if not win else min(win, plies + 1)
+                        elif outcome == WIN:
+                            loss = max(loss, plies + 1)
+                        else:
+                            open_capture = True
+                    else:
+                        moves.append(table.index(position))
+                position.unmake_move(move, captured)
+
+            if not moves and not win and not loss and not open_capture:
+                # 无棋可走：被将死或困毙，都判负
+                result[index] = LOSS
+                continue
+            pending.append(index)
+            child_start.append(len(children))
+            children.extend(moves)
+            capture_win.append(win)
+            capture_loss.append(loss)
+            capture_open.append(open_capture)
+    child_start.append(len(children))
+
+    # 逐轮逆向归纳：第d轮只使用距离小于d的子局面，保证得到的是最短（最长）杀棋步数
+    max_capture = max(max(capture_win, default=0), max(capture_loss, default=0))
+    active = list(range(len(pending)))
+    depth = 0
+    idle_rounds = 0
+    while active and (idle_rounds < 2 or depth <= max_capture):
+        depth += 1
+        still_active = []
+        resolved = 0
+        for k in active:
+            index = pending[k]
+            if capture_win[k] == depth:
+                result[index] = WIN
+                distance[index] = depth
+                resolved += 1
+                continue
+
+            all_lost = not capture_open[k] and capture_loss[k] <= depth and not capture_win[k]
+            reached = capture_loss[k] == depth
+            won = False
+            for child in children[child_start[k]:child_start[k + 1]]:
+                outcome = result[child]
+                child_distance = distance[child] + 1
+                if outcome == LOSS and child_distance == depth:
+                    won = True
+                    break
+                if outcome != WIN or child_distance > depth:
+                    all_lost = False
+                elif child_distance == depth:
+                    reached = True
+
+            if won:
+                result[index] = WIN
+                distance[index] = depth
+                resolved += 1
+            elif all_lost and reached:
+                result[index] = LOSS
+                distance[index] = depth
+                resolved += 1
+            else:
+                still_active.append(k)
+        active = still_active
+        idle_rounds = 0 if resolved else idle_rounds + 1
+
+    if max(distance, default=0) > MAX_PLIES:
+        raise ValueError(f"{table.name}的杀棋步数超过{MAX_PLIES}，无法用单字节保存")
+
+    data = bytearray(size)
+    for index in range(size):
+        outcome = result[index]
+        if outcome == WIN:
+            data[index] = distance[index]
+        elif outcome == LOSS:
+            data[index] = (-distance[index] - 1) & 0xFF
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成中国象棋残局库")
+    parser.add_argument("signatures", nargs="+", help="子力组合，例如KRvK、KNPvK、KRvKA")
+    parser.add_argument("-o", "--directory", default=DEFAULT_TABLEBASE_DIR, help="残局库目录")
+    args = parser.parse_args(argv)
+
+    try:
+        for name in args.signatures:
+            generate(name, args.directory)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
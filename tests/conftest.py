@@ -0,0 +1,24 @@
+"""测试公共配置：把仓库根目录加入导入路径，慢速测试默认跳过（加--runslow运行）"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", default=False, help="同时运行标记为slow的测试")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: 耗时较长的测试，默认跳过，加--runslow运行")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="慢速测试，加--runslow运行")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
@@ -0,0 +1,63 @@
+"""增量评估测试：make/unmake后增量维护的评估分、子力、阶段和局面键与从头计算的结果一致"""
+import random
+
+from chess_rules import (BLACK, EVAL_EG, EVAL_MG, PHASE_BY_CODE, PIECE_VALUES, ZOBRIST_PIECES,
+                         ZOBRIST_SIDE, Position, Rules)
+
+MIDDLEGAME_FEN = "r1ba1a3/4kn3/2n1b4/pNp1p1p1p/4c4/6P2/P1P2R2P/1CcC5/9/2BAKAB2 w"
+
+
+def from_scratch(position):
+    """按棋盘上的棋子重新计算(中局分, 残局分, 子力, 阶段, 局面键)"""
+    mg, eg, material = [0, 0], [0, 0], [0, 0]
+    phase = 0
+    key = ZOBRIST_SIDE if position.side == BLACK else 0
+    for sq, code in enumerate(position.squares):
+        if not code:
+            continue
+        side = code >> 3
+        mg[side] += EVAL_MG[code][sq]
+        eg[side] += EVAL_EG[code][sq]
+        material[side] += PIECE_VALUES[code & 7]
+        phase += PHASE_BY_CODE[code]
+        key ^= ZOBRIST_PIECES[code][sq]
+    return mg, eg, material, phase, key
+
+
+def incremental(position):
+    return position.eval_mg, position.eval_eg, position.material, position.phase, position.key
+
+
+def test_incremental_state_matches_recomputation():
+    rng = random.Random(20240518)
+    for fen in (None, MIDDLEGAME_FEN):
+        position = Position() if fen is None else Position.from_fen(fen)
+        rules = Rules(position)
+        initial = from_scratch(position)
+        assert incremental(position) == initial
+
+        played = []
+        for _ in range(60):
+            moves = rules.legal_moves(position.side)
+            if not moves:
+                break
+            # 优先吃子，覆盖吃子时阶段和子力的增量更新
+            captures = [move for move in moves if position.squares[move & 0xFF]]
+            move = rng.choice(captures or moves)
+            played.append((move, position.make_move(move)))
+            assert incremental(position) == from_scratch(position)
+
+        for move, captured in reversed(played):
+            position.unmake_move(move, captured)
+            assert incremental(position) == from_scratch(position)
+        assert incremental(position) == initial
+
+
+def test_evaluate_matches_rebuilt_position():
+    position = Position.from_fen(MIDDLEGAME_FEN)
+    rules = Rules(position)
+    for move in rules.legal_moves(position.side):
+        captured = position.make_move(move)
+        rebuilt = Position.from_fen(position.to_fen())
+        assert position.evaluate() == rebuilt.evaluate()
+        position.unmake_move(move, captured)
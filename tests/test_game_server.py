@@ -0,0 +1,234 @@
+"""对战服务器测试：在本机回环地址上启动GameServer，用真实的连接收发消息"""
+import asyncio
+
+import protocol
+from chess_rules import Position, coords_to_move
+from game_server import GameServer, Room
+
+TIMEOUT = 5
+
+
+class Client:
+    """测试用的客户端：握手后按顺序读取消息，跳过心跳"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = protocol.Decoder()
+        self.received = []
+
+    @classmethod
+    async def connect(cls, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        client = cls(reader, writer)
+        client.send(protocol.MSG_HELLO, protocol.encode_hello())
+        assert (await client.receive())[0] == protocol.MSG_HELLO
+        return client
+
+    def send(self, msg_type, payload=b"", seq=0):
+        self.writer.write(protocol.encode(msg_type, seq, payload))
+
+    async def receive(self):
+        """读取下一条消息(消息类型, 序号, 负载)"""
+        while True:
+            while self.received:
+                message = self.received.pop(0)
+                if message[0] not in (protocol.MSG_PING, protocol.MSG_PONG):
+                    return message
+            data = await asyncio.wait_for(self.reader.read(65536), TIMEOUT)
+            assert data, "服务器关闭了连接"
+            self.received += self.decoder.feed(data)
+
+    async def expect(self, msg_type):
+        message = await self.receive()
+        assert message[0] == msg_type, f"期望{protocol.MESSAGE_NAMES[msg_type]}，收到{protocol.MESSAGE_NAMES[message[0]]}"
+        return message
+
+    def close(self):
+        self.writer.close()
+
+
+def run_server(test, **kwargs):
+    """启动服务器，运行test(game_server, port)后关闭"""
+    async def run():
+        game_server = GameServer(**kwargs)
+        server = await game_server.start("127.0.0.1", 0)
+        try:
+            await test(game_server, server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+async def start_game(port):
+    """两名玩家JOIN开局，返回(红方, 黑方, 各自的START)"""
+    red = await Client.connect(port)
+    red.send(protocol.MSG_JOIN)
+    await asyncio.sleep(0.05)
+    black = await Client.connect(port)
+    black.send(protocol.MSG_JOIN)
+    red_start = protocol.decode_start((await red.expect(protocol.MSG_START))[2])
+    black_start = protocol.decode_start((await black.expect(protocol.MSG_START))[2])
+    assert red_start[1] == "red" and black_start[1] == "black"
+    return red, black, red_start, black_start
+
+
+CANNON = coords_to_move(7, 1, 7, 4)   # 炮二平五
+HORSE = coords_to_move(0, 1, 2, 2)    # 马8进7
+
+
+async def expect_reject(client, seq, moves):
+    assert (await client.expect(protocol.MSG_REJECT))[1] == seq
+    assert protocol.decode_moves((await client.expect(protocol.MSG_SYNC))[2]) == moves
+
+
+def test_legal_move_is_forwarded():
+    async def test(game_server, port):
+        red, black, _, _ = await start_game(port)
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        _, seq, payload = await black.expect(protocol.MSG_MOVE)
+        assert (seq, protocol.decode_move(payload)) == (1, CANNON)
+        room, = game_server.rooms.values()
+        assert room.move_log() == [CANNON]
+        red.close()
+        black.close()
+
+    run_server(test)
+
+
+def test_illegal_move_is_rejected():
+    async def test(game_server, port):
+        red, black, _, _ = await start_game(port)
+        # 车不能斜走
+        red.send(protocol.MSG_MOVE, protocol.encode_move(coords_to_move(9, 0, 8, 1)), 1)
+        await expect_reject(red, 1, [])
+        # 越界的格子和空格子
+        red.send(protocol.MSG_MOVE, protocol.encode_move(0xFFFF), 1)
+        await expect_reject(red, 1, [])
+        red.send(protocol.MSG_MOVE, protocol.encode_move(coords_to_move(5, 0, 4, 0)), 1)
+        await expect_reject(red, 1, [])
+        # 对手什么也没收到，之后的合法走法照常转发
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        assert protocol.decode_move((await black.expect(protocol.MSG_MOVE))[2]) == CANNON
+        red.close()
+        black.close()
+
+    run_server(test)
+
+
+def test_stale_and_duplicate_seq_are_rejected():
+    async def test(game_server, port):
+        red, black, _, _ = await start_game(port)
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        await black.expect(protocol.MSG_MOVE)
+        black.send(protocol.MSG_MOVE, protocol.encode_move(HORSE), 2)
+        await red.expect(protocol.MSG_MOVE)
+        # 重复发送已经走过的第1步
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        await expect_reject(red, 1, [CANNON, HORSE])
+        # 跳过了第3步
+        red.send(protocol.MSG_MOVE, protocol.encode_move(coords_to_move(9, 1, 7, 2)), 4)
+        await expect_reject(red, 4, [CANNON, HORSE])
+        room, = game_server.rooms.values()
+        assert room.move_log() == [CANNON, HORSE]
+        red.close()
+        black.close()
+
+    run_server(test)
+
+
+def test_move_out_of_turn_is_rejected():
+    async def test(game_server, port):
+        red, black, _, _ = await start_game(port)
+        # 红方先走，黑方抢先走棋
+        black.send(protocol.MSG_MOVE, protocol.encode_move(HORSE), 1)
+        await expect_reject(black, 1, [])
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        await black.expect(protocol.MSG_MOVE)
+        # 红方连走两步，也不能走对方的棋子
+        red.send(protocol.MSG_MOVE, protocol.encode_move(coords_to_move(9, 1, 7, 2)), 2)
+        await expect_reject(red, 2, [CANNON])
+        red.send(protocol.MSG_MOVE, protocol.encode_move(HORSE), 2)
+        await expect_reject(red, 2, [CANNON])
+        room, = game_server.rooms.values()
+        assert room.move_log() == [CANNON]
+        red.close()
+        black.close()
+
+    run_server(test)
+
+
+def test_room_list_fits_in_one_message():
+    async def test(game_server, port):
+        # 房间数超过一条ROOM_LIST的容量，只列出观众最多的房间
+        for room_id in range(1, protocol.MAX_ROOM_ENTRIES + 100):
+            room = Room(room_id, None, None)
+            room.spectators.update(range(room_id % 7))
+            game_server.rooms[room_id] = room
+        client = await Client.connect(port)
+        client.send(protocol.MSG_ROOM_LIST)
+        rooms = protocol.decode_room_list((await client.expect(protocol.MSG_ROOM_LIST))[2])
+        assert len(rooms) == protocol.MAX_ROOM_ENTRIES
+        assert len({room_id for room_id, _, _ in rooms}) == len(rooms)
+        assert min(spectators for _, _, spectators in rooms) >= max(
+            len(room.spectators) for room_id, room in game_server.rooms.items()
+            if room_id not in {room_id for room_id, _, _ in rooms})
+        # 观看不存在的房间时回复的房间列表也不会超长，连接保持正常
+        client.send(protocol.MSG_WATCH, protocol.encode_watch(0xFFFFFFFF))
+        assert len(protocol.decode_room_list((await client.expect(protocol.MSG_ROOM_LIST))[2])) == len(rooms)
+        client.close()
+
+    run_server(test)
+
+
+def test_resume_within_timeout_catches_up():
+    async def test(game_server, port):
+        red, black, red_start, _ = await start_game(port)
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        await black.expect(protocol.MSG_MOVE)
+        red.close()
+        await asyncio.sleep(0.05)
+        black.send(protocol.MSG_MOVE, protocol.encode_move(HORSE), 2)
+        await asyncio.sleep(0.05)
+
+        # 红方带着令牌、已有的1步和当时的局面键重连，只补发缺少的第2步
+        position = Position()
+        position.make_move(CANNON)
+        red = await Client.connect(port)
+        red.send(protocol.MSG_RESUME, protocol.encode_resume(red_start[2], 1, position.key))
+        assert protocol.decode_start((await red.expect(protocol.MSG_START))[2]) == red_start
+        _, seq, payload = await red.expect(protocol.MSG_MOVE)
+        assert (seq, protocol.decode_move(payload)) == (2, HORSE)
+        red.send(protocol.MSG_MOVE, protocol.encode_move(coords_to_move(9, 1, 7, 2)), 3)
+        assert (await black.expect(protocol.MSG_MOVE))[1] == 3
+
+        # 重连后超时不再判负
+        await asyncio.sleep(0.3)
+        assert len(game_server.rooms) == 1
+        red.close()
+        black.close()
+
+    run_server(test, resume_timeout=0.2)
+
+
+def test_abandon_after_resume_timeout():
+    async def test(game_server, port):
+        red, black, red_start, _ = await start_game(port)
+        red.send(protocol.MSG_MOVE, protocol.encode_move(CANNON), 1)
+        await black.expect(protocol.MSG_MOVE)
+        red.close()
+        # 红方没有在resume_timeout内回来，判黑方获胜
+        game_over = protocol.decode_game_over((await black.expect(protocol.MSG_GAME_OVER))[2])
+        assert game_over == (protocol.RESULT_BLACK, protocol.REASON_ABANDON)
+        assert not game_server.rooms and not game_server.sessions
+
+        # 对局结束后令牌作废
+        red = await Client.connect(port)
+        red.send(protocol.MSG_RESUME, protocol.encode_resume(red_start[2], 1, 0))
+        assert (await red.expect(protocol.MSG_REJECT))[1] == 0
+        red.close()
+        black.close()
+
+    run_server(test, resume_timeout=0.2)
@@ -0,0 +1,110 @@
+"""网络传输层测试：重连时补发的消息，做主机的NetworkTransport只接受凭会话令牌重连的对手"""
+import asyncio
+import random
+import threading
+
+import protocol
+from chess_rules import Position, Rules, move_to_coords
+from network import RESUME_MAX_GAP, NetworkTransport, catch_up_messages
+
+TOKEN = bytes(range(protocol.TOKEN_SIZE))
+
+
+def play_random_game(plies, seed=3):
+    """随机走plies步不吃子的棋（记录走法历史），返回(棋局, 走法列表, 每步走完后的局面键)"""
+    rng = random.Random(seed)
+    position = Position()
+    rules = Rules(position)
+    moves, keys = [], [position.key]
+    for _ in range(plies):
+        move = rng.choice([move for move in rules.legal_moves(position.side) if not position.squares[move & 0xFF]])
+        position.move_piece(*move_to_coords(move))
+        position.switch_player()
+        moves.append(move)
+        keys.append(position.key)
+    return position, moves, keys
+
+
+def test_catch_up_sends_only_missing_moves():
+    position, moves, keys = play_random_game(RESUME_MAX_GAP + 20)
+    total = len(moves)
+    for plies in (total - 1, total - 3, total - RESUME_MAX_GAP):
+        messages = catch_up_messages(position, 5, plies, keys[plies])
+        assert [(msg_type, seq) for msg_type, _, seq in messages] == [
+            (protocol.MSG_MOVE, ply + 1) for ply in range(plies, total)]
+        assert [protocol.decode_move(payload) for _, payload, _ in messages] == moves[plies:]
+    # 已经是最新局面时什么也不用补
+    assert catch_up_messages(position, 5, total, keys[total]) == []
+
+
+def test_catch_up_falls_back_to_snapshot():
+    position, moves, keys = play_random_game(RESUME_MAX_GAP + 20)
+    total = len(moves)
+    for plies, key in ((total - RESUME_MAX_GAP - 1, keys[total - RESUME_MAX_GAP - 1]),  # 差得太多
+                       (total - 3, keys[total - 4]),  # 局面键对不上
+                       (total, keys[total - 1]),
+                       (total + 1, keys[total])):  # 对方的步数比本方还多
+        messages = catch_up_messages(position, 5, plies, key)
+        assert [(msg_type, seq) for msg_type, _, seq in messages] == [(protocol.MSG_SNAPSHOT, 0)]
+        assert protocol.decode_snapshot(messages[0][1]) == (5, position.to_fen(), moves)
+
+
+class Host:
+    """做主机的NetworkTransport，回调都记录下来"""
+
+    def __init__(self):
+        self.events = []
+        self.changed = threading.Condition()
+        self.transport = NetworkTransport(
+            on_connected=lambda peer: self.record("connected"),
+            on_message=lambda msg_type, seq, payload: self.record(protocol.MESSAGE_NAMES[msg_type]),
+            on_disconnected=lambda reason: self.record("disconnected"))
+        self.transport.start_server(0, "127.0.0.1").result(5)
+        self.port = self.transport._server.sockets[0].getsockname()[1]
+
+    def record(self, event):
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def wait_for(self, count):
+        with self.changed:
+            assert self.changed.wait_for(lambda: len(self.events) >= count, 5)
+        return self.events
+
+
+async def open_client(port, messages):
+    """连上主机发出HELLO和messages，返回连接在超时前是否被主机关闭"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(protocol.encode_batch([(protocol.MSG_HELLO, 0, protocol.encode_hello())] + messages))
+    try:
+        while await asyncio.wait_for(reader.read(65536), 0.5):
+            pass
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        writer.close()
+
+
+def test_stranger_cannot_take_over_game_in_progress():
+    host = Host()
+    try:
+        # 对局中对手掉线了（没有连接但令牌还在）：陌生人的JOIN和错误的令牌都被直接关闭
+        host.transport.set_session_token(TOKEN)
+        assert asyncio.run(open_client(host.port, [(protocol.MSG_JOIN, 0, b"")]))
+        wrong = protocol.encode_resume(bytes(protocol.TOKEN_SIZE), 0, 0)
+        assert asyncio.run(open_client(host.port, [(protocol.MSG_RESUME, 0, wrong)]))
+        assert host.events == []
+
+        # 凭令牌重连的对手被接受
+        resume = protocol.encode_resume(TOKEN, 0, 0)
+        assert not asyncio.run(open_client(host.port, [(protocol.MSG_RESUME, 0, resume)]))
+        assert host.wait_for(3) == ["connected", "RESUME", "disconnected"]
+
+        # 对局结束后新的对手可以JOIN
+        host.transport.set_session_token(None)
+        asyncio.run(open_client(host.port, [(protocol.MSG_JOIN, 0, b"")]))
+        assert host.wait_for(5)[3:5] == ["connected", "JOIN"]
+    finally:
+        host.transport.close()
@@ -0,0 +1,86 @@
+"""开局库测试：二分查找局面键、生成和选择走法"""
+import random
+
+import pytest
+
+from chess_rules import Position
+from opening_book import BOOK_MAGIC, BOOK_VERSION, HEADER, RECORD, OpeningBook, build_book, parse_iccs
+
+
+def write_book(path, records):
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION))
+        for record in sorted(records):
+            f.write(RECORD.pack(*record))
+
+
+def test_probe_finds_every_key_by_binary_search(tmp_path):
+    rng = random.Random(7)
+    keys = sorted({rng.randrange(1, (1 << 64) - 1) for _ in range(300)})
+    records = []
+    for index, key in enumerate(keys):
+        # 每个局面1~3个走法，同一局面的记录相邻
+        for move in range(index % 3 + 1):
+            records.append((key, 0x0100 + move, index + move))
+    path = tmp_path / "book.bin"
+    write_book(path, records)
+
+    book = OpeningBook(str(path))
+    try:
+        assert book.count == len(records)
+        for index, key in enumerate(keys):
+            assert book.probe(key) == [(0x0100 + move, index + move) for move in range(index % 3 + 1)]
+        # 比所有键都小、都大以及夹在两个键之间的局面都查不到
+        assert book.probe(0) == []
+        assert book.probe((1 << 64) - 1) == []
+        for left, right in zip(keys, keys[1:]):
+            if right - left > 1:
+                assert book.probe(left + 1) == []
+    finally:
+        book.close()
+
+
+def test_empty_book(tmp_path):
+    path = tmp_path / "empty.bin"
+    write_book(path, [])
+    book = OpeningBook(str(path))
+    try:
+        assert book.probe(Position().key) == []
+        assert book.choose(Position()) is None
+    finally:
+        book.close()
+
+
+def test_rejects_malformed_files(tmp_path):
+    truncated = tmp_path / "truncated.bin"
+    truncated.write_bytes(HEADER.pack(BOOK_MAGIC, BOOK_VERSION) + b"\0" * (RECORD.size - 1))
+    with pytest.raises(ValueError):
+        OpeningBook(str(truncated))
+
+    wrong_magic = tmp_path / "magic.bin"
+    wrong_magic.write_bytes(HEADER.pack(b"ABCD", BOOK_VERSION))
+    with pytest.raises(ValueError):
+        OpeningBook(str(wrong_magic))
+
+
+def test_build_and_choose(tmp_path):
+    records = tmp_path / "games"
+    records.mkdir()
+    (records / "games.txt").write_text("h2e2 h9g7  # 中炮对屏风马\nh2e2 h9g7 1-0\nb2e2 b9c7\n", encoding="utf-8")
+    path = tmp_path / "book.bin"
+    assert build_book(str(records), str(path), mirror=False) == 4
+
+    book = OpeningBook(str(path))
+    try:
+        start = Position()
+        assert sorted(book.probe(start.key)) == sorted([(parse_iccs("h2e2"), 2), (parse_iccs("b2e2"), 1)])
+        # 不随机时选权重最高的走法
+        assert book.choose(start, randomize=False) == parse_iccs("h2e2")
+        # 随机选择只会选到收录的走法
+        rng = random.Random(1)
+        assert {book.choose(start, rng=rng) for _ in range(50)} == {parse_iccs("h2e2"), parse_iccs("b2e2")}
+
+        start.make_move(parse_iccs("h2e2"))
+        assert book.probe(start.key) == [(parse_iccs("h9g7"), 2)]
+    finally:
+        book.close()
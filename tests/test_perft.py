@@ -0,0 +1,28 @@
+"""perft节点数回归测试：PERFT_SUITE中每个局面×深度对照已知节点数，深度4标记为slow"""
+import pytest
+
+from chess_rules import Position, Rules
+from perft import PERFT_SUITE, perft
+
+FAST_DEPTH = 3
+
+CASES = [
+    pytest.param(fen, depth, expected, id=f"{fen.split()[0]}-d{depth}",
+                 marks=[pytest.mark.slow] if depth > FAST_DEPTH else [])
+    for fen, expected_counts in PERFT_SUITE
+    for depth, expected in enumerate(expected_counts, 1)
+]
+
+
+@pytest.mark.parametrize("fen,depth,expected", CASES)
+def test_perft(fen, depth, expected):
+    rules = Rules(Position.from_fen(fen))
+    assert perft(rules, depth) == expected
+
+
+def test_perft_restores_position():
+    position = Position.from_fen(PERFT_SUITE[1][0])
+    fen, key = position.to_fen(), position.key
+    perft(Rules(position), 3)
+    assert position.to_fen() == fen
+    assert position.key == key
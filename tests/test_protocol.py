@@ -0,0 +1,111 @@
+"""联机协议测试：增量解码和各类消息的编解码"""
+import asyncio
+
+import pytest
+
+import network
+import protocol
+from chess_rules import Position, coords_to_move
+
+
+def test_decoder_handles_arbitrary_segmentation():
+    messages = [
+        (protocol.MSG_HELLO, 0, protocol.encode_hello()),
+        (protocol.MSG_MOVE, 1, protocol.encode_move(coords_to_move(7, 7, 7, 4))),
+        (protocol.MSG_RESIGN, 0, b""),
+        (protocol.MSG_SYNC, 0, protocol.encode_moves(list(range(300)))),
+    ]
+    data = protocol.encode_batch(messages)
+    assert data == b"".join(protocol.encode(msg_type, seq, payload) for msg_type, seq, payload in messages)
+
+    # 逐字节喂入
+    decoder = protocol.Decoder()
+    received = []
+    for index in range(len(data)):
+        received += decoder.feed(data[index:index + 1])
+    assert received == messages
+    assert not decoder.buffer
+
+    # 多帧粘在一起一次喂入，末尾跟着半帧
+    decoder = protocol.Decoder()
+    assert decoder.feed(data + data[:5]) == messages
+    assert decoder.feed(data[5:]) == messages
+
+
+def test_decoder_rejects_unknown_type():
+    decoder = protocol.Decoder()
+    with pytest.raises(protocol.ProtocolError):
+        decoder.feed(protocol.HEADER.pack(0, 0xEE, 0))
+
+
+def test_encode_rejects_oversized_payload():
+    payload = b"\0" * (protocol.MAX_PAYLOAD + 1)
+    with pytest.raises(protocol.ProtocolError):
+        protocol.encode(protocol.MSG_SYNC, 0, payload)
+    with pytest.raises(protocol.ProtocolError):
+        protocol.encode_batch([(protocol.MSG_SYNC, 0, payload)])
+    # 正好MAX_PAYLOAD字节的负载可以编码和解码
+    frame = protocol.encode(protocol.MSG_PING, 0, payload[:-1])
+    assert protocol.Decoder().feed(frame) == [(protocol.MSG_PING, 0, payload[:-1])]
+
+
+def test_round_trip_every_message():
+    token = bytes(range(protocol.TOKEN_SIZE))
+    position = Position()
+    moves = [coords_to_move(7, 1, 7, 4), coords_to_move(0, 1, 2, 2)]
+    for move in moves:
+        position.make_move(move)
+
+    assert protocol.decode_hello(protocol.encode_hello()) == protocol.PROTOCOL_VERSION
+    assert protocol.decode_move(protocol.encode_move(moves[0])) == moves[0]
+    assert protocol.decode_flag(protocol.encode_flag(True)) is True
+    assert protocol.decode_flag(protocol.encode_flag(False)) is False
+    assert protocol.decode_start(protocol.encode_start(7, "black", token)) == (7, "black", token)
+    assert protocol.decode_resume(protocol.encode_resume(token, 2, position.key)) == (token, 2, position.key)
+    assert protocol.decode_game_over(protocol.encode_game_over(protocol.RESULT_RED, protocol.REASON_MATE)) == (
+        protocol.RESULT_RED, protocol.REASON_MATE)
+    assert protocol.decode_watch(protocol.encode_watch(0)) == 0
+    fen = position.to_fen()
+    assert protocol.decode_snapshot(protocol.encode_snapshot(3, fen, moves)) == (3, fen, moves)
+    rooms = [(1, 12, 0), (2, 0, 5), (0xFFFFFFFF, 0xFFFF, 0xFFFF)]
+    assert protocol.decode_room_list(protocol.encode_room_list(rooms)) == rooms
+    assert protocol.decode_moves(protocol.encode_moves(moves)) == moves
+    assert protocol.decode_moves(b"") == []
+
+
+def test_malformed_payloads():
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_move(b"\0")
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_start(protocol.START.pack(1, 2, b"\0" * protocol.TOKEN_SIZE))
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_snapshot(protocol.SNAPSHOT.pack(1, 10) + b"abc")
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_room_list(b"\0" * (protocol.ROOM_ENTRY.size + 1))
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_moves(b"\0\0\0")
+
+
+def test_hello_version_mismatch_closes_connection():
+    async def run():
+        result = asyncio.get_event_loop().create_future()
+
+        async def handle(reader, writer):
+            connection = network.Connection(reader, writer)
+            result.set_result(await connection.serve(lambda: None, lambda *message: None))
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(protocol.encode(protocol.MSG_HELLO, 0, protocol.encode_hello(protocol.PROTOCOL_VERSION - 1)))
+        reason = await asyncio.wait_for(result, 5)
+        # 服务端先发出自己的HELLO，随后关闭连接
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return reason, protocol.Decoder().feed(data)
+
+    reason, frames = asyncio.run(run())
+    assert "协议版本不一致" in reason
+    assert frames == [(protocol.MSG_HELLO, 0, protocol.encode_hello())]
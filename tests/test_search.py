@@ -0,0 +1,68 @@
+"""搜索引擎测试：循环局面按长将规则给分，残局库只在少子局面查询"""
+from chess_rules import Position, Rules, coords_to_move
+from chess_search import Searcher
+from tablebase import DEFAULT_TABLEBASE_DIR, Tablebases
+
+# 黑方多两个车，红车在第5行左右横移对黑将步步将军，黑将在(0,4)和(0,3)之间来回躲
+PERPETUAL_FEN = "4k4/9/r7r/9/9/4R4/9/9/9/5K3 b"
+PERPETUAL_MOVES = [
+    (0, 4, 0, 3), (5, 4, 5, 3), (0, 3, 0, 4), (5, 3, 5, 4),
+    (0, 4, 0, 3), (5, 4, 5, 3), (0, 3, 0, 4),
+]
+
+
+def play(position, moves):
+    for move in moves:
+        position.move_piece(*move)
+        position.switch_player()
+
+
+def test_search_avoids_losing_perpetual_check():
+    position = Position.from_fen(PERPETUAL_FEN)
+    play(position, PERPETUAL_MOVES)
+    repeat = coords_to_move(5, 3, 5, 4)
+
+    # 再将一次就形成长将，按规则红方判负
+    rules = Rules(position.copy())
+    play(rules.position, [(5, 3, 5, 4)])
+    assert rules.adjudicate_repetition() == "black"
+
+    # 子力落后的红方不能把长将当作和棋
+    move, score, _ = Searcher(tt_size_mb=1).search(position, max_depth=3)
+    assert move != repeat
+
+
+def test_search_scores_neutral_repetition_as_draw():
+    # 双方都只是来回走子（没有将军）的循环按和棋处理
+    position = Position.from_fen("3k5/9/9/9/9/9/9/9/9/R3K4 w")
+    play(position, [(9, 0, 8, 0), (0, 3, 1, 3), (8, 0, 9, 0), (1, 3, 0, 3), (9, 0, 8, 0), (0, 3, 1, 3)])
+    searcher = Searcher(tt_size_mb=1)
+    searcher.search(position, max_depth=1)
+    position = searcher.position
+    position.make_move(coords_to_move(8, 0, 9, 0))
+    assert searcher._cycle_score(position.key, 1) == 0
+
+
+class CountingTablebases(Tablebases):
+    """记录查询次数的残局库"""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.probes = 0
+
+    def probe(self, position):
+        self.probes += 1
+        return super().probe(position)
+
+
+def test_search_skips_tablebase_probes_with_many_pieces():
+    tablebases = CountingTablebases(DEFAULT_TABLEBASE_DIR)
+    assert tablebases.available
+
+    # 开局局面子数远多于残局库，搜索树中不查询
+    Searcher(tt_size_mb=1, tablebases=tablebases).search(Position(), max_depth=2)
+    assert tablebases.probes == 0
+
+    # 车帅对将：子数在残局库范围内，照常查询
+    Searcher(tt_size_mb=1, tablebases=tablebases).search(Position.from_fen("3k5/9/9/9/9/9/9/9/9/R3K4 w"), max_depth=2)
+    assert tablebases.probes > 0
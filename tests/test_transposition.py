@@ -0,0 +1,65 @@
+"""置换表测试：存取、键校验和按深度/搜索代数替换"""
+from chess_search import EXACT, LOWER_BOUND, UPPER_BOUND, MATE_SCORE, TranspositionTable
+
+
+def make_table():
+    table = TranspositionTable(size_mb=1)
+    table.new_search()
+    return table
+
+
+def test_store_and_probe_round_trip():
+    table = make_table()
+    key = 0x123456789ABCDEF0
+    table.store(key, 0x1234, -357, 7, LOWER_BOUND)
+    assert table.probe(key) == (0x1234, -357, 7, LOWER_BOUND)
+
+    table.store(key + 1, 0x0102, MATE_SCORE - 5, 2, EXACT)
+    assert table.probe(key + 1) == (0x0102, MATE_SCORE - 5, 2, EXACT)
+
+
+def test_probe_rejects_other_keys_in_same_slot():
+    table = make_table()
+    key = 0x0F0F0F0F00000001
+    table.store(key, 0x0203, 10, 3, EXACT)
+    # 同一个槽位（低位相同）的其他局面不能读到这个条目
+    assert table.probe(key ^ (1 << 60)) is None
+
+
+def test_same_generation_keeps_deeper_entry():
+    table = make_table()
+    key = 0x1000
+    other = key + table.size  # 同一槽位的另一个局面
+    table.store(key, 0x0304, 50, 6, EXACT)
+    table.store(other, 0x0506, 20, 3, EXACT)
+    assert table.probe(key) == (0x0304, 50, 6, EXACT)
+    assert table.probe(other) is None
+
+    table.store(other, 0x0506, 20, 6, EXACT)
+    assert table.probe(other) == (0x0506, 20, 6, EXACT)
+    assert table.probe(key) is None
+
+
+def test_older_generation_is_replaced():
+    table = make_table()
+    key = 0x2000
+    other = key + table.size
+    table.store(key, 0x0304, 50, 10, EXACT)
+    table.new_search()
+    table.store(other, 0x0506, 20, 1, UPPER_BOUND)
+    assert table.probe(other) == (0x0506, 20, 1, UPPER_BOUND)
+
+
+def test_same_position_without_move_keeps_best_move():
+    table = make_table()
+    key = 0x3000
+    table.store(key, 0x0708, 30, 4, EXACT)
+    table.store(key, 0, -10, 5, UPPER_BOUND)
+    assert table.probe(key) == (0x0708, -10, 5, UPPER_BOUND)
+
+
+def test_clear_empties_table():
+    table = make_table()
+    table.store(0x4000, 0x0102, 1, 1, EXACT)
+    table.clear()
+    assert table.probe(0x4000) is None